@@ -1,35 +1,88 @@
+from asgiref.sync import sync_to_async
+import asyncio
 from django.conf import settings
-from django.http import HttpResponse
-
-class CanadaBilingualMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-        # One-time configuration and initialization.
-        self.path_toggle = settings.SEARCH_LANG_USE_PATH
-        self.EN_HOST = ''
-        self.FR_HOST = ''
-        if not self.path_toggle:
-            self.EN_HOST = settings.SEARCH_EN_HOSTNAME
-            self.FR_HOST = settings.SEARCH_FR_HOSTNAME
-
-    def __call__(self, request):
-        # Code to be executed for each request before
-        # the view (and later middleware) are called.
-
-        if self.path_toggle:
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+from search.registry import get_configuration
+from search.timing import get_histograms, start_timer, stop_timer
+
+# The middleware are written as functions that return a sync or an async middleware to match get_response, which is
+# how Django documents middleware that supports both WSGI and ASGI. They keep the names used in the MIDDLEWARE setting.
+
+
+@sync_and_async_middleware
+def CanadaBilingualMiddleware(get_response):
+    # One-time configuration and initialization.
+    path_toggle = settings.SEARCH_LANG_USE_PATH
+    fr_host = '' if path_toggle else settings.SEARCH_FR_HOSTNAME
+
+    def set_language(request):
+        if path_toggle:
             subpaths = request.path.split('/')
             if 'fr' in subpaths:
                 request.LANGUAGE_CODE = 'fr'
             else:
                 request.LANGUAGE_CODE = 'en'
         else:
-            if request.get_host() == self.FR_HOST:
+            if request.get_host() == fr_host:
                 request.LANGUAGE_CODE = 'fr'
             else:
                 request.LANGUAGE_CODE = 'en'
-        response = self.get_response(request)
 
-        # Code to be executed for each request/response after
-        # the view is called.
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            set_language(request)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            # Code to be executed for each request before
+            # the view (and later middleware) are called.
+            set_language(request)
+            return get_response(request)
+
+    return middleware
+
+
+def process_timing(request, response, timer):
+    response['Server-Timing'] = timer.header()
+
+    match = request.resolver_match
+    if match is not None:
+        # Only label known searches, so that made up URLs cannot create new metrics
+        search_type = match.kwargs.get('search_type', '')
+        if search_type not in get_configuration().searches:
+            search_type = ''
+        get_histograms().observe(search_type, match.url_name or '', timer.durations)
+    return response
+
+
+@sync_and_async_middleware
+def ServerTimingMiddleware(get_response):
+    """
+    Time each request and its phases, send the timings in a Server-Timing header and add them to the metrics.
+    Only installed when SERVER_TIMING_ENABLED is set.
+    """
+    if not settings.SERVER_TIMING_ENABLED:
+        raise MiddlewareNotUsed()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            timer = start_timer()
+            try:
+                response = await get_response(request)
+            finally:
+                stop_timer()
+            timer.finish()
+            # get_configuration() may reload the searches from the database, which cannot be done in the event loop
+            return await sync_to_async(process_timing)(request, response, timer)
+    else:
+        def middleware(request):
+            timer = start_timer()
+            try:
+                response = get_response(request)
+            finally:
+                stop_timer()
+            timer.finish()
+            return process_timing(request, response, timer)
 
-        return response
\ No newline at end of file
+    return middleware
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'oc_search.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -151,10 +152,122 @@ LOCALE_PATHS = [
 EXPORT_FILE_CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 EXPORT_FILE_CACHE_URL = ""
 
+# Cached export files are reused for EXPORT_FILE_CACHE_TIMEOUT seconds. When the cache directory grows beyond
+# EXPORT_FILE_CACHE_MAX_BYTES, the least recently downloaded files are removed. The cache is swept by the
+# sweep_export_cache command, and by each worker process at most once every EXPORT_FILE_CACHE_SWEEP_INTERVAL seconds.
+# The full exports (see EXPORT_FULL_ON_IMPORT) count towards EXPORT_FILE_CACHE_MAX_BYTES but are never removed by the
+# sweep, so allow for them when setting the limit.
+
+EXPORT_FILE_CACHE_TIMEOUT = 600
+EXPORT_FILE_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+EXPORT_FILE_CACHE_SWEEP_INTERVAL = 300
+
+# Directory for the similar records files written by the build_mlt_neighbours command. import_data_csv removes the
+# file of a search after each load, and runs build_mlt_neighbours for searches with More Like This enabled when
+# MLT_BUILD_ON_IMPORT is set.
+
+MLT_STORE_DIR = os.path.join(BASE_DIR, 'cache', 'mlt')
+MLT_BUILD_ON_IMPORT = True
+
+# Directory for the manifests that the import_data_csv --delta option uses to find new, changed and removed records
+
+IMPORT_MANIFEST_DIR = os.path.join(BASE_DIR, 'cache', 'manifests')
+
+# When enabled, exported search results are streamed from Solr to the client row by row instead of being loaded into
+# memory first. Streamed exports are not limited to 100,000 rows. Searches whose plugin has a post_export_solr_query
+# hook are always exported in memory, because the hook needs the whole Solr response.
+
+EXPORT_STREAMING = True
+
+# When enabled, exports that are not in the file cache are run by a pool of EXPORT_JOB_WORKERS background threads
+# in each worker process. The user sees a page that reloads every EXPORT_JOB_POLL_INTERVAL seconds until the file is
+# ready. A job that has not finished after EXPORT_JOB_TIMEOUT seconds is considered dead and can be restarted.
+# Under uWSGI, the enable-threads option must be set. Like streaming, this is not used for searches whose plugin has a
+# post_export_solr_query hook.
+
+EXPORT_ASYNC = False
+EXPORT_JOB_WORKERS = 2
+EXPORT_JOB_TIMEOUT = 3600
+EXPORT_JOB_POLL_INTERVAL = 5
+
+# When enabled, import_data_csv runs the build_full_exports command after each successful load. It exports every
+# record of the search in each language to a gzip compressed file in EXPORT_FILE_CACHE_DIR, and exports without any
+# search terms or filters are then served from that file instead of Solr. These files are always served by Django, not
+# from EXPORT_FILE_CACHE_URL, compressed to the clients that accept gzip. Searches whose plugin has a
+# post_export_solr_query hook are not pre-built.
+
+EXPORT_FULL_ON_IMPORT = True
+
+# Directory for the small version stamp files that tell every worker process when the search configuration
+# in the database has changed and needs to be reloaded.
+
+SEARCH_VERSION_STAMP_DIR = os.path.join(BASE_DIR, 'cache', 'versions')
+
+# Search results cache. Results are cached in each worker process for SEARCH_RESULT_CACHE_TIMEOUT seconds, up to
+# SEARCH_RESULT_CACHE_MAX_ENTRIES results. Set the timeout to 0 to disable the cache. To also share the results between
+# worker processes, set SEARCH_RESULT_CACHE_ALIAS to the name of one of the CACHES below, for example a Redis cache.
+# Cached results are invalidated by a version stamp when data is imported, so in a multi-server deployment
+# the SEARCH_VERSION_STAMP_DIR directory should be on shared storage.
+# The facet counts of a search are cached in the same way, and reused for every page and sort order of the search.
+
+SEARCH_RESULT_CACHE_TIMEOUT = 300
+SEARCH_RESULT_CACHE_MAX_ENTRIES = 1000
+SEARCH_RESULT_CACHE_ALIAS = ''
+
+# Deep paging. Search pages are fetched with a Solr cursor when the cursor of the page is known, and the cursor of the
+# next page is kept in the search results cache above, so following the next page links stays quick at any depth.
+# Beyond page SEARCH_CURSOR_PAGING_DEPTH, the pagination only links to the previous and next pages. Set it to 0 to
+# turn cursors off.
+
+SEARCH_CURSOR_PAGING_DEPTH = 50
+
+# Request timing. When enabled, the time spent in each phase of a search request is sent in a Server-Timing header
+# and added to histograms with the SERVER_TIMING_BUCKETS upper bounds in seconds. The histograms are published in the
+# Prometheus text format at search/metrics to clients from the METRICS_ALLOWED_IPS addresses. Each worker process
+# keeps its own histograms.
+
+SERVER_TIMING_ENABLED = False
+SERVER_TIMING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
 # Solr Search Configuration
 
 SOLR_SERVER_URL = 'http://localhost:8983/solr'
 
+# Solr connection pool. Each worker process keeps up to SOLR_POOL_SIZE keep-alive connections per Solr server.
+# SOLR_TIMEOUT is the default request timeout in seconds, either a single value or a (connect, read) tuple, and
+# SOLR_CORE_TIMEOUTS can override it for individual cores, e.g. {'core_ati': 60}. Failed connections and 502, 503
+# and 504 responses are retried up to SOLR_RETRIES times with an exponential backoff of SOLR_RETRY_BACKOFF seconds.
+
+SOLR_POOL_SIZE = 10
+SOLR_KEEP_ALIVE = True
+SOLR_TIMEOUT = (5, 60)
+SOLR_CORE_TIMEOUTS = {}
+SOLR_RETRIES = 3
+SOLR_RETRY_BACKOFF = 0.5
+
+# When the site is served by an ASGI server (oc_search/asgi.py), SEARCH_ASYNC_VIEWS selects the asynchronous search,
+# record, similar records, export and RAMP views, which wait for Solr without holding a thread. Their Solr client keeps
+# up to SOLR_ASYNC_POOL_SIZE connections per Solr server in each worker process. Leave this off under uWSGI.
+
+SEARCH_ASYNC_VIEWS = False
+SOLR_ASYNC_POOL_SIZE = 20
+
+# The RAMP map pages keep the titles of up to RAMP_TITLE_CACHE_MAX_ENTRIES Open Data datasets in memory for
+# RAMP_TITLE_CACHE_TIMEOUT seconds.
+
+RAMP_TITLE_CACHE_MAX_ENTRIES = 2000
+RAMP_TITLE_CACHE_TIMEOUT = 3600
+
+# import_data_csv --swap loads a search into a new core named after the live core with SOLR_SHADOW_CORE_SUFFIX, created
+# from the SOLR_SHADOW_CONFIG_SET config set in its own instance directory, and swaps it with the live core. The swap
+# is refused when the new core has more than SOLR_SWAP_MAX_SHRINK (a fraction) fewer documents than the live core.
+# Searches with Nothing To Report fields cannot use --swap, because the new core is only loaded from the default CSV.
+
+SOLR_SHADOW_CORE_SUFFIX = '_shadow'
+SOLR_SHADOW_CONFIG_SET = '_default'
+SOLR_SWAP_MAX_SHRINK = 0.1
+
 SOLR_COLLECTION = "SolrClient_unittest"
 
 # Application URL
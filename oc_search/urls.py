@@ -17,9 +17,15 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.conf.urls import include
-from search.views import SearchView, RecordView, ExportView, MoreLikeThisView, HomeView, DefaultView
+from search.views import SearchView, RecordView, ExportView, ExportStatusView, MoreLikeThisView, HomeView, DefaultView, \
+    MetricsView
 from ramp.views import RampView
 
+if settings.SEARCH_ASYNC_VIEWS:
+    from search.async_views import AsyncSearchView as SearchView, AsyncRecordView as RecordView, \
+        AsyncExportView as ExportView, AsyncMoreLikeThisView as MoreLikeThisView
+    from ramp.async_views import AsyncRampView as RampView
+
 
 urlpatterns = [
     path('search/admin/doc/', include('django.contrib.admindocs.urls')),
@@ -30,11 +36,14 @@ if settings.SEARCH_LANG_USE_PATH:
     urlpatterns += [
         path('', DefaultView.as_view(), name="HomePage"),
         path('search/', DefaultView.as_view(), name="HomePage"),
+        path('search/metrics', MetricsView.as_view(), name="Metrics"),
         path('search/<str:lang>/', HomeView.as_view(), name="HomePage"),
         path('search/<str:lang>/<str:search_type>/', SearchView.as_view(), name="SearchForm"),
         path('rechercher/<str:lang>/<str:search_type>/', SearchView.as_view(), name="SearchForm"),
         path('search/<str:lang>/<str:search_type>/record/<str:record_id>', RecordView.as_view(), name='RecordForm'),
         path('search/<str:lang>/<str:search_type>/export/', ExportView.as_view(), name='ExportForm'),
+        path('search/<str:lang>/<str:search_type>/export/status/<str:job_id>', ExportStatusView.as_view(),
+             name='ExportStatus'),
         path('search/<str:lang>/<str:search_type>/similar/<str:record_id>', MoreLikeThisView.as_view(), name='MLTForm'),
         path('search/<str:lang>/<str:search_type>/similaire/<str:record_id>', MoreLikeThisView.as_view(), name='MLTForm'),
     ]
@@ -48,12 +57,15 @@ if settings.SEARCH_LANG_USE_PATH:
 else:
     urlpatterns += [
         path(settings.SEARCH_HOST_PATH, DefaultView.as_view(), name="HomePage"),
+        path(settings.SEARCH_HOST_PATH + 'metrics', MetricsView.as_view(), name="Metrics"),
         path(settings.SEARCH_HOST_PATH + '<str:search_type>/', SearchView.as_view(), name="SearchForm"),
         path(settings.SEARCH_HOST_PATH + 'record/<str:search_type>/<str:record_id>', RecordView.as_view(),
              name='RecordForm'),
         path(settings.SEARCH_HOST_PATH + '<str:search_type>/record/<str:record_id>', RecordView.as_view(),
              name='RecordForm'),
         path(settings.SEARCH_HOST_PATH + '<str:search_type>/export/', ExportView.as_view(), name='RecordForm'),
+        path(settings.SEARCH_HOST_PATH + '<str:search_type>/export/status/<str:job_id>', ExportStatusView.as_view(),
+             name='ExportStatus'),
         path(settings.SEARCH_HOST_PATH + '<str:search_type>/similar/<str:record_id>', MoreLikeThisView.as_view(),
              name='MLTForm'),
         path(settings.SEARCH_HOST_PATH + '<str:search_type>/similaire/<str:record_id>', MoreLikeThisView.as_view(),
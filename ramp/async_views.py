@@ -0,0 +1,20 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest
+from ramp.titles import get_title_resolver, valid_uuids
+from ramp.views import RampView
+from search.async_solr import get_async_solr_client
+from search.async_views import AsyncViewMixin
+
+
+class AsyncRampView(AsyncViewMixin, RampView):
+
+    async def get(self, request: HttpRequest, lang='en', keys=''):
+        lang = request.LANGUAGE_CODE
+        uuids = valid_uuids(keys)
+
+        # Get the titles
+
+        solr = get_async_solr_client(settings.OPEN_DATA_SOLR_SERVER_URL)
+        titles = await get_title_resolver().async_resolve(solr, uuids)
+        return await sync_to_async(self.ramp_response)(request, lang, uuids, titles)
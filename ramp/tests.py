@@ -1,3 +1,122 @@
-from django.test import TestCase
+import asyncio
+from django.test import TestCase, modify_settings, override_settings
+from django.urls import path
+from search.async_solr import async_connection_manager
+from search.loadtest.fake_solr import FakeSolr
+from types import SimpleNamespace
+import zlib
+from .async_views import AsyncRampView
+from .titles import TitleResolver, get_title_resolver, valid_uuids
 
-# Create your tests here.
+DATASET_A = '0a1b2c3d-4e5f-6789-abcd-ef0123456789'
+DATASET_B = '11111111-2222-3333-4444-555555555555'
+DELETED = '99999999-8888-7777-6666-555555555555'
+
+DATASETS = {
+    DATASET_A: {'id': DATASET_A, 'title_en_s': 'Dataset A', 'title_fr_s': 'Jeu de données A'},
+    DATASET_B: {'id': DATASET_B, 'title_en_s': 'Dataset B', 'title_fr_s': 'Jeu de données B'},
+}
+
+
+class StubSolr:
+    """
+    Answers the terms filter queries of TitleResolver from DATASETS
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, core_name: str, query: dict):
+        self.queries.append((core_name, query))
+        ids = query['fq'][len('{!terms f=id}'):].split(',')
+        return SimpleNamespace(docs=[DATASETS[i] for i in ids if i in DATASETS])
+
+
+class AsyncStubSolr(StubSolr):
+
+    async def query(self, core_name: str, query: dict):
+        return super().query(core_name, query)
+
+
+@override_settings(OPEN_DATA_CORE='core_od')
+class TitleResolverTestCase(TestCase):
+
+    def test_valid_uuids(self):
+        keys = ','.join([DATASET_A, 'not-a-uuid', DATASET_B.upper(), DATASET_A + 'x', '*:*', ''])
+        self.assertEqual(valid_uuids(keys), [DATASET_A, DATASET_B.upper()])
+        self.assertEqual(valid_uuids('id:{0} OR *:*'.format(DATASET_A)), [])
+
+    def test_resolve(self):
+        resolver = TitleResolver(max_entries=10, timeout=60)
+        solr = StubSolr()
+        titles = resolver.resolve(solr, [DATASET_A, DELETED, DATASET_A])
+        self.assertEqual(titles, {DATASET_A: ('Dataset A', 'Jeu de données A'), DELETED: ('', '')})
+        # One query for all of the missing datasets
+        self.assertEqual(solr.queries, [('core_od', {'q': '*:*', 'fq': '{!terms f=id}' + DATASET_A + ',' + DELETED,
+                                                     'fl': 'id,title_en_s,title_fr_s', 'rows': 2})])
+
+        # The dataset that was not found is cached too, so only the new dataset is looked up
+        cached, missing = resolver.cached_titles([DELETED, DATASET_B, DATASET_A])
+        self.assertEqual(set(cached), {DELETED, DATASET_A})
+        self.assertEqual(missing, [DATASET_B])
+        titles = resolver.resolve(solr, [DELETED, DATASET_B, DATASET_A])
+        self.assertEqual(titles[DATASET_B], ('Dataset B', 'Jeu de données B'))
+        self.assertEqual(len(solr.queries), 2)
+        self.assertEqual(solr.queries[1][1]['fq'], '{!terms f=id}' + DATASET_B)
+
+        resolver.resolve(solr, [DATASET_A, DATASET_B, DELETED])
+        self.assertEqual(len(solr.queries), 2)
+        resolver.clear()
+        resolver.resolve(solr, [DATASET_A])
+        self.assertEqual(len(solr.queries), 3)
+
+    def test_async_resolve(self):
+        resolver = TitleResolver(max_entries=10, timeout=60)
+        solr = AsyncStubSolr()
+        titles = asyncio.run(resolver.async_resolve(solr, [DATASET_B, DELETED]))
+        self.assertEqual(titles, {DATASET_B: ('Dataset B', 'Jeu de données B'), DELETED: ('', '')})
+        self.assertEqual(asyncio.run(resolver.async_resolve(solr, [DELETED])), {DELETED: ('', '')})
+        self.assertEqual(len(solr.queries), 1)
+
+
+urlpatterns = [
+    path('openmap/<str:lang>/<str:keys>', AsyncRampView.as_view()),
+]
+
+
+@modify_settings(INSTALLED_APPS={'append': 'ramp'})
+@override_settings(ROOT_URLCONF=__name__, OPEN_DATA_CORE='core_od', OPEN_DATA_BASE_URL_EN='https://open.test/dataset/')
+class AsyncRampViewTestCase(TestCase):
+
+    def setUp(self):
+        self.fake_solr = FakeSolr({}).start()
+        self.settings = override_settings(OPEN_DATA_SOLR_SERVER_URL=self.fake_solr.url)
+        self.settings.enable()
+        get_title_resolver().clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.fake_solr.stop()
+        get_title_resolver().clear()
+
+    async def test_map_page(self):
+        queries = []
+        select_response = self.fake_solr.select_response
+
+        def spy(core_name, params):
+            queries.append((core_name, params))
+            return select_response(core_name, params)
+
+        self.fake_solr.select_response = spy
+        try:
+            response = await self.async_client.get('/openmap/en/{0},not-a-uuid,{1}'.format(DATASET_A, DATASET_B))
+        finally:
+            await async_connection_manager.close()
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode('utf8')
+        for uuid in (DATASET_A, DATASET_B):
+            self.assertIn('<a href="https://open.test/dataset/{0}">title_en_s {1}</a>'.format(
+                uuid, zlib.crc32(uuid.encode('utf8'))), content)
+        self.assertIn("let keys = '{0},{1}';".format(DATASET_A, DATASET_B), content)
+        self.assertEqual([(core_name, params['fq']) for core_name, params in queries],
+                         [('core_od', ['{!terms f=id}' + DATASET_A + ',' + DATASET_B])])
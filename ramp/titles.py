@@ -0,0 +1,96 @@
+"""
+Dataset titles for the RAMP map pages.
+
+A map page shows the title of each Open Data dataset on the map. The pages are embedded on many sites and keep loading
+the same few datasets, so the titles are kept in an in-process LRU cache with a time-to-live, and only the datasets
+that are not in the cache are looked up in the Open Data core, all at once with a terms filter. Both titles are
+cached, so the English and French pages share the cache. Datasets that are not found are cached as well, with empty
+titles, so that a map of a deleted dataset does not query Solr on every load.
+"""
+from django.conf import settings
+import re
+from search.result_cache import LocalCache
+from SolrClient import SolrResponse
+import threading
+
+UUID_PATTERN = re.compile('[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$', re.IGNORECASE)
+
+TITLE_FIELDS = ('title_en_s', 'title_fr_s')
+
+
+def valid_uuids(keys: str):
+    """
+    The dataset IDs in a comma separated list of keys, without the keys that are not UUIDs
+    """
+    return [uuid for uuid in keys.split(',') if UUID_PATTERN.match(uuid)]
+
+
+class TitleResolver:
+
+    def __init__(self, max_entries: int, timeout: int):
+        self.cache = LocalCache(max_entries, timeout)
+
+    def cached_titles(self, uuids: list):
+        """
+        :return: the cached (title_en, title_fr) of each dataset, and the IDs of the datasets that are not cached
+        """
+        titles = {}
+        missing = []
+        for uuid in dict.fromkeys(uuids):
+            cached = self.cache.get(uuid)
+            if cached is None:
+                missing.append(uuid)
+            else:
+                titles[uuid] = cached
+        return titles, missing
+
+    def title_query(self, uuids: list):
+        return {'q': '*:*', 'fq': '{!terms f=id}' + ','.join(uuids), 'fl': 'id,' + ','.join(TITLE_FIELDS),
+                'rows': len(uuids)}
+
+    def add_titles(self, titles: dict, missing: list, solr_response: SolrResponse):
+        found = {}
+        for doc in solr_response.docs:
+            found[doc['id']] = tuple(doc.get(field, '') for field in TITLE_FIELDS)
+        for uuid in missing:
+            titles[uuid] = found.get(uuid, ('', ''))
+            self.cache.set(uuid, titles[uuid])
+        return titles
+
+    def resolve(self, solr, uuids: list):
+        """
+        :param solr: the SolrClient of the Open Data Solr server
+        :return: the (title_en, title_fr) of each dataset
+        """
+        titles, missing = self.cached_titles(uuids)
+        if missing:
+            solr_response = solr.query(settings.OPEN_DATA_CORE, self.title_query(missing))
+            self.add_titles(titles, missing, solr_response)
+        return titles
+
+    async def async_resolve(self, solr, uuids: list):
+        """
+        resolve() for the async views.
+        :param solr: an AsyncSolrClient
+        """
+        titles, missing = self.cached_titles(uuids)
+        if missing:
+            solr_response = await solr.query(settings.OPEN_DATA_CORE, self.title_query(missing))
+            self.add_titles(titles, missing, solr_response)
+        return titles
+
+    def clear(self):
+        self.cache.clear()
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_title_resolver():
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = TitleResolver(settings.RAMP_TITLE_CACHE_MAX_ENTRIES, settings.RAMP_TITLE_CACHE_TIMEOUT)
+    return _resolver
@@ -3,9 +3,8 @@ from django.conf import settings
 from django.http import HttpRequest
 from django.views.generic import View
 from django.shortcuts import render
-import re
-from SolrClient import SolrClient, SolrResponse
-from SolrClient.exceptions import ConnectionError, SolrError
+from ramp.titles import get_title_resolver, valid_uuids
+from search.solr_connections import get_solr_client
 
 
 class RampView(View):
@@ -13,39 +12,26 @@ class RampView(View):
     def __init__(self):
         super().__init__()
 
-    def uuid_pattern(self):
-        return re.compile(
-            (
-                    '[a-f0-9]{8}-' +
-                    '[a-f0-9]{4}-' +
-                    '[a-f0-9]{4}-' +
-                    '[a-f0-9]{4}-' +
-                    '[a-f0-9]{12}$'
-            ),
-            re.IGNORECASE
-        )
-
     def get(self, request: HttpRequest, lang='en', keys=''):
         lang = request.LANGUAGE_CODE
-        uuid_regex = self.uuid_pattern()
-        uuids = keys.split(',')
-        valid_uuids = []
-        for uuid in uuids:
-            if uuid_regex.match(uuid):
-                valid_uuids.append(uuid)
-        keys = ",".join(valid_uuids)
+        uuids = valid_uuids(keys)
 
         # Get the titles
 
-        solr = SolrClient(settings.OPEN_DATA_SOLR_SERVER_URL)
-        q_text = " OR id:".join(valid_uuids)
-        q_text = "id:" + q_text
-        solr_query = {'q': q_text, 'defType': 'edismax', 'sow': True}
-        solr_response = solr.query(settings.OPEN_DATA_CORE, solr_query)
+        solr = get_solr_client(settings.OPEN_DATA_SOLR_SERVER_URL)
+        titles = get_title_resolver().resolve(solr, uuids)
+        return self.ramp_response(request, lang, uuids, titles)
+
+    def ramp_response(self, request: HttpRequest, lang: str, uuids: list, dataset_titles: dict):
+        """
+        :param dataset_titles: the (title_en, title_fr) of each dataset
+        """
+        keys = ",".join(uuids)
         titles = {}
-        title_field = 'title_fr_s' if lang == "fr" else 'title_en_s'
-        for doc in solr_response.docs:
-            titles[doc['id']] = doc[title_field]
+        for uuid, (title_en, title_fr) in dataset_titles.items():
+            title = title_fr if lang == "fr" else title_en
+            if title:
+                titles[uuid] = title
 
         context = {
             "language": lang,
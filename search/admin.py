@@ -2,6 +2,7 @@ from django.contrib import admin
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from .models import Search, Field, Code
+from .registry import invalidate_configuration
 
 # -- Searches ---
 
@@ -28,7 +29,9 @@ class SearchAdmin(ImportExportModelAdmin):
                                   'info_message_snippet', 'about_message_snippet', 'header_js_snippet',
                                   'header_css_snippet', 'body_js_snippet', 'search_item_snippet',
                                   'record_detail_snippet', 'record_breadcrumb_snippet')}),
-        ('More-like-this', {'fields': ('mlt_enabled', 'mlt_items')})
+        ('More-like-this', {'fields': ('mlt_enabled', 'mlt_items')}),
+        ('Highlighting', {'fields': ('highlight_method', 'highlight_snippets', 'highlight_max_fields',
+                                     'highlight_browse')}),
     )
 
     # -- Fields ---
@@ -44,6 +47,8 @@ class FieldResource(resources.ModelResource):
 
 def make_facet_field(modeladmn, request, queryset):
     queryset.update(is_search_facet=True)
+    # QuerySet.update() does not send the post_save signal
+    invalidate_configuration()
 
 
 make_facet_field.short_description = 'Mark selected fields as search facets'
@@ -51,6 +56,7 @@ make_facet_field.short_description = 'Mark selected fields as search facets'
 
 def clear_facet_field(modeladmn, request, queryset):
     queryset.update(is_search_facet=False)
+    invalidate_configuration()
 
 
 clear_facet_field.short_description = 'Clear selected fields as search facets'
@@ -58,6 +64,7 @@ clear_facet_field.short_description = 'Clear selected fields as search facets'
 
 def make_default_display_field(modeladmn, request, queryset):
     queryset.update(is_default_display=True)
+    invalidate_configuration()
 
 
 make_default_display_field.short_description = 'Mark selected fields for default search results'
@@ -65,6 +72,7 @@ make_default_display_field.short_description = 'Mark selected fields for default
 
 def clear_default_display_field(modeladmn, request, queryset):
     queryset.update(is_default_display=False)
+    invalidate_configuration()
 
 
 clear_default_display_field.short_description = 'Clear selected fields for default search results'
@@ -72,6 +80,7 @@ clear_default_display_field.short_description = 'Clear selected fields for defau
 
 def make_currency_field(modeladmn, request, queryset):
     queryset.update(solr_field_is_currency=True, solr_field_type='pfloat')
+    invalidate_configuration()
 
 
 make_currency_field.short_description = 'Mark selected fields as currency, float'
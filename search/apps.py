@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SearchConfig(AppConfig):
     name = 'search'
     verbose_name = "Open Canada Metadata Search Application"
+
+    def ready(self):
+        # Connect the model signal handlers that keep the search configuration registry current
+        import search.signals
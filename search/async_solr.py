@@ -0,0 +1,130 @@
+"""
+Asynchronous Solr client for the ASGI views.
+
+AsyncSolrClient sends the same requests as SolrClient.query, over a pooled httpx.AsyncClient, and returns the same
+SolrResponse, so the async views can hand the results to the existing plugins, parsing code and templates. The pool
+size, timeouts and retry policy follow the settings of the synchronous pool in solr_connections.py.
+
+An httpx client belongs to the event loop that opened its connections, so the clients are kept per event loop and per
+Solr server URL, and are discarded if the process forks.
+"""
+import asyncio
+from django.conf import settings
+import httpx
+import os
+from search.export import _form_params
+from SolrClient import SolrResponse
+from SolrClient.exceptions import ConnectionError, SolrError
+import threading
+from urllib.parse import urlsplit
+import weakref
+
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+def create_timeout(timeout):
+    """
+    Convert a SOLR_TIMEOUT value, either seconds or a (connect, read) tuple, to an httpx.Timeout.
+    """
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class AsyncSolrClient:
+
+    def __init__(self, server_url: str):
+        self.server_url = server_url.rstrip('/')
+        url = urlsplit(self.server_url)
+        auth = (url.username, url.password or '') if url.username else None
+        self.timeout = create_timeout(settings.SOLR_TIMEOUT)
+        self.core_timeouts = {core: create_timeout(t) for core, t in settings.SOLR_CORE_TIMEOUTS.items()}
+        self.client = httpx.AsyncClient(
+            auth=auth,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=settings.SOLR_ASYNC_POOL_SIZE,
+                                max_keepalive_connections=settings.SOLR_ASYNC_POOL_SIZE),
+            verify=False)
+
+    async def _post(self, url: str, data: dict, timeout):
+        retries = settings.SOLR_RETRIES
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.post(url, data=data, timeout=timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+            except httpx.TimeoutException as e:
+                if attempt >= retries:
+                    raise ConnectionError('TIMEOUT', str(e), e)
+            except httpx.TransportError as e:
+                if attempt >= retries:
+                    raise ConnectionError('N/A', str(e), e)
+            await asyncio.sleep(settings.SOLR_RETRY_BACKOFF * (2 ** attempt))
+            attempt += 1
+
+    async def query(self, core_name: str, solr_query: dict, request_handler='select'):
+        """
+        Query a Solr core, like SolrClient.query.
+        :return: a SolrResponse
+        :raises ConnectionError: if Solr cannot be reached
+        :raises SolrError: if Solr reports an error
+        """
+        url = '{0}/{1}/{2}'.format(self.server_url, core_name, request_handler)
+        response = await self._post(url, _form_params(solr_query), self.core_timeouts.get(core_name, self.timeout))
+
+        if response.status_code in (401, 404):
+            raise ConnectionError("{0} - {1}".format(response.status_code, response.url))
+        if response.status_code >= 300:
+            raise SolrError("{0} - {1} {2}".format(response.status_code, response.url, response.text))
+        res_dict = response.json()
+        if 'errors' in res_dict:
+            raise SolrError(", ".join(res_dict['errors'][0]['errorMessages']))
+        if 'error' in res_dict:
+            raise SolrError(str(res_dict['error']))
+        return SolrResponse(res_dict)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncSolrConnectionManager:
+    """
+    Holds one AsyncSolrClient per event loop and Solr server URL for the current process.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get_client(self, server_url: str):
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = weakref.WeakKeyDictionary()
+                self._pid = os.getpid()
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(server_url)
+            if client is None:
+                client = clients[server_url] = AsyncSolrClient(server_url)
+        return client
+
+    async def close(self):
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+        for client in clients.values():
+            await client.aclose()
+
+
+async_connection_manager = AsyncSolrConnectionManager()
+
+
+def get_async_solr_client(server_url=None):
+    """
+    Return the pooled AsyncSolrClient of the running event loop for a Solr server. Defaults to the SOLR_SERVER_URL
+    setting.
+    """
+    return async_connection_manager.get_client(server_url or settings.SOLR_SERVER_URL)
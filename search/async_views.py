@@ -0,0 +1,126 @@
+"""
+Asynchronous versions of the search views for the ASGI deployment.
+
+The async views reuse the page building code of the synchronous views, and only replace the Solr round trip: while a
+request waits for Solr, the event loop serves other requests instead of holding a worker thread. Building the query
+and rendering the page are CPU bound and may use the database, so they run in Django's thread for sync code with
+sync_to_async. The views are selected in urls.py when SEARCH_ASYNC_VIEWS is set.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest
+from django.shortcuts import render
+from functools import update_wrapper
+from search.async_solr import get_async_solr_client
+from search.mlt_store import neighbour_query, neighbour_response
+from search.result_cache import async_cached_solr_query
+from search.timing import current_timer
+from search.views import SearchView, RecordView, ExportView, MoreLikeThisView, get_error_context
+from SolrClient.exceptions import ConnectionError, SolrError
+
+
+class AsyncViewMixin:
+    """
+    Django 3.2 class-based views are always called as synchronous functions. This as_view() returns a coroutine
+    function instead, so the ASGI handler calls the view from the event loop. The view instance is created in a worker
+    thread, because loading the search configuration may query the database.
+    """
+
+    @classmethod
+    def as_view(cls):
+
+        async def view(request, *args, **kwargs):
+            self = await sync_to_async(cls)()
+            self.setup(request, *args, **kwargs)
+            response = self.dispatch(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        view.view_class = cls
+        view.view_initkwargs = {}
+        update_wrapper(view, cls, updated=())
+        update_wrapper(view, cls.dispatch, assigned=())
+        return view
+
+
+class AsyncSearchView(AsyncViewMixin, SearchView):
+
+    async def get(self, request: HttpRequest, lang='en', search_type=''):
+        lang = request.LANGUAGE_CODE
+        if search_type in self.searches:
+            context, solr_query = await sync_to_async(self.prepare_search)(request, search_type, lang)
+
+            try:
+                with current_timer().phase('solr'):
+                    solr_response = await async_cached_solr_query(get_async_solr_client(),
+                                                                  self.searches[search_type].solr_core_name,
+                                                                  solr_query, lang)
+                return await sync_to_async(self.search_response)(request, search_type, lang, context, solr_query,
+                                                                 solr_response)
+            except (ConnectionError, SolrError) as ce:
+                return await sync_to_async(render)(request, 'error.html',
+                                                   get_error_context(search_type, lang, ce.args[0]))
+
+        else:
+            return await sync_to_async(render)(request, '404.html', get_error_context(search_type, lang))
+
+
+class AsyncRecordView(AsyncViewMixin, RecordView):
+
+    async def get(self, request: HttpRequest, lang='en', search_type='', record_id=''):
+        lang = request.LANGUAGE_CODE
+        if search_type in self.searches:
+            context, solr_query = await sync_to_async(self.prepare_record)(request, search_type, lang, record_id)
+
+            timer = current_timer()
+            with timer.phase('solr'):
+                solr_response = await get_async_solr_client().query(self.searches[search_type].solr_core_name,
+                                                                    solr_query)
+            timer.add_qtime(solr_response)
+
+            return await sync_to_async(self.record_response)(request, search_type, lang, record_id, context,
+                                                             solr_query, solr_response)
+
+        else:
+            return await sync_to_async(render)(request, '404.html', get_error_context(search_type, lang))
+
+
+class AsyncMoreLikeThisView(AsyncViewMixin, MoreLikeThisView):
+
+    async def get(self, request: HttpRequest, lang='en', search_type='', record_id=''):
+        lang = request.LANGUAGE_CODE
+        if search_type in self.searches:
+            context, solr_query = await sync_to_async(self.prepare_mlt)(request, search_type, lang, record_id)
+            core_name = self.searches[search_type].solr_core_name
+            solr = get_async_solr_client()
+
+            # The neighbour lookup is a single indexed read of a local file, which is cheaper than a thread switch
+            neighbours = self.stored_neighbours(search_type, lang, record_id)
+            solr_response = None
+            timer = current_timer()
+            with timer.phase('solr'):
+                if neighbours is not None:
+                    solr_response = neighbour_response(record_id, neighbours, await solr.query(
+                        core_name, neighbour_query(record_id, neighbours, solr_query['fl'])))
+                if solr_response is None:
+                    solr_response = await solr.query(core_name, solr_query)
+            timer.add_qtime(solr_response)
+
+            return await sync_to_async(self.mlt_response)(request, search_type, lang, record_id, context, solr_query,
+                                                          solr_response)
+
+        else:
+            return await sync_to_async(render)(request, '404.html', get_error_context(search_type, lang))
+
+
+class AsyncExportView(AsyncViewMixin, ExportView):
+    """
+    Exports read up to EXPORT_ROWS documents and write them to a cache file, which is blocking work, so the whole
+    export runs in a thread pool instead of Django's single thread for sync code. With EXPORT_STREAMING, Django 3.2
+    reads the rows of a streaming response from Solr in the event loop, so ASGI deployments should use EXPORT_ASYNC,
+    or serve exports from the WSGI workers.
+    """
+
+    async def get(self, request: HttpRequest, lang='en', search_type=''):
+        return await sync_to_async(super().get, thread_sensitive=False)(request, lang, search_type)
@@ -0,0 +1,7 @@
+"""
+Microbenchmarks for the CPU-bound parts of the search application that do not need Solr: query building, the CSV
+import transform and the template filters. Run them with the run_benchmarks management command.
+
+The highlighting benchmark is the exception: it compares the highlighting strategies on the live Solr core of a search.
+Run it with the run_highlight_benchmark management command.
+"""
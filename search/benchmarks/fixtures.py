@@ -0,0 +1,81 @@
+"""
+Synthetic Search, Field and Code fixtures for the benchmarks. The model instances are never saved, so the benchmarks
+do not need a database. The sizes are similar to the largest searches on the Open Government portal.
+"""
+from django.test import RequestFactory
+from search.models import Search, Field, Code
+from types import SimpleNamespace
+
+TEXT_FIELDS = 40
+STRING_FIELDS = 40
+CODED_FIELDS = 10
+CODES_PER_FIELD = 200
+NUMBER_FIELDS = 10
+DATE_FIELDS = 4
+CSV_ROWS = 1000
+
+
+def create_search():
+    search = Search(search_id='benchmark', label_en='Benchmark', label_fr='Banc d\'essai', solr_core_name='core_benchmark',
+                    results_sort_order_en='score desc,title_en asc,date_published desc',
+                    results_sort_order_fr='score desc,title_fr asc,date_published desc',
+                    results_sort_order_display_en='Best match,Title,Date',
+                    results_sort_order_display_fr='Pertinence,Titre,Date',
+                    id_fields='ref_number,owner_org', mlt_items=10)
+    fields = {}
+
+    def add_field(field_id: str, **kwargs):
+        fields[field_id] = Field(field_id=field_id, search_id=search, label_en=field_id, label_fr=field_id, **kwargs)
+
+    add_field('ref_number')
+    add_field('owner_org', solr_field_is_coded=True, is_search_facet=True)
+    add_field('title_en', solr_field_type='search_text_en', solr_field_lang='en')
+    add_field('title_fr', solr_field_type='search_text_fr', solr_field_lang='fr')
+    for i in range(TEXT_FIELDS):
+        lang = 'en' if i % 2 == 0 else 'fr'
+        add_field('text_{0}_{1}'.format(i, lang), solr_field_type='search_text_{0}'.format(lang), solr_field_lang=lang)
+    for i in range(STRING_FIELDS):
+        add_field('string_{0}'.format(i), solr_extra_fields='string_{0}_en,string_{0}_fr'.format(i) if i % 4 == 0 else '')
+    for i in range(CODED_FIELDS):
+        add_field('coded_{0}'.format(i), solr_field_is_coded=True, is_search_facet=i < 6, solr_facet_display_order=i,
+                  solr_field_multivalued=i % 3 == 0)
+    for i in range(NUMBER_FIELDS):
+        add_field('number_{0}'.format(i), solr_field_type='pfloat', solr_field_is_currency=i % 2 == 0,
+                  solr_extra_fields='number_{0}_en,number_{0}_fr'.format(i))
+    add_field('date_published', solr_field_type='pdate', is_default_year=True, is_default_month=True)
+    for i in range(DATE_FIELDS - 1):
+        add_field('date_{0}'.format(i), solr_field_type='pdate')
+
+    codes = {}
+    for field_id, field in fields.items():
+        if field.solr_field_is_coded:
+            codes[field_id] = {'code{0}'.format(c): Code(field_id=field, code_id='code{0}'.format(c),
+                                                         label_en='Code {0}'.format(c),
+                                                         label_fr='Code {0} (fr)'.format(c))
+                               for c in range(CODES_PER_FIELD)}
+    facets = [f for f in fields if fields[f].is_search_facet]
+    return SimpleNamespace(search=search, fields=fields, codes=codes, facets=facets)
+
+
+def create_csv_rows(fixture):
+    rows = []
+    for r in range(CSV_ROWS):
+        row = {}
+        for field_id, field in fixture.fields.items():
+            if field.solr_field_type == 'pdate':
+                row[field_id] = '20{0:02d}-{1:02d}-{2:02d}'.format(r % 20, r % 12 + 1, r % 28 + 1)
+            elif field.solr_field_type == 'pfloat':
+                row[field_id] = '{0}.{1:02d}'.format(r * 13 % 5000, r % 100)
+            elif field.solr_field_is_coded:
+                row[field_id] = 'code{0}'.format(r % CODES_PER_FIELD)
+            else:
+                row[field_id] = 'Value {0} for {1}'.format(r, field_id)
+        row['ref_number'] = 'REF-{0}'.format(r)
+        rows.append(row)
+    return rows
+
+
+def create_request(query_string: str, lang='en'):
+    request = RequestFactory().get('/search/{0}/benchmark/{1}'.format(lang, query_string))
+    request.LANGUAGE_CODE = lang
+    return request
@@ -0,0 +1,102 @@
+"""
+Compare the cost of the highlighting strategies of a search on its Solr core.
+
+Each strategy is a highlighter, a number of snippets and a bound on the highlighted fields. The same search queries
+are sent to Solr with each strategy in turn, several times, and the Solr query time (QTime) and the size of the
+response are reported for each strategy. Unlike the microbenchmarks, this needs the live Solr core of the search with
+its data loaded.
+"""
+import json
+from search.benchmarks.fixtures import create_request
+from search.loadtest.harness import SEARCH_WORDS, percentile
+from search.models import Search
+from search.query import create_solr_query, get_highlight_fields, highlight_params
+from search.registry import get_configuration
+from search.solr_connections import get_solr_client
+from time import perf_counter
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+
+class HighlightStrategy(NamedTuple):
+    name: str
+    method: str
+    snippets: int
+    # 0 for every highlighted field
+    max_fields: int
+
+
+STRATEGIES = (
+    HighlightStrategy('none', 'none', 0, 0),
+    HighlightStrategy('original-10', 'original', 10, 0),
+    HighlightStrategy('unified-10', 'unified', 10, 0),
+    HighlightStrategy('unified-3', 'unified', 3, 0),
+    HighlightStrategy('unified-3-max10', 'unified', 3, 10),
+)
+
+
+class StrategyResult(NamedTuple):
+    name: str
+    queries: int
+    qtime_p50: float
+    qtime_p95: float
+    wall_p50: float
+    response_bytes: int
+
+
+def configured_strategy(search: Search):
+    return HighlightStrategy('configured', search.highlight_method, search.highlight_snippets,
+                             search.highlight_max_fields)
+
+
+def base_queries(search: Search, lang: str, search_texts):
+    """
+    The Solr queries of the first search page for each search text, without highlighting
+    """
+    config = get_configuration()
+    plan = config.query_plans_fr[search.search_id] if lang == 'fr' else config.query_plans_en[search.search_id]
+    facets = config.facets_fr[search.search_id] if lang == 'fr' else config.facets_en[search.search_id]
+    queries = []
+    for search_text in search_texts:
+        request = create_request('?' + urlencode({'search_text': search_text}), lang)
+        queries.append(create_solr_query(request, search, config.fields[search.search_id], config.codes(lang),
+                                         facets, 0, search.results_page_size, record_id='', highlighting=False,
+                                         default_sort=plan.default_sort, plan=plan))
+    return queries
+
+
+def run_strategy(strategy: HighlightStrategy, core_name: str, queries: list, highlight_fields, runs: int):
+    solr = get_solr_client()
+    params = highlight_params(strategy.method, strategy.snippets)
+    fields = list(highlight_fields[:strategy.max_fields] if strategy.max_fields else highlight_fields)
+    qtimes = []
+    wall_times = []
+    response_bytes = 0
+    for _ in range(runs):
+        for query in queries:
+            solr_query = dict(query)
+            if params:
+                solr_query.update(params)
+                solr_query['hl.fl'] = list(fields)
+            start = perf_counter()
+            solr_response = solr.query(core_name, solr_query)
+            wall_times.append((perf_counter() - start) * 1000)
+            qtimes.append(solr_response.query_time)
+            response_bytes += len(json.dumps(solr_response.data))
+    qtimes.sort()
+    wall_times.sort()
+    return StrategyResult(strategy.name, len(qtimes), percentile(qtimes, 0.5), percentile(qtimes, 0.95),
+                          percentile(wall_times, 0.5), response_bytes // max(len(qtimes), 1))
+
+
+def compare_strategies(search: Search, lang='en', search_texts=None, runs=5, strategies=STRATEGIES):
+    """
+    :return: a StrategyResult for each strategy, followed by one for the strategy configured for the search
+    """
+    queries = base_queries(search, lang, search_texts or SEARCH_WORDS)
+    # The field list of the query plan is bounded by the search's own setting, so start from every highlighted field
+    fields = tuple(get_highlight_fields(get_configuration().fields[search.search_id]))
+    strategies = tuple(strategies) + (configured_strategy(search),)
+    # Warm up the Solr caches, so that the first strategy is not at a disadvantage
+    run_strategy(strategies[0], search.solr_core_name, queries, fields, 1)
+    return [run_strategy(s, search.solr_core_name, queries, fields, runs) for s in strategies]
@@ -0,0 +1,140 @@
+"""
+The benchmark definitions and the runner that times them.
+
+Each benchmark is a function that runs one operation. The runner repeats it for at least min_time seconds to
+measure the operations per second, then runs it once more under tracemalloc to measure the peak memory that one
+operation allocates. Results can be saved as a JSON baseline and compared with later runs.
+"""
+import json
+from search.benchmarks import fixtures
+from search.decorate import compile_display_plan, decorate_docs
+from search.ingest import RecordTransformer
+from search.query import calc_pagination_range, compile_query_plan, create_solr_mlt_query, create_solr_query, \
+    get_search_terms, url_part_escape, url_part_unescape
+from search.templatetags import search_extras
+from time import perf_counter
+import tracemalloc
+from typing import NamedTuple
+
+MARKDOWN_TEXT = """
+## About this search
+
+Use this search to find **contracts over $10,000** awarded by federal departments and agencies.
+
+* Search by vendor name, description or reference number
+* Filter the results by organization, year and quarter
+
+See [the dataset](https://open.canada.ca/data/en/dataset/d8f85d91-7dec-4fd1-8055-483b77225d8b) for more.
+"""
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    ops_per_sec: float
+    peak_bytes: int
+
+    def as_dict(self):
+        return {'ops_per_sec': round(self.ops_per_sec, 1), 'peak_bytes': self.peak_bytes}
+
+
+def _benchmarks():
+    fixture = fixtures.create_search()
+    fields = fixture.fields
+    facets = fixture.facets
+    plan_en = compile_query_plan(fixture.search, fields, facets, 'en')
+    search_request = fixtures.create_request('?search_text=contract+"office+supplies"&owner_org=code1|code2'
+                                             '&coded_1=code3&sort=title_en+asc&page=3')
+    record_request = fixtures.create_request('')
+    rows = fixtures.create_csv_rows(fixture)
+    csv_fields = {f: fields[f] for f in rows[0]}
+    transformer = RecordTransformer(fixture.search, csv_fields, list(fields.values()), fixture.codes,
+                                    list(rows[0]), nothing_to_report=False)
+    escaped_id = url_part_escape('tbs-sct,C-2020-2021-Q3-00042 é/ü')
+    display_fields = [f for f in fields if fields[f].solr_field_lang in ('en', 'bi')][:20]
+    display_plan = compile_display_plan(fixture.search, fields, display_fields, {f: f for f in fields},
+                                        {f: {c: code.label_en for c, code in codes.items()}
+                                         for f, codes in fixture.codes.items()}, 'en')
+    page_docs = rows[:10]
+    row_counter = iter(range(1 << 62))
+
+    return {
+        'create_solr_query': lambda: create_solr_query(search_request, fixture.search, fields, fixture.codes, facets,
+                                                       20, 10, record_id='', highlighting=True),
+        'create_solr_query_planned': lambda: create_solr_query(search_request, fixture.search, fields, fixture.codes,
+                                                               facets, 20, 10, record_id='', highlighting=True,
+                                                               plan=plan_en),
+        'create_solr_query_export': lambda: create_solr_query(search_request, fixture.search, fields, fixture.codes,
+                                                              facets, 1, 0, record_id='', export=True),
+        'create_solr_mlt_query': lambda: create_solr_mlt_query(record_request, fixture.search, fields, 0, 'REF-1'),
+        'compile_query_plan': lambda: compile_query_plan(fixture.search, fields, facets, 'en'),
+        'calc_pagination_range': lambda: calc_pagination_range(1500000, 10, 7500, 3),
+        'get_search_terms': lambda: get_search_terms('contract "office supplies" furniture -chairs 2020'),
+        'url_part_escape': lambda: url_part_escape('tbs-sct,C-2020-2021-Q3-00042 é/ü'),
+        'url_part_unescape': lambda: url_part_unescape(escaped_id),
+        'transform_csv_row': lambda: transformer.transform(rows[next(row_counter) % len(rows)]),
+        'decorate_docs': lambda: decorate_docs(page_docs, display_plan, '/search/en/benchmark/'),
+        'filter_markdown': lambda: search_extras.markdown_filter(MARKDOWN_TEXT),
+        'filter_friendly_date': lambda: search_extras.human_friendly_date_fr('2021-03-31'),
+        'filter_friendly_currency': lambda: search_extras.friendly_currency(123456.78, 'CAD,fr_CA'),
+        'filter_normalize_headings': lambda: search_extras.normalize_headings('<h1>Title</h1><h2>Sub</h2><p>x</p>'),
+        'filter_iso_date': lambda: search_extras.iso_date_time_to_date('2021-03-31T00:00:00Z'),
+        'filter_split': lambda: search_extras.split('one,two,three', ','),
+    }
+
+
+def run_benchmark(name: str, operation, min_time: float):
+    # Warm up caches and lazy imports first
+    operation()
+    iterations = 0
+    batch = 1
+    start = perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(batch):
+            operation()
+        iterations += batch
+        batch *= 2
+        elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(name, iterations / elapsed, max(peak - baseline, 0))
+
+
+def run_benchmarks(name_filter='', min_time=0.5):
+    results = []
+    for name, operation in _benchmarks().items():
+        if name_filter and name_filter not in name:
+            continue
+        results.append(run_benchmark(name, operation, min_time))
+    return results
+
+
+def load_baseline(path: str):
+    try:
+        with open(path, 'r', encoding='utf8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results):
+    with open(path, 'w', encoding='utf8') as baseline_file:
+        json.dump({r.name: r.as_dict() for r in results}, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare(result: BenchmarkResult, baseline: dict, tolerance: float):
+    """
+    :return: the change in operations per second relative to the baseline, or None if there is no baseline, and
+        whether the change is a regression beyond the tolerance
+    """
+    if result.name not in baseline:
+        return None, False
+    change = result.ops_per_sec / baseline[result.name]['ops_per_sec'] - 1
+    return change, change < -tolerance
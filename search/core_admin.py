@@ -0,0 +1,179 @@
+"""
+Solr CoreAdmin operations used to rebuild a search in a shadow core and swap it in without downtime.
+
+HttpCoreAdmin calls the CoreAdmin API of the Solr server through the pooled Solr session. LocalCoreAdmin keeps the
+same information in memory and stands in for a Solr server when testing.
+
+Every shadow core gets its own instance directory, named after the live core and the time it was created, because a
+SWAP only exchanges the core names: after a swap the live core name points to the instance directory of the shadow
+core, and the shadow core name to the old live core's directory.
+"""
+from datetime import datetime
+from django.conf import settings
+from search.solr_connections import get_solr_client
+from SolrClient.exceptions import SolrError
+
+
+class HttpCoreAdmin:
+
+    def __init__(self, server_url=None):
+        self.server_url = (server_url or settings.SOLR_SERVER_URL).rstrip('/')
+
+    def _request(self, action: str, **params):
+        session = get_solr_client(self.server_url).transport.session
+        params.update(action=action, wt='json')
+        response = session.get("{0}/admin/cores".format(self.server_url), params=params)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code >= 400 or 'error' in data:
+            raise SolrError("CoreAdmin {0} failed: {1}".format(action, data.get('error', {}).get('msg', response.text[:500])))
+        return data
+
+    def exists(self, core_name: str):
+        return bool(self._request('STATUS', core=core_name).get('status', {}).get(core_name))
+
+    def num_docs(self, core_name: str):
+        status = self._request('STATUS', core=core_name).get('status', {}).get(core_name)
+        if not status:
+            raise SolrError("Solr core {0} does not exist".format(core_name))
+        return status['index']['numDocs']
+
+    def instance_dir(self, core_name: str):
+        """
+        :return: the instance directory of a core, or '' if the core does not exist
+        """
+        status = self._request('STATUS', core=core_name).get('status', {}).get(core_name)
+        return status.get('instanceDir', '') if status else ''
+
+    def schema_fields(self, core_name: str):
+        schema = get_solr_client(self.server_url).schema.get_schema_fields(core_name)
+        return {field['name'] for field in schema.get('fields', [])}
+
+    def create(self, core_name: str, config_set: str, instance_dir=''):
+        self._request('CREATE', name=core_name, instanceDir=instance_dir or core_name, configSet=config_set)
+
+    def swap(self, core_name: str, other_core_name: str):
+        self._request('SWAP', core=core_name, other=other_core_name)
+
+    def unload(self, core_name: str, delete_files=True):
+        """
+        :param delete_files: also delete the index, data directory and instance directory of the core
+        """
+        delete = 'true' if delete_files else 'false'
+        self._request('UNLOAD', core=core_name, deleteIndex=delete, deleteDataDir=delete, deleteInstanceDir=delete)
+
+
+class LocalCoreAdmin:
+    """
+    In-memory stand-in for HttpCoreAdmin. Cores are a dictionary of core names and document counts, and each core has
+    an instance directory, which must not be in use by another core when the core is created.
+    """
+
+    def __init__(self, cores=None):
+        self.cores = dict(cores or {})
+        self.instance_dirs = {core_name: core_name for core_name in self.cores}
+        # Core name: the names of the fields in its schema
+        self.schemas = {}
+
+    def exists(self, core_name: str):
+        return core_name in self.cores
+
+    def num_docs(self, core_name: str):
+        if core_name not in self.cores:
+            raise SolrError("Solr core {0} does not exist".format(core_name))
+        return self.cores[core_name]
+
+    def instance_dir(self, core_name: str):
+        return self.instance_dirs.get(core_name, '')
+
+    def schema_fields(self, core_name: str):
+        return set(self.schemas.get(core_name, ()))
+
+    def create(self, core_name: str, config_set: str, instance_dir=''):
+        instance_dir = instance_dir or core_name
+        if core_name in self.cores:
+            raise SolrError("Solr core {0} already exists".format(core_name))
+        if instance_dir in self.instance_dirs.values():
+            raise SolrError("Instance directory {0} is already in use".format(instance_dir))
+        self.cores[core_name] = 0
+        self.instance_dirs[core_name] = instance_dir
+
+    def swap(self, core_name: str, other_core_name: str):
+        self.cores[core_name], self.cores[other_core_name] = self.num_docs(other_core_name), self.num_docs(core_name)
+        self.instance_dirs[core_name], self.instance_dirs[other_core_name] = \
+            self.instance_dirs[other_core_name], self.instance_dirs[core_name]
+        self.schemas[core_name], self.schemas[other_core_name] = \
+            self.schemas.get(other_core_name, ()), self.schemas.get(core_name, ())
+
+    def unload(self, core_name: str, delete_files=True):
+        self.num_docs(core_name)
+        del self.cores[core_name]
+        del self.instance_dirs[core_name]
+        self.schemas.pop(core_name, None)
+
+
+def shadow_core_name(core_name: str):
+    return core_name + settings.SOLR_SHADOW_CORE_SUFFIX
+
+
+def shadow_instance_dir(core_name: str):
+    return "{0}_{1:%Y%m%d%H%M%S%f}".format(core_name, datetime.now())
+
+
+def unload_old_core(admin, core_name: str, old_core_name: str):
+    """
+    Unload a shadow core, or the old live core after a swap. Its files are deleted, unless it shares its instance
+    directory with the live core, which happens after a swap by an import that gave every shadow core the same
+    instance directory.
+    """
+    live_dir = admin.instance_dir(core_name)
+    delete_files = not live_dir or admin.instance_dir(old_core_name) != live_dir
+    admin.unload(old_core_name, delete_files=delete_files)
+    return delete_files
+
+
+def create_shadow_core(admin, core_name: str, config_set: str):
+    """
+    Create an empty shadow core for a live core in a new instance directory. A shadow core left behind by an earlier
+    import that failed or was a dry run is removed first.
+    :return: the name of the shadow core
+    """
+    shadow_name = shadow_core_name(core_name)
+    if admin.exists(shadow_name):
+        unload_old_core(admin, core_name, shadow_name)
+    admin.create(shadow_name, config_set, shadow_instance_dir(core_name))
+    return shadow_name
+
+
+def missing_schema_fields(admin, core_name: str, field_ids):
+    """
+    :return: the fields of a search that are not in the schema of a core
+    """
+    schema_fields = admin.schema_fields(core_name)
+    return [f for f in field_ids if f not in schema_fields]
+
+
+def swap_shadow_core(admin, core_name: str, shadow_name: str):
+    """
+    Swap the shadow core in, and unload the old live core, which now has the shadow core name
+    """
+    admin.swap(core_name, shadow_name)
+    unload_old_core(admin, core_name, shadow_name)
+
+
+def verify_shadow_core(admin, core_name: str, shadow_name: str, max_shrink: float):
+    """
+    Compare the document counts of the live core and its rebuilt shadow core before they are swapped.
+    :return: the live and shadow document counts, and an error message if the shadow core should not be swapped in
+    """
+    live_count = admin.num_docs(core_name) if admin.exists(core_name) else 0
+    shadow_count = admin.num_docs(shadow_name)
+    error = ''
+    if shadow_count == 0:
+        error = "The new core {0} is empty".format(shadow_name)
+    elif shadow_count < live_count * (1 - max_shrink):
+        error = "The new core {0} has {1} documents, {2:.0%} fewer than the {3} documents in {4}".format(
+            shadow_name, shadow_count, 1 - shadow_count / live_count, live_count, core_name)
+    return live_count, shadow_count, error
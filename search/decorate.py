@@ -0,0 +1,166 @@
+"""
+Decoration of the Solr documents of a page before it is rendered.
+
+The search item and record templates used to look up each field label, code label and record link, and format each
+value, with template filters, one cell at a time. The view now decorates the documents of a page in one batch with the
+display plans compiled with the search configuration, and the templates only print the results. Each document gets a
+"display" entry with its record link, the label and formatted values of each of its displayed fields, and the labels of
+its coded fields.
+
+Dates and amounts are formatted with the memoized functions used by the import commands, so a value that appears in
+many documents is only formatted once.
+"""
+from django.utils.text import Truncator
+from search.formatters import localized_currency, localized_date
+from search.models import Search
+from search.navigation import record_url
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+# Longest value shown in a search item
+SEARCH_ITEM_MAX_CHARS = 500
+
+
+class FieldDisplay(NamedTuple):
+    label: str
+    # 'date', 'currency' or ''
+    kind: str
+    # The code labels of a coded field, or None
+    codes: Optional[Mapping]
+    # Link the value to the record page
+    is_id: bool
+
+
+class DisplayPlan(NamedTuple):
+    """
+    How to display the fields of the documents of one search, in one language
+    """
+    locale: str
+    # Field ID: FieldDisplay, for the default search item and the default record page
+    search_fields: Mapping
+    record_fields: Mapping
+    # Field ID: code labels, for every coded field
+    coded_fields: Mapping
+
+
+class DisplayField(NamedTuple):
+    field_id: str
+    label: str
+    values: Tuple[str, ...]
+    is_id: bool
+
+
+class DocDisplay(NamedTuple):
+    record_url: str
+    search_fields: Tuple[DisplayField, ...]
+    record_fields: Tuple[DisplayField, ...]
+    codes: Mapping
+
+
+def _field_display(field_id: str, field, label: str, codes: dict, id_fields):
+    """
+    :param field: the Field model of the field, or None for a copy field
+    """
+    if field is not None and field.solr_field_type == 'pdate':
+        kind = 'date'
+    elif field is not None and field.solr_field_is_currency:
+        kind = 'currency'
+    else:
+        kind = ''
+    return FieldDisplay(label, kind, codes.get(field_id), field_id in id_fields)
+
+
+def _record_field_labels(fields: dict, lang: str):
+    """
+    The fields of the default record page, as they have always been chosen: the fields in the language of the page,
+    and the extra copy fields of the fields in the other language
+    """
+    labels = {}
+    for f in fields:
+        if fields[f].solr_field_lang in [lang, 'bi']:
+            if lang == 'en' and not f[:2] == 'fr':
+                labels[f] = fields[f].label_en
+                continue
+            elif lang == 'fr' and not f[:2] == 'en':
+                labels[f] = fields[f].label_fr
+                continue
+            if fields[f].solr_extra_fields:
+                for extra_field in fields[f].solr_extra_fields.split(","):
+                    labels.setdefault(extra_field, extra_field)
+    return labels
+
+
+def compile_display_plan(search: Search, fields: dict, display_fields, display_field_names: Mapping, codes: dict,
+                         lang: str):
+    """
+    :param display_fields: the default display fields of the search in the language
+    :param codes: the code labels of each coded field in the language
+    """
+    id_fields = frozenset(search.id_fields.split(',')) if search.id_fields else frozenset()
+    search_fields = {f: _field_display(f, fields.get(f), display_field_names.get(f), codes, id_fields)
+                     for f in display_fields}
+    record_fields = {f: _field_display(f, fields.get(f), label, codes, frozenset())
+                     for f, label in _record_field_labels(fields, lang).items()}
+    return DisplayPlan(
+        locale='fr_CA' if lang == 'fr' else 'en_CA',
+        search_fields=MappingProxyType(search_fields),
+        record_fields=MappingProxyType(record_fields),
+        coded_fields=MappingProxyType({f: codes[f] for f in fields if fields[f].solr_field_is_coded and f in codes}),
+    )
+
+
+def format_value(value, field: FieldDisplay, locale: str):
+    if field.codes is not None:
+        return field.codes.get(value, value)
+    try:
+        if field.kind == 'date':
+            return localized_date(str(value)[:10], locale)
+        elif field.kind == 'currency':
+            return localized_currency(str(value), locale)
+    except ValueError:
+        pass
+    return value
+
+
+def _display_fields(doc: dict, plan_fields: Mapping, locale: str, max_chars=0):
+    displayed = []
+    for field_id, value in doc.items():
+        field = plan_fields.get(field_id)
+        if field is None:
+            continue
+        values = value if isinstance(value, list) else [value]
+        values = [format_value(v, field, locale) for v in values]
+        if max_chars and not field.is_id:
+            # Truncator is slow, and never shortens a value that is not longer than max_chars
+            values = [Truncator(v).chars(max_chars) if isinstance(v, str) and len(v) > max_chars else v
+                      for v in values]
+        displayed.append(DisplayField(field_id, field.label, tuple(values), field.is_id))
+    return tuple(displayed)
+
+
+def _code_labels(doc: dict, coded_fields: Mapping):
+    labels = {}
+    for field_id, codes in coded_fields.items():
+        value = doc.get(field_id)
+        if isinstance(value, list):
+            labels[field_id] = [codes.get(v, v) for v in value]
+        elif value is not None:
+            labels[field_id] = codes.get(value, value)
+    return labels
+
+
+def decorate_docs(docs, plan: DisplayPlan, parent_path: str, record=False):
+    """
+    Add the display entry to each document of a page
+    :param record: decorate the fields of the record page rather than the fields of the search items
+    """
+    for doc in docs:
+        fields = _display_fields(doc, plan.record_fields, plan.locale) if record else \
+            _display_fields(doc, plan.search_fields, plan.locale, SEARCH_ITEM_MAX_CHARS)
+        doc['display'] = DocDisplay(
+            record_url=record_url(parent_path, str(doc.get('id', ''))),
+            search_fields=() if record else fields,
+            record_fields=fields if record else (),
+            codes=_code_labels(doc, plan.coded_fields),
+        )
+    return docs
@@ -0,0 +1,168 @@
+"""
+Streaming support for the search results export.
+
+The Solr /export handler can return millions of documents. Rather than loading the whole response into memory, the
+functions in this module read the response incrementally, convert each document into a CSV row as it arrives, and
+write the rows both to the HTTP client and to the export cache file.
+"""
+import codecs
+import csv
+from django.conf import settings
+import json
+import logging
+import re
+from search.export_cache import get_export_cache
+from search.solr_connections import get_solr_client
+from SolrClient.exceptions import ConnectionError, SolrError
+
+logger = logging.getLogger(__name__)
+
+_DOCS_START = re.compile(r'"docs"\s*:\s*\[')
+_SEPARATORS = ' \t\r\n,'
+
+# Approximate number of characters to collect before sending a block of CSV rows to the client
+STREAM_BLOCK_SIZE = 65536
+
+
+def iter_export_docs(chunks):
+    """
+    Incrementally parse the JSON response of the Solr /export handler and yield the documents one at a time.
+    Only the document currently being parsed is kept in memory.
+    :param chunks: an iterable of text chunks of the response body
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        match = _DOCS_START.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+    else:
+        # No document list, which means Solr returned an error message
+        try:
+            error = json.loads(buffer).get('error', {})
+        except ValueError:
+            error = {'msg': buffer[:500]}
+        raise SolrError(str(error.get('msg', error)))
+
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(buffer):
+            buffer = next(chunks, None)
+            pos = 0
+            if buffer is None:
+                raise SolrError('Solr export response ended unexpectedly')
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            doc, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # The document is incomplete, so read more of the response
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise SolrError('Solr export response ended unexpectedly')
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        if 'EXCEPTION' in doc:
+            raise SolrError(doc['EXCEPTION'])
+        yield doc
+        pos = end
+        if pos > STREAM_BLOCK_SIZE:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def _form_params(solr_query: dict):
+    params = {'wt': 'json'}
+    for key, value in solr_query.items():
+        if isinstance(value, bool):
+            params[key] = str(value).lower()
+        else:
+            params[key] = value
+    return params
+
+
+def _iter_response_docs(response):
+    with response:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunks = (decoder.decode(chunk) for chunk in response.iter_content(chunk_size=STREAM_BLOCK_SIZE))
+        yield from iter_export_docs(chunks)
+
+
+def stream_solr_export(core_name: str, solr_query: dict):
+    """
+    Send a query to the Solr /export handler and return an iterator over the result documents, which are parsed as
+    they are received. Connection and HTTP errors are raised here, before any of the response is read.
+    """
+    solr = get_solr_client()
+    url = "{0}/{1}/export".format(settings.SOLR_SERVER_URL.rstrip('/'), core_name)
+    try:
+        response = solr.transport.session.post(url, data=_form_params(solr_query), stream=True)
+    except Exception as x:
+        raise ConnectionError('N/A', str(x), x)
+    if response.status_code >= 400:
+        message = "{0} - {1}".format(response.status_code, response.text[:500])
+        response.close()
+        raise SolrError(message)
+    return _iter_response_docs(response)
+
+
+class _EchoWriter:
+    """
+    File-like object for csv.writer that hands back each formatted row instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_blocks(docs, field_names: list):
+    """
+    Convert an iterable of Solr documents into blocks of CSV text, starting with the header row
+    """
+    row_writer = csv.writer(_EchoWriter(), dialect='excel')
+    headers = list(field_names)
+    headers[0] = u'\N{BOM}' + headers[0]
+    block = [row_writer.writerow(headers)]
+    block_size = len(block[0])
+    for doc in docs:
+        line = row_writer.writerow([doc.get(f, '') for f in field_names])
+        block.append(line)
+        block_size += len(line)
+        if block_size >= STREAM_BLOCK_SIZE:
+            yield ''.join(block)
+            block = []
+            block_size = 0
+    yield ''.join(block)
+
+
+def stream_export_csv(docs, field_names: list, cached_filename: str):
+    """
+    Convert an iterable of Solr documents into blocks of CSV text. The same text is written to a temporary file that
+    replaces cached_filename once the export is complete, so that a partial export is never served from the cache.
+    :raises ConnectionError, SolrError: if the export fails part way, after the temporary file is removed
+    """
+    export_cache = get_export_cache()
+    temp_filename = export_cache.temp_path(cached_filename)
+    completed = False
+    try:
+        with open(temp_filename, 'w', newline='', encoding='utf8') as cache_file:
+            for text in iter_csv_blocks(docs, field_names):
+                cache_file.write(text)
+                yield text
+        export_cache.commit(temp_filename, cached_filename)
+        completed = True
+    except (ConnectionError, SolrError) as x:
+        # The HTTP response has already started, so the error is raised again to abort it, and the client sees an
+        # incomplete download instead of a CSV file that looks complete
+        logger.error('Export to {0} failed: {1}'.format(cached_filename, x))
+        raise
+    finally:
+        if not completed:
+            export_cache.remove(temp_filename)
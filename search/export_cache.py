@@ -0,0 +1,187 @@
+"""
+Manager for the export file cache directory.
+
+Exported search results are cached as CSV files in EXPORT_FILE_CACHE_DIR, named
+"<search id>_<query hash>_<lang>.csv". Files are always written to a temporary file first and renamed into place, so
+a partially written export is never served. A sweep removes files that are older than EXPORT_FILE_CACHE_TIMEOUT and
+then, if the directory is still larger than EXPORT_FILE_CACHE_MAX_BYTES, removes the least recently used files until
+it fits. The sweep runs from the sweep_export_cache management command and opportunistically from the export views,
+at most once every EXPORT_FILE_CACHE_SWEEP_INTERVAL seconds per process.
+
+The compressed full exports written by build_full_exports ("<search id>_full_<query hash>_<lang>.csv.gz") are in the
+same directory. They count towards EXPORT_FILE_CACHE_MAX_BYTES, but are never expired or evicted by the sweep, because
+each build replaces the previous one, so the other exports share the space that they leave.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+import logging
+import os
+import re
+import threading
+from time import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_CACHE_FILE = re.compile(r'^(?P<search>.+)_[0-9a-f]{40}_[a-z]{2}\.csv$')
+
+
+class ExportCache:
+
+    def __init__(self, directory: str, max_bytes: int, timeout: int, temp_timeout=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        # Temporary files that are older than this were left behind by an export that died
+        self.temp_timeout = temp_timeout
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, search_type: str, name: str):
+        return os.path.join(self.directory, "{0}_{1}.csv".format(search_type, name))
+
+    def temp_path(self, path: str):
+        return "{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+
+    def get(self, path: str):
+        """
+        Return True if a fresh copy of the file is in the cache. Expired files are removed. A hit updates the access
+        time of the file, which is what the LRU eviction uses, because the cache directory may be mounted noatime.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        now = time()
+        if now - stat.st_mtime > self.timeout:
+            self.remove(path)
+            return False
+        os.utime(path, (now, stat.st_mtime))
+        return True
+
+    def commit(self, temp_path: str, path: str):
+        os.replace(temp_path, path)
+
+    @contextmanager
+    def atomic_write(self, path: str):
+        """
+        Open a temporary file for writing that replaces path when the block completes without an error.
+        """
+        temp_path = self.temp_path(path)
+        try:
+            with open(temp_path, 'w', newline='', encoding='utf8') as cache_file:
+                yield cache_file
+            self.commit(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self, path: str):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def invalidate(self, search_type: str):
+        """
+        Remove every cached export of a search, for example after new data has been loaded into its Solr core.
+        :return: the number of files removed
+        """
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = _CACHE_FILE.match(entry.name)
+                if match and match.group('search') == search_type and self.remove(entry.path):
+                    removed += 1
+        return removed
+
+    def sweep(self):
+        """
+        Remove expired files and abandoned temporary files, then evict the least recently used files until the
+        directory, full exports included, is within its size budget.
+        :return: the number of files removed and the number of bytes freed
+        """
+        now = time()
+        removed = 0
+        freed = 0
+        cached_files = []
+        total_size = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.csv.gz'):
+                    # A full export, which is counted but not removed
+                    total_size += stat.st_size
+                    continue
+                elif entry.name.endswith('.csv'):
+                    expired = now - stat.st_mtime > self.timeout
+                elif entry.name.endswith('.tmp'):
+                    expired = now - stat.st_mtime > self.temp_timeout
+                elif entry.name.endswith('.error'):
+                    expired = now - stat.st_mtime > self.timeout
+                else:
+                    continue
+                if expired:
+                    if self.remove(entry.path):
+                        removed += 1
+                        freed += stat.st_size
+                elif entry.name.endswith('.csv'):
+                    cached_files.append((stat.st_atime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+                else:
+                    total_size += stat.st_size
+
+        if total_size > self.max_bytes:
+            for atime, size, path in sorted(cached_files):
+                if self.remove(path):
+                    removed += 1
+                    freed += size
+                    total_size -= size
+                if total_size <= self.max_bytes:
+                    break
+        self._last_sweep = now
+        if removed:
+            logger.info('Export cache sweep removed {0} files ({1} bytes)'.format(removed, freed))
+        return removed, freed
+
+    def maybe_sweep(self, interval: int):
+        """
+        Run a sweep in a background thread if this process has not swept the cache in the last interval seconds.
+        """
+        if time() - self._last_sweep < interval or not self._sweep_lock.acquire(blocking=False):
+            return
+        self._last_sweep = time()
+
+        def run_sweep():
+            try:
+                self.sweep()
+            except OSError as x:
+                logger.error('Export cache sweep failed: {0}'.format(x))
+            finally:
+                self._sweep_lock.release()
+
+        threading.Thread(target=run_sweep, name='export-cache-sweep', daemon=True).start()
+
+
+_export_cache = None
+_export_cache_lock = threading.Lock()
+
+
+def get_export_cache():
+    global _export_cache
+    # The cache is recreated if the directory setting is overridden, as it is by the load tests
+    if _export_cache is None or _export_cache.directory != settings.EXPORT_FILE_CACHE_DIR:
+        with _export_cache_lock:
+            if _export_cache is None or _export_cache.directory != settings.EXPORT_FILE_CACHE_DIR:
+                _export_cache = ExportCache(settings.EXPORT_FILE_CACHE_DIR,
+                                            settings.EXPORT_FILE_CACHE_MAX_BYTES,
+                                            settings.EXPORT_FILE_CACHE_TIMEOUT,
+                                            settings.EXPORT_JOB_TIMEOUT)
+    return _export_cache
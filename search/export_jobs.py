@@ -0,0 +1,146 @@
+"""
+Background export jobs.
+
+When EXPORT_ASYNC is enabled, a search results export that is not already in the file cache is run by a small pool of
+worker threads instead of inside the HTTP request. Jobs are identified by the same "<query hash>_<lang>" name as the
+cached CSV file, so identical requests share one job. A lock file next to the cached file marks a running job, which
+lets every worker process see the job status and prevents two processes from running the same export. The lock holds
+a token of the job that created it, so a job that outlived EXPORT_JOB_TIMEOUT, and whose lock was taken over by a new
+job, does not remove the lock of the new job.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+import logging
+import os
+from search.export import stream_export_csv, stream_solr_export
+import threading
+from time import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = 'pending'
+JOB_READY = 'ready'
+JOB_FAILED = 'failed'
+JOB_UNKNOWN = 'unknown'
+
+_executor = None
+_executor_pid = None
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS, thread_name_prefix='export')
+        _executor_pid = os.getpid()
+        _jobs.clear()
+    return _executor
+
+
+def _lock_filename(cached_filename: str):
+    return cached_filename + '.lock'
+
+
+def _error_filename(cached_filename: str):
+    return cached_filename + '.error'
+
+
+def _acquire_lock(cached_filename: str):
+    """
+    :return: the token of the new lock, or '' if the export is locked by another job
+    """
+    lock_filename = _lock_filename(cached_filename)
+    try:
+        # A lock left behind by a worker that died while running the job is ignored once it is too old
+        if time() - os.path.getmtime(lock_filename) > settings.EXPORT_JOB_TIMEOUT:
+            os.remove(lock_filename)
+    except FileNotFoundError:
+        pass
+    token = uuid.uuid4().hex
+    try:
+        lock_file = os.open(lock_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return ''
+    try:
+        os.write(lock_file, token.encode('ascii'))
+    finally:
+        os.close(lock_file)
+    return token
+
+
+def _release_lock(cached_filename: str, token: str):
+    """
+    Remove the lock of a job, unless it has been taken over by another job
+    """
+    lock_filename = _lock_filename(cached_filename)
+    try:
+        with open(lock_filename, 'r', encoding='ascii') as lock_file:
+            if lock_file.read() != token:
+                return
+        os.remove(lock_filename)
+    except FileNotFoundError:
+        pass
+
+
+def _run_export(job_id: str, cached_filename: str, core_name: str, solr_query: dict, field_names: list, token: str):
+    try:
+        docs = stream_solr_export(core_name, solr_query)
+        for _ in stream_export_csv(docs, field_names, cached_filename):
+            pass
+        if not os.path.exists(cached_filename):
+            raise RuntimeError('the export did not complete')
+    except Exception as x:
+        logger.error('Export job {0} failed: {1}'.format(job_id, x))
+        with open(_error_filename(cached_filename), 'w', encoding='utf8') as error_file:
+            error_file.write(str(x))
+    finally:
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        _release_lock(cached_filename, token)
+
+
+def submit_export_job(job_id: str, cached_filename: str, core_name: str, solr_query: dict, field_names: list):
+    """
+    Start an export job unless the same export is already running in this or another worker process.
+    :return: the job status
+    """
+    if os.path.exists(cached_filename):
+        return JOB_READY
+    with _jobs_lock:
+        executor = _get_executor()
+        if job_id in _jobs:
+            return JOB_PENDING
+        token = _acquire_lock(cached_filename)
+        if not token:
+            return JOB_PENDING
+        if os.path.exists(_error_filename(cached_filename)):
+            os.remove(_error_filename(cached_filename))
+        _jobs[job_id] = executor.submit(_run_export, job_id, cached_filename, core_name, solr_query, field_names,
+                                        token)
+    return JOB_PENDING
+
+
+def clear_export_job_error(cached_filename: str):
+    """
+    Remove the error marker of a failed job and return its error message.
+    """
+    error_filename = _error_filename(cached_filename)
+    try:
+        with open(error_filename, 'r', encoding='utf8') as error_file:
+            message = error_file.read()
+        os.remove(error_filename)
+    except FileNotFoundError:
+        message = ''
+    return message
+
+
+def get_export_job_status(cached_filename: str):
+    if os.path.exists(cached_filename):
+        return JOB_READY
+    if os.path.exists(_lock_filename(cached_filename)):
+        return JOB_PENDING
+    if os.path.exists(_error_filename(cached_filename)):
+        return JOB_FAILED
+    return JOB_UNKNOWN
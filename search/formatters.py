@@ -0,0 +1,82 @@
+"""
+Memoized conversions of CSV values into the localized strings that are loaded into Solr.
+
+Datasets repeat the same dates and amounts many times, and the babel formatting functions are among the slowest
+steps of an import, so each conversion is cached by value and locale. The caches are bounded, and their hit rates are
+reported at the end of an import.
+"""
+from babel.dates import format_date
+from babel.numbers import format_currency, format_decimal, parse_decimal
+from datetime import datetime
+from functools import lru_cache
+
+# Maximum number of values kept in each cache
+FORMAT_CACHE_SIZE = 100000
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def parse_csv_date(value: str):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def localized_date(value: str, locale: str):
+    return format_date(parse_csv_date(value), locale=locale)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def parse_csv_decimal(value: str):
+    return parse_decimal(value, locale='en_US')
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def localized_currency(value: str, locale: str):
+    return format_currency(parse_csv_decimal(value), 'CAD', locale=locale)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def localized_decimal(value: str, locale: str):
+    return format_decimal(parse_csv_decimal(value), locale=locale)
+
+
+_cached_functions = {
+    'date': localized_date,
+    'currency': localized_currency,
+    'decimal': localized_decimal,
+}
+
+
+def cache_stats():
+    """
+    :return: a dictionary of the (hits, misses) of each kind of conversion in this process
+    """
+    stats = {}
+    for kind, func in _cached_functions.items():
+        info = func.cache_info()
+        stats[kind] = (info.hits, info.misses)
+    return stats
+
+
+def merge_cache_stats(all_stats):
+    """
+    Add up the cache statistics of several processes.
+    """
+    totals = {}
+    for stats in all_stats:
+        for kind, (hits, misses) in stats.items():
+            total_hits, total_misses = totals.get(kind, (0, 0))
+            totals[kind] = (total_hits + hits, total_misses + misses)
+    return totals
+
+
+def describe_cache_stats(stats: dict):
+    descriptions = []
+    for kind, (hits, misses) in sorted(stats.items()):
+        if hits + misses:
+            descriptions.append("{0} {1:.1%} ({2} of {3})".format(kind, hits / (hits + misses), hits, hits + misses))
+    return "Formatting cache hit rates: {0}".format(", ".join(descriptions) if descriptions else "none")
+
+
+def clear_caches():
+    for func in (parse_csv_date, parse_csv_decimal) + tuple(_cached_functions.values()):
+        func.cache_clear()
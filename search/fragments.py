@@ -0,0 +1,77 @@
+"""
+Rendering cache for the static fragments of the search pages.
+
+The header, footer and message snippets of a search, and the Markdown in its descriptions and messages, only change
+when an admin edits the Search model, but they were rendered again, with markdown2 and bleach, on every page view.
+Each worker process now keeps the rendered fragments, keyed by search, language, snippet and a hash of the content
+that goes into the snippet. The cache is emptied when the search configuration version changes, which happens every
+time a Search, Field or Code is saved or deleted (see search/signals.py).
+
+Snippets rendered through this cache must only depend on the search, the language and the content passed with them,
+not on the request.
+"""
+import bleach
+from django.conf import settings
+from django.template import Context
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from functools import lru_cache
+import hashlib
+import markdown2
+from search.registry import get_configuration
+import threading
+
+# Maximum number of different Markdown texts kept
+MARKDOWN_CACHE_SIZE = 512
+
+_fragments = {}
+_fragments_version = None
+_fragments_lock = threading.Lock()
+
+
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def render_markdown(text: str):
+    html = bleach.clean(markdown2.markdown(text, extras=settings.MARKDOWN_FILTER_EXTRAS),
+                        tags=settings.MARKDOWN_FILTER_WHITELIST_TAGS)
+    return bleach.linkify(html)
+
+
+def _fragment_cache():
+    """
+    :return: the rendered fragments of the current configuration version
+    """
+    global _fragments, _fragments_version
+    version = get_configuration().version
+    if _fragments_version != version:
+        with _fragments_lock:
+            if _fragments_version != version:
+                _fragments = {}
+                _fragments_version = version
+    return _fragments
+
+
+def render_fragment(context: Context, template_name: str, content=''):
+    """
+    Render a snippet with the page context, or return the output of an earlier render of the same snippet for the same
+    search, language and content.
+    """
+    if not template_name:
+        return ''
+    digest = hashlib.sha1(str(content).encode('utf8')).hexdigest()
+    key = (context.get('search_type', ''), get_language(), template_name, digest)
+    fragments = _fragment_cache()
+    html = fragments.get(key)
+    if html is None:
+        template = context.template.engine.get_template(template_name)
+        with context.push():
+            html = mark_safe(template.render(context))
+        fragments[key] = html
+    return html
+
+
+def clear_fragments():
+    global _fragments_version
+    with _fragments_lock:
+        _fragments.clear()
+        _fragments_version = None
+    render_markdown.cache_clear()
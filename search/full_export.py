@@ -0,0 +1,80 @@
+"""
+Pre-built exports of every record of a search.
+
+The most requested export is the unfiltered one, every record of a search in one language, and it is also the one
+that costs Solr the most. After each load, import_data_csv runs the build_full_exports command, which exports every
+record of the search once per language with the same query as the export view, and keeps a gzip compressed copy in
+the export cache directory named "<search id>_full_<query hash>_<lang>.csv.gz". The export view serves unfiltered
+export requests from that file, without querying Solr. Searches whose plugin has a post_export_solr_query hook are
+not pre-built, because the hook needs the whole Solr response.
+
+The hash covers the whole export query, including the field list, the sort order and the changes made by the
+pre_export_solr_query plugin hook, so a file is no longer used once the search definition changes the query. Full
+exports are not expired or evicted by the export cache sweep; each build replaces the previous one.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from search.export_cache import ExportCache
+
+_FULL_EXPORT_FILE = re.compile(r'^(?P<search>.+)_full_[0-9a-f]{40}_(?P<lang>[a-z]{2})\.csv\.gz$')
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# Size of the blocks of decompressed CSV sent to clients that do not accept gzip
+READ_BLOCK_SIZE = 65536
+
+
+def is_unfiltered(solr_query: dict):
+    """
+    :param solr_query: an export query, before the search plugin hooks change it
+    """
+    return solr_query.get('q', '*') in ('*', '*:*') and not solr_query.get('fq')
+
+
+def full_export_path(export_cache: ExportCache, search_type: str, lang: str, solr_query: dict):
+    query_hash = hashlib.sha1(json.dumps(solr_query, sort_keys=True, default=str).encode('utf8')).hexdigest()
+    return os.path.join(export_cache.directory, "{0}_full_{1}_{2}.csv.gz".format(search_type, query_hash, lang))
+
+
+def write_full_export(export_cache: ExportCache, path: str, blocks):
+    """
+    Compress blocks of CSV text into a temporary file that replaces path when all of them are written
+    """
+    temp_path = export_cache.temp_path(path)
+    try:
+        with gzip.open(temp_path, 'wt', encoding='utf8', newline='') as export_file:
+            for text in blocks:
+                export_file.write(text)
+        export_cache.commit(temp_path, path)
+    finally:
+        export_cache.remove(temp_path)
+
+
+def remove_full_exports(export_cache: ExportCache, search_type: str, lang='', keep=''):
+    """
+    Remove the full exports of a search, in one language or in every language, except for keep
+    :return: the number of files removed
+    """
+    removed = 0
+    with os.scandir(export_cache.directory) as entries:
+        for entry in entries:
+            match = _FULL_EXPORT_FILE.match(entry.name)
+            if match and match.group('search') == search_type and (not lang or match.group('lang') == lang) \
+                    and entry.path != keep and export_cache.remove(entry.path):
+                removed += 1
+    return removed
+
+
+def accepts_gzip(request):
+    return bool(_ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def iter_full_export(export_file):
+    """
+    Decompress an open full export file, a block at a time
+    """
+    with gzip.GzipFile(fileobj=export_file) as gzip_file, export_file:
+        for block in iter(lambda: gzip_file.read(READ_BLOCK_SIZE), b''):
+            yield block
@@ -0,0 +1,233 @@
+"""
+Conversion of CSV rows into Solr documents for the import_data_csv command.
+
+The conversion is done by RecordTransformer, which holds everything it needs (the search, its fields and codes) and
+can be pickled, so that the same code is used when the command runs on a single core and when it converts chunks of
+rows in a pool of worker processes.
+"""
+import logging
+import os
+from search.formatters import cache_stats, clear_caches, localized_currency, localized_date, localized_decimal, parse_csv_date
+from search.models import Search
+from search.plugin_registry import clear_hook_stats, get_plugin_hooks, hook_stats
+from typing import NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownFieldError(Exception):
+    pass
+
+
+class FieldPlan(NamedTuple):
+    """
+    The conversion steps for one CSV column, worked out once from its Field model instead of for every row.
+    """
+    multivalued: bool
+    export_fields: Tuple[str, ...]
+    # 'date', 'currency', 'decimal' or '' for no conversion
+    kind: str
+    is_default_year: bool
+    is_default_month: bool
+    codes: Optional[dict]
+
+
+def create_field_plan(field, codes: Optional[dict]):
+    if field.solr_field_type == 'pdate':
+        kind = 'date'
+    elif field.solr_field_type in ['pint', 'pfloat']:
+        kind = 'currency' if field.solr_field_is_currency else 'decimal'
+    else:
+        kind = ''
+    return FieldPlan(multivalued=bool(field.solr_field_multivalued),
+                     export_fields=tuple(field.solr_field_export.split(',')) if field.solr_field_export else (),
+                     kind=kind,
+                     is_default_year=bool(field.is_default_year),
+                     is_default_month=bool(field.is_default_month),
+                     codes=codes)
+
+
+class RecordTransformer:
+
+    def __init__(self, search_target: Search, csv_fields: dict, all_fields: list, field_codes: dict,
+                 fieldnames: list, nothing_to_report: bool):
+        self.search_target = search_target
+        self.csv_fields = csv_fields
+        self.all_fields = list(all_fields)
+        self.field_codes = field_codes
+        self.fieldnames = list(fieldnames)
+        self.nothing_to_report = nothing_to_report
+        self._hooks = None
+        self.field_plans = {f: create_field_plan(csv_fields[f], field_codes.get(f))
+                            for f in self.fieldnames if f in csv_fields}
+
+    def __getstate__(self):
+        # Plugin hooks cannot be pickled, so worker processes load the plugin again
+        state = self.__dict__.copy()
+        state['_hooks'] = None
+        return state
+
+    @property
+    def hooks(self):
+        if self._hooks is None:
+            self._hooks = get_plugin_hooks(self.search_target.search_id)
+        return self._hooks
+
+    def unknown_fields(self):
+        return [f for f in self.fieldnames if f not in self.csv_fields and f not in ('owner_org_title', 'owner_org')]
+
+    def set_empty_fields(self, solr_record: dict):
+
+        for sf in self.all_fields:
+            if (sf.field_id not in solr_record and sf != 'default_fmt') or solr_record[sf.field_id] == '':
+                if sf.default_export_value:
+                    default_fmt = sf.default_export_value.split('|')
+                    if default_fmt[0] in ['str', 'date']:
+                        solr_record[sf.field_id] = str(default_fmt[1])
+                    elif default_fmt[0] == 'int':
+                        solr_record[sf.field_id] = int(default_fmt[1])
+                    elif default_fmt[0] == 'float':
+                        solr_record[sf.field_id] = float(default_fmt[1])
+                    else:
+                        solr_record[sf.field_id] = ''
+        return solr_record
+
+    def transform(self, csv_record: dict):
+        """
+        Convert one CSV row into a Solr document.
+        :return: the Solr document, or None if a search plugin filtered out the row
+        """
+        record_format = 'NTR' if self.nothing_to_report else ''
+
+        # Call plugins if they exist for this search type. This is where a developer can introduce
+        # code to customize the data that is loaded into Solr for a particular search.
+        hooks = self.hooks
+        if hooks.filter_csv_record:
+            include, filtered_record = hooks.filter_csv_record(csv_record, self.search_target, self.csv_fields,
+                                                               self.field_codes, record_format)
+            if not include:
+                return None
+            else:
+                csv_record = filtered_record
+        # Create a dictionary for each record loaded into  Solr
+        solr_record = {'format': 'NTR' if self.nothing_to_report else 'DEFAULT'}
+        for csv_field in self.fieldnames:
+            # Verify that it is a known field
+            if csv_field not in self.csv_fields and csv_field not in ('owner_org_title', 'owner_org'):
+                raise UnknownFieldError(csv_field)
+            if csv_field == 'owner_org_title':
+                continue
+
+            plan = self.field_plans[csv_field]
+            value = csv_record[csv_field]
+
+            # Handle multi-valued fields here
+            if plan.multivalued:
+                solr_record[csv_field] = value.split(',')
+                # Copy fields fo report cannot use multi-values - so directly populate with original string
+                for extra_field in plan.export_fields:
+                    solr_record[extra_field] = value
+            else:
+                solr_record[csv_field] = value
+
+            # Automatically expand out dates and numbers for use with Solr export handler
+            if plan.kind == 'date':
+                try:
+                    if value:
+                        csv_date = parse_csv_date(value)
+                        solr_record[csv_field + '_en'] = localized_date(value, 'en')
+                        solr_record[csv_field + '_fr'] = localized_date(value, 'fr')
+                        if plan.is_default_year:
+                            solr_record['year'] = csv_date.year
+                        if plan.is_default_month:
+                            solr_record['month'] = csv_date.month
+                    else:
+                        solr_record[csv_field + '_en'] = ''
+                        solr_record[csv_field + '_fr'] = ''
+                except ValueError as x2:
+                    logger.error('Invalid date: "{0}"'.format(x2))
+                    solr_record[csv_field] = ''
+                    continue
+            elif plan.kind:
+                if solr_record[csv_field]:
+                    if solr_record[csv_field] == '.':
+                        solr_record[csv_field] = "0"
+                    number = solr_record[csv_field]
+                    if plan.kind == 'currency':
+                        solr_record[csv_field + '_en'] = localized_currency(number, 'en_CA')
+                        solr_record[csv_field + '_fr'] = localized_currency(number, 'fr_CA')
+                    else:
+                        solr_record[csv_field + '_en'] = localized_decimal(number, 'en_CA')
+                        solr_record[csv_field + '_fr'] = localized_decimal(number, 'fr_CA')
+                else:
+                    solr_record[csv_field + '_en'] = ''
+                    solr_record[csv_field + '_fr'] = ''
+
+            # Lookup the expanded code value from the codes dict of dict
+            if plan.codes is not None:
+                if value:
+
+                    if plan.multivalued:
+                        codes_en = []
+                        codes_fr = []
+                        for code_value in value.split(","):
+                            code = plan.codes.get(code_value.lower())
+                            if code is not None:
+                                codes_en.append(code.label_en)
+                                codes_fr.append(code.label_fr)
+                            else:
+                                logger.info("Unknown code value: {0} for field: {1}".format(code_value, csv_field))
+                        solr_record[csv_field + '_en'] = codes_en
+                        solr_record[csv_field + '_fr'] = codes_fr
+                    else:
+                        code = plan.codes.get(value.lower())
+                        if code is not None:
+                            solr_record[csv_field + '_en'] = code.label_en
+                            solr_record[csv_field + '_fr'] = code.label_fr
+                        else:
+                            logger.info("Unknown code value: {0} for field: {1}".format(value, csv_field))
+        solr_record = self.set_empty_fields(solr_record)
+        # Set the Solr ID field (Nothing To Report records are excluded)
+        if not self.nothing_to_report:
+            if self.search_target.id_fields:
+                id_values = []
+                for id_field in self.search_target.id_fields.split(","):
+                    id_values.append(csv_record[id_field])
+                solr_record['id'] = ",".join(id_values)
+        else:
+
+            if 'month' in solr_record:
+                solr_record['id'] = "{0}-{1}-{2}".format(solr_record['owner_org'], solr_record['year'], solr_record['month'])
+            elif 'quarter' in solr_record:
+                solr_record['id'] = "{0}-{1}-{2}".format(solr_record['owner_org'], solr_record['year'],
+                                                         solr_record['quarter'])
+
+        # Call plugins if they exist for this search type. This is where a developer can introduce
+        # code to customize the data that is loaded into Solr for a particular search.
+        if hooks.load_csv_record:
+            solr_record = hooks.load_csv_record(csv_record, solr_record, self.search_target, self.csv_fields,
+                                                self.field_codes, record_format)
+        return solr_record
+
+
+# The transformer used by each worker process of the parallel import, set by the pool initializer
+_worker_transformer = None
+
+
+def init_worker(transformer: RecordTransformer):
+    global _worker_transformer
+    _worker_transformer = transformer
+    # Forked workers start with a copy of the parent's caches and hook counts, which would skew the statistics
+    clear_caches()
+    clear_hook_stats()
+
+
+def transform_chunk(csv_records: list):
+    """
+    Convert a chunk of CSV rows in a worker process. Filtered rows are returned as None so that the parent process
+    sees exactly the same sequence of rows as the single process import.
+    :return: the converted rows, the worker process ID, and the formatting cache and plugin hook statistics of the
+        worker
+    """
+    solr_records = [_worker_transformer.transform(csv_record) for csv_record in csv_records]
+    return solr_records, os.getpid(), cache_stats(), hook_stats()
@@ -0,0 +1,4 @@
+"""
+Load-testing harness for the search views. The views are driven in-process with the Django test client against a
+local fake Solr server, so the throughput and latency of the Django side can be measured without a Solr cluster.
+"""
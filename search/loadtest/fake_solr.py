@@ -0,0 +1,262 @@
+"""
+A fake Solr server for load tests.
+
+FakeSolr answers the select and export requests sent by the search views with canned responses: search results with
+facet counts and highlighting, single records, More Like This results and /export documents. Documents are generated
+from sample field values, so the result pages render the same way as they do with real results. Every response is
+delayed by a configurable latency that stands in for the time Solr spends on the query.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+from time import sleep
+from urllib.parse import parse_qs, urlsplit
+import zlib
+
+_ID_QUERY = re.compile(r'id:"((?:[^"\\]|\\.)*)"|id:([^\s"()]+)')
+_ID_LIST_QUERY = re.compile(r'id:\(((?:[^)"]|"(?:[^"\\]|\\.)*")*)\)')
+_QUOTED = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_LOCAL_PARAMS = re.compile(r'^\{!.*?\}')
+_ID_TERMS_FILTER = re.compile(r'^\{!terms f=id\}(.*)$')
+
+DEFAULT_NUM_FOUND = 250000
+DEFAULT_EXPORT_ROWS = 1000
+DEFAULT_FACET_LIMIT = 100
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeSolrHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that the pooled Solr session keeps its connections open, as it does with a real Solr server
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle(self.rfile.read(length) if length else b'')
+
+    def _handle(self, body: bytes):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+        if body and 'application/x-www-form-urlencoded' in self.headers.get('Content-Type', ''):
+            for name, values in parse_qs(body.decode('utf8'), keep_blank_values=True).items():
+                params.setdefault(name, []).extend(values)
+        parts = url.path.strip('/').split('/')
+        fake_solr = self.server.fake_solr
+        fake_solr.wait()
+        if len(parts) < 2 or parts[-1] not in ('select', 'export'):
+            self._send(404, {'error': {'msg': 'Unknown request handler {0}'.format(url.path), 'code': 404}})
+        elif parts[-1] == 'export' and fake_solr.export_fail_after is not None:
+            self._send_broken_export(fake_solr.export_response(parts[-2], params), fake_solr.export_fail_after)
+        elif parts[-1] == 'export':
+            self._send(200, fake_solr.export_response(parts[-2], params))
+        else:
+            self._send(200, fake_solr.select_response(parts[-2], params))
+
+    def _send(self, status: int, data: dict):
+        content = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_broken_export(self, data: dict, doc_count: int):
+        """
+        Send the start of an export response, up to the end of the first doc_count documents, and close the
+        connection, like a Solr node that fails during an export
+        """
+        content = json.dumps(data)
+        docs = data['response']['docs']
+        end = content.index(json.dumps(docs[doc_count])) if doc_count < len(docs) else len(content) - 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(content[:end].encode('utf8'))
+        self.close_connection = True
+
+
+def _first(params: dict, name: str, default):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def _is_on(params: dict, name: str):
+    return _first(params, name, 'false').lower() in ('true', 'on')
+
+
+def _split_list(params: dict, name: str):
+    names = []
+    for value in params.get(name, []):
+        names.extend(n.strip() for n in value.split(',') if n.strip())
+    return names
+
+
+class FakeSolr:
+    """
+    :param schema: sample values of the fields of each core, as {core name: {field name: [values]}}. Document n gets
+        value n of each list, modulo the length of the list. Fields that are not in the schema get a generated text
+        value.
+    :param latency: seconds to wait before answering each request
+    :param jitter: up to this many seconds are added to the latency at random
+    :param num_found: number of documents that match every search
+    :param export_rows: number of documents returned by the export handler
+    :param export_fail_after: if set, the export handler closes the connection after sending this many documents
+    """
+
+    def __init__(self, schema=None, latency=0.0, jitter=0.0, num_found=DEFAULT_NUM_FOUND,
+                 export_rows=DEFAULT_EXPORT_ROWS, export_fail_after=None, host='127.0.0.1', port=0):
+        self.schema = schema or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.num_found = num_found
+        self.export_rows = export_rows
+        self.export_fail_after = export_fail_after
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}/solr'.format(host, port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer((self.host, self.port), FakeSolrHandler)
+        self._server.fake_solr = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def wait(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter > 0 else 0)
+        if delay > 0:
+            sleep(delay)
+
+    def create_doc(self, core_name: str, doc_id: str, n: int, field_names: list):
+        samples = self.schema.get(core_name, {})
+        doc = {}
+        for name in field_names:
+            if name == 'id':
+                doc['id'] = doc_id
+            elif name in samples:
+                doc[name] = samples[name][n % len(samples[name])]
+            elif name not in ('*', 'score'):
+                doc[name] = '{0} {1}'.format(name, n)
+        return doc
+
+    def _field_names(self, core_name: str, params: dict):
+        return _split_list(params, 'fl') or ['id'] + list(self.schema.get(core_name, {}))
+
+    def facet_counts(self, core_name: str, params: dict):
+        samples = self.schema.get(core_name, {})
+        facet_fields = {}
+        for facet in params.get('facet.field', []):
+            field_name = _LOCAL_PARAMS.sub('', facet)
+            limit = int(_first(params, 'f.{0}.facet.limit'.format(field_name),
+                               _first(params, 'facet.limit', DEFAULT_FACET_LIMIT)))
+            values = []
+            for value in samples.get(field_name, ['{0} {1}'.format(field_name, i) for i in range(10)]):
+                for item in value if isinstance(value, list) else [value]:
+                    if str(item) not in values:
+                        values.append(str(item))
+            if limit >= 0:
+                values = values[:limit]
+            counts = []
+            for i, value in enumerate(values):
+                counts.extend([value, max(1, self.num_found // (i + 2))])
+            facet_fields[field_name] = counts
+        return {'facet_queries': {}, 'facet_fields': facet_fields, 'facet_ranges': {}, 'facet_intervals': {},
+                'facet_heatmaps': {}}
+
+    def highlighting(self, docs: list, params: dict):
+        pre = _first(params, 'hl.tag.pre', _first(params, 'hl.simple.pre', '<em>'))
+        post = _first(params, 'hl.tag.post', _first(params, 'hl.simple.post', '</em>'))
+        hl_fields = _split_list(params, 'hl.fl')
+        highlights = {}
+        for doc in docs:
+            snippets = {}
+            for field_name in hl_fields:
+                if isinstance(doc.get(field_name), str):
+                    snippets[field_name] = ['{0}{1}{2}'.format(pre, doc[field_name], post)]
+                    if len(snippets) == 3:
+                        break
+            highlights[doc['id']] = snippets
+        return highlights
+
+    def select_response(self, core_name: str, params: dict):
+        start = int(_first(params, 'start', 0))
+        rows = int(_first(params, 'rows', 10))
+        # The fake cursors are the position of the next document
+        cursor = _first(params, 'cursorMark', None)
+        if cursor is not None:
+            start = 0 if cursor == '*' else int(cursor.split('-')[1])
+        field_names = self._field_names(core_name, params)
+        q = _first(params, 'q', '*')
+        doc_ids = [quoted.replace('\\"', '"').replace('\\\\', '\\') if quoted else bare
+                   for quoted, bare in _ID_QUERY.findall(q)]
+        for id_list in _ID_LIST_QUERY.findall(q):
+            doc_ids.extend(quoted.replace('\\"', '"').replace('\\\\', '\\') for quoted in _QUOTED.findall(id_list))
+        for fq in params.get('fq', []):
+            terms = _ID_TERMS_FILTER.match(fq)
+            if terms:
+                doc_ids.extend(doc_id for doc_id in terms.group(1).split(',') if doc_id)
+        if doc_ids:
+            # A record, More Like This or RAMP title query
+            docs = [self.create_doc(core_name, doc_id, zlib.crc32(doc_id.encode('utf8')), field_names)
+                    for doc_id in doc_ids]
+            num_found = len(docs)
+        else:
+            num_found = self.num_found
+            docs = [self.create_doc(core_name, '{0}-{1}'.format(core_name, n), n, field_names)
+                    for n in range(start, min(start + rows, num_found))]
+        data = {
+            'responseHeader': {'status': 0, 'QTime': 0, 'params': {}},
+            'response': {'numFound': num_found, 'start': start, 'docs': docs},
+        }
+        if cursor is not None:
+            end = start + len(docs)
+            data['response']['start'] = 0
+            data['nextCursorMark'] = cursor if end >= num_found else 'cursor-{0}'.format(end)
+        if _is_on(params, 'facet'):
+            data['facet_counts'] = self.facet_counts(core_name, params)
+        if _is_on(params, 'hl'):
+            data['highlighting'] = self.highlighting(docs, params)
+        if _is_on(params, 'mlt'):
+            mlt_count = int(_first(params, 'mlt.count', 5))
+            data['moreLikeThis'] = {}
+            for doc in docs:
+                similar = [self.create_doc(core_name, '{0}-similar-{1}'.format(doc['id'], n), n, field_names)
+                           for n in range(mlt_count)]
+                data['moreLikeThis'][doc['id']] = {'numFound': self.num_found, 'start': 0, 'docs': similar}
+        return data
+
+    def export_response(self, core_name: str, params: dict):
+        field_names = self._field_names(core_name, params)
+        docs = [self.create_doc(core_name, '{0}-{1}'.format(core_name, n), n, field_names)
+                for n in range(self.export_rows)]
+        return {'responseHeader': {'status': 0, 'QTime': 0}, 'response': {'numFound': len(docs), 'docs': docs}}
@@ -0,0 +1,274 @@
+"""
+Drive a weighted mix of search URLs through the Django views and measure the latency of each route.
+
+The URLs are the kinds of requests seen on the live site: plain and full text searches, facet combinations, deep
+result pages, records, similar records, exports and RAMP maps. Each worker thread has its own test client and sends
+the requests in turn, so the concurrency is the number of requests in progress at once, like the number of uWSGI
+workers. Solr is replaced by a FakeSolr server for the duration of the run.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+from django.test import Client, override_settings
+from math import ceil
+import random
+from search.loadtest.fake_solr import DEFAULT_EXPORT_ROWS, DEFAULT_NUM_FOUND, FakeSolr
+from search.models import Search, Field, Code
+import tempfile
+import threading
+from time import perf_counter
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+# Relative frequency of each kind of request
+ROUTE_WEIGHTS = OrderedDict([
+    ('search', 25),
+    ('search_text', 15),
+    ('facets', 25),
+    ('deep_page', 8),
+    ('record', 12),
+    ('similar', 5),
+    ('export', 5),
+    ('ramp', 5),
+])
+
+SEARCH_WORDS = ['contract', 'services', 'travel', 'office', 'consulting', 'construction', 'software', 'Ottawa',
+                'training', 'research', '"professional services"', '"real property"', '2019', 'health', 'fisheries']
+
+
+class LoadTestUrl(NamedTuple):
+    route: str
+    path: str
+    host: str
+
+
+class Sample(NamedTuple):
+    route: str
+    seconds: float
+    error: str
+
+
+class RouteSummary(NamedTuple):
+    route: str
+    requests: int
+    errors: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    first_error: str
+
+
+def create_schema(search: Search, fields: list, codes: dict):
+    """
+    Create the FakeSolr sample values for the fields of a search.
+    :param codes: the code IDs of each coded field
+    """
+    samples = {}
+    for field in fields:
+        if field.solr_field_is_coded and codes.get(field.field_id):
+            values = list(codes[field.field_id])
+        elif field.solr_field_type == 'pdate':
+            values = ['20{0:02d}-{1:02d}-{2:02d}T00:00:00Z'.format(15 + i % 6, i % 12 + 1, i % 28 + 1)
+                      for i in range(24)]
+        elif field.solr_field_type == 'pint':
+            values = [i * 7 for i in range(24)]
+        elif field.solr_field_type == 'pfloat':
+            values = [round(i * 1234.56, 2) for i in range(24)]
+        else:
+            values = ['{0} {1}'.format(field.label_en, i) for i in range(24)]
+        if field.solr_field_multivalued:
+            values = [[value] for value in values]
+        samples[field.field_id] = values
+    schema = {search.solr_core_name: samples}
+    if hasattr(settings, 'OPEN_DATA_CORE'):
+        schema[settings.OPEN_DATA_CORE] = {
+            'title_en_s': ['Open data map {0}'.format(i) for i in range(24)],
+            'title_fr_s': ['Carte de données ouvertes {0}'.format(i) for i in range(24)],
+        }
+    return schema
+
+
+def _host(lang: str):
+    if settings.SEARCH_LANG_USE_PATH:
+        return 'testserver'
+    return settings.SEARCH_FR_HOSTNAME if lang == 'fr' else settings.SEARCH_EN_HOSTNAME
+
+
+def _search_path(lang: str, search_id: str, suffix=''):
+    if settings.SEARCH_LANG_USE_PATH:
+        return '/search/{0}/{1}/{2}'.format(lang, search_id, suffix)
+    return '/{0}{1}/{2}'.format(settings.SEARCH_HOST_PATH, search_id, suffix)
+
+
+def _ramp_path(lang: str, keys: str):
+    map_path = 'carteouverte' if lang == 'fr' else 'openmap'
+    if settings.SEARCH_LANG_USE_PATH:
+        return '/{0}/{1}/{2}'.format(map_path, lang, keys)
+    return '/{0}{1}/{2}'.format(settings.SEARCH_HOST_PATH, map_path, keys)
+
+
+def _ramp_enabled():
+    return 'ramp' in settings.INSTALLED_APPS and hasattr(settings, 'OPEN_DATA_CORE')
+
+
+def create_url_mix(search: Search, schema: dict, facets: list, count: int, langs=('en', 'fr'), seed=0,
+                   num_found=DEFAULT_NUM_FOUND):
+    """
+    Create a random but repeatable list of request URLs for one search.
+    :param facets: the IDs of the facet fields of the search
+    """
+    rng = random.Random(seed)
+    samples = schema[search.solr_core_name]
+    routes = [r for r in ROUTE_WEIGHTS if r != 'ramp' or _ramp_enabled()]
+    if not search.mlt_enabled:
+        routes.remove('similar')
+    weights = [ROUTE_WEIGHTS[r] for r in routes]
+    pages = int(ceil(num_found / search.results_page_size))
+
+    def facet_filters():
+        params = OrderedDict()
+        for facet in rng.sample(facets, min(len(facets), rng.randint(1, 3))):
+            values = [str(v[0] if isinstance(v, list) else v) for v in samples[facet]]
+            params[facet] = '|'.join(rng.sample(values, min(len(values), rng.randint(1, 2))))
+        if rng.random() < 0.3:
+            params['search_text'] = rng.choice(SEARCH_WORDS)
+        return params
+
+    urls = []
+    for route in rng.choices(routes, weights, k=count):
+        lang = rng.choice(langs)
+        params = OrderedDict()
+        if route == 'search':
+            path = _search_path(lang, search.search_id)
+        elif route == 'search_text':
+            path = _search_path(lang, search.search_id)
+            params['search_text'] = ' '.join(rng.sample(SEARCH_WORDS, rng.randint(1, 3)))
+        elif route == 'facets':
+            path = _search_path(lang, search.search_id)
+            params = facet_filters() if facets else params
+            sort_order = search.results_sort_order_fr if lang == 'fr' else search.results_sort_order_en
+            if rng.random() < 0.3:
+                params['sort'] = rng.choice(sort_order.split(','))
+        elif route == 'deep_page':
+            path = _search_path(lang, search.search_id)
+            params['page'] = rng.randint(min(50, pages), pages)
+        elif route == 'record':
+            path = _search_path(lang, search.search_id, 'record/{0}-{1}'.format(search.solr_core_name,
+                                                                                 rng.randrange(num_found)))
+        elif route == 'similar':
+            path = _search_path(lang, search.search_id, '{0}/{1}-{2}'.format(
+                'similaire' if lang == 'fr' else 'similar', search.solr_core_name, rng.randrange(num_found)))
+        elif route == 'export':
+            path = _search_path(lang, search.search_id, 'export/')
+            if facets and rng.random() < 0.7:
+                params = facet_filters()
+        else:
+            keys = ','.join('{0:08x}-{1:04x}-4{2:03x}-a{3:03x}-{4:012x}'.format(
+                rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(12), rng.getrandbits(12), rng.getrandbits(48))
+                for _ in range(rng.randint(1, 3)))
+            path = _ramp_path(lang, keys)
+        if params:
+            path = '{0}?{1}'.format(path, urlencode(params))
+        urls.append(LoadTestUrl(route, path, _host(lang)))
+    return urls
+
+
+def send_requests(urls: list, concurrency: int):
+    """
+    Send the requests from concurrent worker threads.
+    :return: a Sample for each request, and the elapsed time in seconds
+    """
+    pending = iter(urls)
+    pending_lock = threading.Lock()
+    samples = []
+
+    def worker():
+        client = Client()
+        try:
+            while True:
+                with pending_lock:
+                    url = next(pending, None)
+                if url is None:
+                    return
+                error = ''
+                start = perf_counter()
+                try:
+                    response = client.get(url.path, HTTP_HOST=url.host)
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+                    response.close()
+                    if response.status_code >= 400:
+                        error = 'HTTP {0} from {1}'.format(response.status_code, url.path)
+                except Exception as ex:
+                    error = '{0}: {1} from {2}'.format(type(ex).__name__, ex, url.path)
+                samples.append(Sample(url.route, perf_counter() - start, error))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, name='loadtest-{0}'.format(i), daemon=True) for i in range(concurrency)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, perf_counter() - start
+
+
+def percentile(sorted_values: list, fraction: float):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, int(ceil(fraction * len(sorted_values))) - 1)]
+
+
+def summarize(samples: list, elapsed: float):
+    """
+    :return: a RouteSummary for each route, followed by one for all of the requests. Latencies are in milliseconds.
+    """
+    by_route = OrderedDict((route, []) for route in ROUTE_WEIGHTS)
+    for sample in samples:
+        by_route.setdefault(sample.route, []).append(sample)
+    by_route['all'] = samples
+    summaries = []
+    for route, route_samples in by_route.items():
+        if not route_samples:
+            continue
+        latencies = sorted(s.seconds * 1000 for s in route_samples)
+        errors = [s.error for s in route_samples if s.error]
+        summaries.append(RouteSummary(route, len(route_samples), len(errors), len(route_samples) / elapsed,
+                                      percentile(latencies, 0.5), percentile(latencies, 0.95),
+                                      percentile(latencies, 0.99), errors[0] if errors else ''))
+    return summaries
+
+
+def run_load_test(search_id: str, requests: int, concurrency: int, latency=0.0, jitter=0.0, langs=('en', 'fr'),
+                  seed=0, export_rows=DEFAULT_EXPORT_ROWS):
+    """
+    Run a load test of one search against a FakeSolr server.
+    :return: the RouteSummary list from summarize()
+    """
+    search = Search.objects.get(search_id=search_id)
+    fields = list(Field.objects.filter(search_id=search))
+    codes = {}
+    for code in Code.objects.filter(field_id__search_id=search).select_related('field_id'):
+        codes.setdefault(code.field_id.field_id, []).append(code.code_id)
+    facets = [f.field_id for f in fields if f.is_search_facet]
+    schema = create_schema(search, fields, codes)
+    urls = create_url_mix(search, schema, facets, requests, langs, seed)
+
+    hosts = list(settings.ALLOWED_HOSTS) + ['testserver', settings.SEARCH_EN_HOSTNAME, settings.SEARCH_FR_HOSTNAME]
+    with FakeSolr(schema, latency, jitter, export_rows=export_rows) as fake_solr, \
+            tempfile.TemporaryDirectory(prefix='loadtest_exports_') as export_dir, \
+            override_settings(SOLR_SERVER_URL=fake_solr.url,
+                              OPEN_DATA_SOLR_SERVER_URL=fake_solr.url,
+                              ALLOWED_HOSTS=hosts,
+                              # Keep the fake results and files out of the shared caches
+                              SEARCH_RESULT_CACHE_ALIAS='',
+                              EXPORT_FILE_CACHE_DIR=export_dir,
+                              EXPORT_FILE_CACHE_URL=''):
+        samples, elapsed = send_requests(urls, concurrency)
+    return summarize(samples, elapsed)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+import os
+from search.export import iter_csv_blocks, stream_solr_export
+from search.export_cache import get_export_cache
+from search.full_export import full_export_path, remove_full_exports, write_full_export
+from search.models import Search
+from search.plugin_registry import get_plugin_hooks
+from search.views import ExportView
+import time
+
+
+class Command(BaseCommand):
+    help = 'Export every record of a search in each language to a compressed file, which the export view serves ' \
+           'for unfiltered exports. import_data_csv runs it after each load when EXPORT_FULL_ON_IMPORT is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', type=str, help='The Search ID', required=True)
+        parser.add_argument('--lang', type=str, required=False, default='en,fr',
+                            help='Comma separated list of the languages to export')
+
+    def handle(self, *args, **options):
+        try:
+            search = Search.objects.get(search_id=options['search'])
+        except Search.DoesNotExist:
+            raise CommandError("Search {0} does not exist".format(options['search']))
+        langs = [lang.strip() for lang in options['lang'].split(',') if lang.strip() in ('en', 'fr')]
+        if not langs:
+            raise CommandError("--lang must include en or fr")
+
+        view = ExportView()
+        if search.search_id not in view.searches:
+            raise CommandError("Search {0} is not loaded".format(options['search']))
+        export_cache = get_export_cache()
+        if get_plugin_hooks(search.search_id).post_export_solr_query:
+            # The export view never serves full exports for these searches
+            remove_full_exports(export_cache, search.search_id)
+            self.stdout.write("Search {0} has a post_export_solr_query plugin hook, which needs the whole Solr "
+                              "response, so its exports are not pre-built".format(search.search_id))
+            return
+        for lang in langs:
+            # The same query as an export request without any search terms or filters
+            request = RequestFactory().get('/search/{0}/{1}/export'.format(lang, search.search_id))
+            request.LANGUAGE_CODE = lang
+            solr_query, _ = view.export_query(request, search.search_id, lang)
+            field_names = solr_query['fl'].split(',') if isinstance(solr_query['fl'], str) else list(solr_query['fl'])
+            path = full_export_path(export_cache, search.search_id, lang, solr_query)
+
+            start = time.perf_counter()
+            rows = 0
+
+            def count_rows(docs):
+                nonlocal rows
+                for doc in docs:
+                    rows += 1
+                    yield doc
+
+            write_full_export(export_cache, path, iter_csv_blocks(count_rows(
+                stream_solr_export(search.solr_core_name, solr_query)), field_names))
+            remove_full_exports(export_cache, search.search_id, lang, keep=path)
+            self.stdout.write("Exported {0} records to {1} ({2} bytes) in {3:.1f}s".format(
+                rows, path, os.path.getsize(path), time.perf_counter() - start))
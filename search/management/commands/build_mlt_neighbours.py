@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+import itertools
+import multiprocessing
+import os
+from search.export import stream_solr_export
+from search.mlt_store import NeighbourStoreWriter, find_neighbours, init_worker
+from search.models import Search
+from search.query import mlt_params
+from search.registry import get_configuration
+import time
+
+
+class Command(BaseCommand):
+    help = 'Find the similar records of every record of a More Like This search, and save them for the similar ' \
+           'records pages. Run it after import_data_csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', type=str, help='The Search ID', required=True)
+        parser.add_argument('--lang', type=str, required=False, default='en,fr',
+                            help='Comma separated list of the languages to find similar records for')
+        parser.add_argument('--batch_size', type=int, required=False, default=100,
+                            help='Number of records in each More Like This query')
+        parser.add_argument('--workers', type=int, required=False, default=0,
+                            help='Number of worker processes. Defaults to the number of CPUs')
+
+    def handle(self, *args, **options):
+        try:
+            search = Search.objects.get(search_id=options['search'])
+        except Search.DoesNotExist:
+            raise CommandError("Search {0} does not exist".format(options['search']))
+        if not search.mlt_enabled:
+            raise CommandError("More Like This is not enabled for search {0}".format(options['search']))
+        langs = [lang.strip() for lang in options['lang'].split(',') if lang.strip() in ('en', 'fr')]
+        if not langs:
+            raise CommandError("--lang must include en or fr")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch_size must be at least 1")
+
+        config = get_configuration()
+        lang_mlt_params = {}
+        for lang in langs:
+            plan = config.query_plans_fr[search.search_id] if lang == 'fr' else config.query_plans_en[search.search_id]
+            lang_mlt_params[lang] = mlt_params(search, plan)
+
+        record_ids = (doc['id'] for doc in stream_solr_export(search.solr_core_name,
+                                                              {'q': '*:*', 'fl': 'id', 'sort': 'id asc'}))
+        batches = iter(lambda: list(itertools.islice(record_ids, options['batch_size'])), [])
+        workers = options['workers'] or os.cpu_count()
+
+        start = time.perf_counter()
+        total = 0
+        done = 0
+        with NeighbourStoreWriter(search.search_id) as writer, \
+                multiprocessing.Pool(workers, initializer=init_worker,
+                                     initargs=(search.solr_core_name, lang_mlt_params)) as pool:
+            for results in pool.imap_unordered(find_neighbours, batches):
+                for lang, neighbours in results.items():
+                    writer.add(lang, neighbours)
+                total += len(next(iter(results.values())))
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write("{0} records processed".format(total))
+        self.stdout.write("Saved the similar records of {0} records in {1:.1f} seconds".format(
+            total, time.perf_counter() - start))
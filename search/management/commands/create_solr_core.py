@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from search.models import Search, Field
-from SolrClient import SolrClient
+from search.registry import invalidate_configuration
+from search.solr_connections import get_solr_client
 import logging
 
 # Custom Solr schema definition for English search text
@@ -76,13 +77,15 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--search', help='Unique Search model identifier', type=str)
+        parser.add_argument('--core', type=str, required=False, default='',
+                            help='Create the schema in this Solr core instead of the core of the search')
 
     def handle(self, *args, **options):
         try:
             search_id = options['search']
             search_target = Search.objects.get(search_id=search_id)
-            solr_core = search_target.solr_core_name
-            solr = SolrClient(settings.SOLR_SERVER_URL)
+            solr_core = options['core'] or search_target.solr_core_name
+            solr = get_solr_client()
 
             # create custom Solr field types if necessary
             if not solr.schema.does_field_type_exist(solr_core, 'search_text_en'):
@@ -190,6 +193,9 @@ class Command(BaseCommand):
                              "docValues": True}
                 self._add_or_update_solr_field(solr, solr_core, new_field)
 
+            # The copy field lists of the Field models were updated
+            invalidate_configuration()
+
         except Exception as x:
             self.logger.error('Unexpected Error "{0}"'.format(x))
 
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from search.models import Search, Field, Code
+from search.registry import invalidate_configuration
 import logging
 
 
@@ -17,5 +18,6 @@ class Command(BaseCommand):
         try:
             search = Search.objects.get(search_id=options['search_id'])
             search.delete()
+            invalidate_configuration()
         except Exception as x:
             self.logger.error(x)
@@ -2,6 +2,7 @@ import csv
 from django.core.management.base import BaseCommand
 from pathlib import Path
 from search.models import Search, Field
+from search.registry import invalidate_configuration
 
 import logging
 
@@ -43,6 +44,7 @@ class Command(BaseCommand):
                         field.solr_field_type = 'string'
                         field.save()
                         self.logger.info (fn)
+                invalidate_configuration()
             except Exception as x:
                 self.logger.error("Unexpected Error: {0}".format(x))
             self.logger.info("Imported file {0}".format(options['csv_file']))
@@ -1,16 +1,28 @@
-from babel.dates import format_date
-from babel.numbers import format_currency, format_decimal, parse_decimal
-from datetime import datetime
+from collections import deque
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.conf import settings
-import importlib
-import pkgutil
+import itertools
+import multiprocessing
+import os
+import queue
 from search.models import Search, Field, Code
-import search.plugins
+from search.core_admin import HttpCoreAdmin, create_shadow_core, missing_schema_fields, swap_shadow_core, \
+    unload_old_core, verify_shadow_core
+from search.export_cache import get_export_cache
+from search.formatters import cache_stats, describe_cache_stats, merge_cache_stats
+from search.full_export import remove_full_exports
+from search.ingest import RecordTransformer, UnknownFieldError, init_worker, transform_chunk
+from search.plugin_registry import describe_hook_stats, hook_stats, merge_hook_stats
+from search.manifest import ImportManifest, id_delete_query, record_hash
+from search.mlt_store import remove_store
+from search.result_cache import invalidate_core_results
+from search.solr_connections import get_solr_client
 from SolrClient import SolrClient
 from SolrClient.exceptions import ConnectionError
 import csv
 import logging
+import threading
 import time
 
 
@@ -32,11 +44,8 @@ class Command(BaseCommand):
     # Number of rows to commit to Solr at a time
     cycle_on = 1000
 
-    discovered_plugins = {
-            name: importlib.import_module(name)
-            for finder, name, ispkg
-            in pkgutil.iter_modules(search.plugins.__path__, search.plugins.__name__ + ".")
-        }
+    # Number of removed documents to delete from Solr with one query in delta mode
+    delete_batch_size = 500
 
     def add_arguments(self, parser):
         parser.add_argument('--search', type=str, help='The Search ID that is being loaded', required=True)
@@ -44,31 +53,35 @@ class Command(BaseCommand):
         parser.add_argument('--nothing_to_report', required=False,  action='store_true', default=False,
                             help='Use this switch to indicate if the CSV files that is being loaded contains '
                                  '"Nothing To Report" data')
-
-    def set_empty_fields(self, solr_record: dict):
-
-        for sf in self.all_fields:
-            if (sf.field_id not in solr_record and sf != 'default_fmt') or solr_record[sf.field_id] == '':
-                if sf.default_export_value:
-                    default_fmt = sf.default_export_value.split('|')
-                    if default_fmt[0] in ['str', 'date']:
-                        solr_record[sf.field_id] = str(default_fmt[1])
-                    elif default_fmt[0] == 'int':
-                        solr_record[sf.field_id] = int(default_fmt[1])
-                    elif default_fmt[0] == 'float':
-                        solr_record[sf.field_id] = float(default_fmt[1])
-                    else:
-                        solr_record[sf.field_id] = ''
-        return solr_record
+        parser.add_argument('--pipeline', required=False, action='store_true', default=False,
+                            help='Convert the CSV rows in parallel worker processes and index them in Solr with '
+                                 'several concurrent threads. Rows with the same ID are always indexed by the same '
+                                 'thread, in order, so the last one wins as in the serial import. Cannot be used '
+                                 'with --delta')
+        parser.add_argument('--workers', type=int, required=False, default=0,
+                            help='Number of worker processes for --pipeline. Defaults to the number of CPUs')
+        parser.add_argument('--index_threads', type=int, required=False, default=4,
+                            help='Number of concurrent Solr indexing threads for --pipeline')
+        parser.add_argument('--delta', required=False, action='store_true', default=False,
+                            help='Only index the records that are new or changed since the last delta import, and '
+                                 'delete the records that have been removed. The core is not purged. If there is '
+                                 'no manifest from an earlier delta import, all records are reloaded. A full import '
+                                 'purges the whole core, so it removes the manifests of both the default and the '
+                                 'Nothing To Report records')
+        parser.add_argument('--swap', required=False, action='store_true', default=False,
+                            help='Load the records into a new shadow core, then swap it with the live core. Searches '
+                                 'keep using the old data until the new core is complete. The new core is only loaded '
+                                 'from the default CSV file, so --swap is refused for searches with Nothing To Report '
+                                 'fields. The swap is also refused if the new core has more than '
+                                 'SOLR_SWAP_MAX_SHRINK fewer documents than the live core')
+        parser.add_argument('--dry_run', required=False, action='store_true', default=False,
+                            help='With --swap, load and verify the shadow core but do not swap it in')
 
     def handle(self, *args, **options):
 
-        total = 0
-        cycle = 0
-
         try:
             # Retrieve the Search  and Field models from the database
-            solr = SolrClient(settings.SOLR_SERVER_URL)
+            solr = get_solr_client()
             try:
                 self.search_target = Search.objects.get(search_id=options['search'])
                 self.solr_core = self.search_target.solr_core_name
@@ -94,165 +107,330 @@ class Command(BaseCommand):
             except Field.DoesNotExist as x1:
                 self.logger.error('Fields not found for search: "{0}"'.format(x1))
 
-            # Process the records in the CSV file one at a time
+            if options['pipeline'] and options['delta']:
+                self.logger.error('--delta only sends the changed records to Solr, so it cannot be used with '
+                                  '--pipeline')
+                exit(-1)
+            if options['swap']:
+                if options['nothing_to_report'] or options['delta']:
+                    self.logger.error('--swap rebuilds the whole core, so it cannot be used with --nothing_to_report '
+                                      'or --delta')
+                    exit(-1)
+                if Field.objects.filter(search_id=self.search_target, alt_format='NTR').exists():
+                    self.logger.error('Search {0} has Nothing To Report records, which --swap would drop because the '
+                                      'new core is only loaded from the default CSV file'.format(options['search']))
+                    exit(-1)
+                core_admin = HttpCoreAdmin()
+                live_core = self.solr_core
+                self.solr_core = self.create_shadow_core(core_admin, options['search'])
+
             with open(options['csv'], 'r', encoding='utf-8-sig', errors="ignore") as csv_file:
                 csv_reader = csv.DictReader(csv_file, dialect='excel')
-                solr_items = []
-                for csv_record in csv_reader:
-
-                    # Clear out the Solr core. on the first line
-                    if total == 0 and not options['nothing_to_report']:
-                        solr.delete_doc_by_query(self.solr_core, "*:*")
-                        print("Purging all records")
-                    elif total == 0 and options['nothing_to_report']:
-                        solr.delete_doc_by_query(self.solr_core, "format:NTR")
-                        solr.commit(self.solr_core, softCommit=True)
-                        print("Purging NTR records")
-                    total += 1
-                    cycle += 1
-
-                    # Call plugins if they exist for this search type. This is where a developer can introduce
-                    # code to customize the data that is loaded into Solr for a particular search.
-                    search_type_plugin = 'search.plugins.{0}'.format(options['search'])
-                    if search_type_plugin in self.discovered_plugins:
-                        include, filtered_record = self.discovered_plugins[search_type_plugin].filter_csv_record(csv_record, self.search_target, self.csv_fields, self.field_codes, 'NTR' if options['nothing_to_report'] else '')
-                        if not include:
-                            continue
-                        else:
-                            csv_record = filtered_record
-                    # Create a dictionary for each record loaded into  Solr
-                    solr_record = {'format': 'NTR' if options['nothing_to_report'] else 'DEFAULT'}
-                    for csv_field in csv_reader.fieldnames:
-                        # Verify that it is a known field
-                        if csv_field not in self.csv_fields and csv_field not in ('owner_org_title', 'owner_org'):
-                            self.logger.error("CSV files contains unknown field: {0}".format(csv_field))
-                            exit(-1)
-                        if csv_field == 'owner_org_title':
-                            continue
-
-                        # Handle multi-valued fields here
-                        if self.csv_fields[csv_field].solr_field_multivalued:
-                            solr_record[csv_field] = csv_record[csv_field].split(',')
-                            # Copy fields fo report cannot use multi-values - so directly populate with original string
-                            if self.csv_fields[csv_field].solr_field_export:
-                                for extra_field in self.csv_fields[csv_field].solr_field_export.split(','):
-                                    solr_record[extra_field] = csv_record[csv_field]
-                        else:
-                            solr_record[csv_field] = csv_record[csv_field]
-
-                        # Automatically expand out dates and numbers for use with Solr export handler
-                        if self.csv_fields[csv_field].solr_field_type == 'pdate':
-                            try:
-                                if csv_record[csv_field]:
-                                    csv_date = datetime.strptime(csv_record[csv_field], '%Y-%m-%d')
-                                    solr_record[csv_field + '_en'] = format_date(csv_date, locale='en')
-                                    solr_record[csv_field + '_fr'] = format_date(csv_date, locale='fr')
-                                    if self.csv_fields[csv_field].is_default_year:
-                                        solr_record['year'] = csv_date.year
-                                    if self.csv_fields[csv_field].is_default_month:
-                                        solr_record['month'] = csv_date.month
-                                else:
-                                    solr_record[csv_field + '_en'] = ''
-                                    solr_record[csv_field + '_fr'] = ''
-                            except ValueError as x2:
-                                self.logger.error('Invalid date: "{0}"'.format(x2))
-                                solr_record[csv_field] = ''
-                                continue
-                        elif self.csv_fields[csv_field].solr_field_type in ['pint', 'pfloat']:
-                            if solr_record[csv_field]:
-                                if solr_record[csv_field] == '.':
-                                    solr_record[csv_field] = "0"
-                                csv_decimal = parse_decimal(solr_record[csv_field], locale='en_US')
-                                if self.csv_fields[csv_field].solr_field_is_currency:
-                                    solr_record[csv_field + '_en'] = format_currency(csv_decimal, 'CAD', locale='en_CA')
-                                    solr_record[csv_field + '_fr'] = format_currency(csv_decimal, 'CAD', locale='fr_CA')
-                                else:
-                                    solr_record[csv_field + '_en'] = format_decimal(csv_decimal, locale='en_CA')
-                                    solr_record[csv_field + '_fr'] = format_decimal(csv_decimal, locale='fr_CA')
-                            else:
-                                solr_record[csv_field + '_en'] = ''
-                                solr_record[csv_field + '_fr'] = ''
-
-                        # Lookup the expanded code value from the codes dict of dict
-                        if csv_field in self.field_codes:
-                            if csv_record[csv_field]:
-
-                                if self.csv_fields[csv_field].solr_field_multivalued:
-                                    codes_en = []
-                                    codes_fr = []
-                                    for code_value in csv_record[csv_field].split(","):
-                                        if code_value.lower() in self.field_codes[csv_field]:
-                                            codes_en.append(self.field_codes[csv_field][code_value.lower()].label_en)
-                                            codes_fr.append(self.field_codes[csv_field][code_value.lower()].label_fr)
-                                        else:
-                                            self.logger.info("Unknown code value: {0} for field: {1}".format(code_value, csv_field))
-                                    solr_record[csv_field + '_en'] = codes_en
-                                    solr_record[csv_field + '_fr'] = codes_fr
-                                else:
-                                    if csv_record[csv_field].lower() in self.field_codes[csv_field]:
-                                        solr_record[csv_field + '_en'] = self.field_codes[csv_field][csv_record[csv_field].lower()].label_en
-                                        solr_record[csv_field + '_fr'] = self.field_codes[csv_field][csv_record[csv_field].lower()].label_fr
-                                    else:
-                                        self.logger.info("Unknown code value: {0} for field: {1}".format(csv_record[csv_field],
-                                                                                                         csv_field))
-                    solr_record = self.set_empty_fields(solr_record)
-                    # Set the Solr ID field (Nothing To Report records are excluded)
-                    if not options['nothing_to_report']:
-                        if self.search_target.id_fields:
-                            id_values = []
-                            for id_field in self.search_target.id_fields.split(","):
-                                id_values.append(csv_record[id_field])
-                            solr_record['id'] = ",".join(id_values)
+                transformer = RecordTransformer(self.search_target, self.csv_fields, self.all_fields,
+                                                self.field_codes, csv_reader.fieldnames or [],
+                                                options['nothing_to_report'])
+                manifest = ImportManifest(options['search'], 'NTR' if options['nothing_to_report'] else 'DEFAULT')
+                content_hashes = None
+                if options['delta']:
+                    total, content_hashes = self.delta_import(solr, csv_reader, transformer, manifest, options)
+                    format_stats, plugin_stats = cache_stats(), hook_stats()
+                else:
+                    # A full import may load different data, so the manifest of the last delta import is obsolete
+                    manifest.remove()
+                    if options['pipeline']:
+                        total, format_stats, plugin_stats = self.pipeline_import(solr, csv_reader, transformer,
+                                                                                 options)
                     else:
+                        total = self.serial_import(solr, csv_reader, transformer, options)
+                        format_stats, plugin_stats = cache_stats(), hook_stats()
 
-                        if 'month' in solr_record:
-                            solr_record['id'] = "{0}-{1}-{2}".format(solr_record['owner_org'], solr_record['year'], solr_record['month'])
-                        elif 'quarter' in solr_record:
-                            solr_record['id'] = "{0}-{1}-{2}".format(solr_record['owner_org'], solr_record['year'],
-                                                                     solr_record['quarter'])
-
-                    # Call plugins if they exist for this search type. This is where a developer can introduce
-                    # code to customize the data that is loaded into Solr for a particular search.
-                    if search_type_plugin in self.discovered_plugins:
-                        solr_record = self.discovered_plugins[search_type_plugin].load_csv_record(csv_record, solr_record, self.search_target, self.csv_fields, self.field_codes, 'NTR' if options['nothing_to_report'] else '')
-
-                    solr_items.append(solr_record)
-
-                    # Write to Solr whenever the cycle threshold is reached
-                    if cycle >= self.cycle_on:
-                        # try to connect to Solr up to 10 times
-                        for countdown in reversed(range(10)):
-                            try:
-                                solr.index(self.solr_core, solr_items)
-                                print("{0} rows processed".format(total))
-                                cycle = 0
-                                solr_items.clear()
-                                break
-                            except ConnectionError as cex:
-                                if not countdown:
-                                    raise
-                                print("Solr error: {0}. Waiting to try again ... {1}".format(cex, countdown))
-                                time.sleep((10 - countdown) * 5)
-
-                # Write and remaining records to Solr and commit
-                if cycle > 0:
-                    # try to connect to Solr up to 10 times
-                    for countdown in reversed(range(10)):
-                        try:
-                            solr.index(self.solr_core, solr_items)
-                            total += len(solr_items)
-                            print("{0} rows processed".format(cycle))
-                            cycle = 0
-                            solr_items.clear()
-                            break
-                        except ConnectionError as cex:
-                            if not countdown:
-                                raise
-                            print("Solr error: {0}. Waiting to try again ... {1}".format(cex, countdown))
-                            time.sleep((10 - countdown) * 5)
-
-                solr.commit(self.solr_core, softCommit=True, waitSearcher=True)
+                if options['swap']:
+                    # The shadow core is loaded without intermediate commits, so make it durable before the swap
+                    solr.commit(self.solr_core, openSearcher=True, waitSearcher=True)
+                else:
+                    solr.commit(self.solr_core, softCommit=True, waitSearcher=True)
+                if content_hashes is not None:
+                    manifest.save(content_hashes)
                 print("Total rows processed: {0}".format(total))
+                print(describe_cache_stats(format_stats))
+                if transformer.hooks.plugin_name:
+                    print(describe_hook_stats(plugin_stats))
+
+                if options['swap']:
+                    swapped = self.swap_shadow_core(core_admin, live_core, self.solr_core, options['dry_run'])
+                    self.solr_core = live_core
+                    if not swapped:
+                        return
+                invalidate_core_results(self.solr_core)
+                get_export_cache().invalidate(options['search'])
+                # The full exports of the old data must not be served while the new ones are built, or if they fail
+                remove_full_exports(get_export_cache(), options['search'])
+                if settings.EXPORT_FULL_ON_IMPORT:
+                    call_command('build_full_exports', search=options['search'])
+                remove_store(options['search'])
+                if settings.MLT_BUILD_ON_IMPORT and self.search_target.mlt_enabled:
+                    call_command('build_mlt_neighbours', search=options['search'])
 
         except Exception as x:
             self.logger.error('Unexpected Error "{0}"'.format(x))
+
+    def create_shadow_core(self, core_admin: HttpCoreAdmin, search_id: str):
+        shadow_core = create_shadow_core(core_admin, self.solr_core, settings.SOLR_SHADOW_CONFIG_SET)
+        call_command('create_solr_core', search=search_id, core=shadow_core)
+        # create_solr_core logs its errors instead of raising them, so check that the schema is complete
+        missing_fields = missing_schema_fields(core_admin, shadow_core, [f.field_id for f in self.all_fields])
+        if missing_fields:
+            self.logger.error("The schema of the new core {0} is missing the fields {1}. No records were "
+                              "loaded".format(shadow_core, ", ".join(missing_fields)))
+            unload_old_core(core_admin, self.solr_core, shadow_core)
+            exit(-1)
+        print("Created shadow core {0} in {1}".format(shadow_core, core_admin.instance_dir(shadow_core)))
+        return shadow_core
+
+    def swap_shadow_core(self, core_admin: HttpCoreAdmin, live_core: str, shadow_core: str, dry_run: bool):
+        live_count, shadow_count, error = verify_shadow_core(core_admin, live_core, shadow_core,
+                                                             settings.SOLR_SWAP_MAX_SHRINK)
+        print("{0} documents in {1}, {2} documents in {3}".format(live_count, live_core, shadow_count, shadow_core))
+        if error:
+            self.logger.error("{0}. The cores were not swapped".format(error))
+            exit(-1)
+        if dry_run:
+            print("Dry run: the cores were not swapped. {0} is left for inspection".format(shadow_core))
+            return False
+        swap_shadow_core(core_admin, live_core, shadow_core)
+        print("Swapped {0} into {1}".format(shadow_core, live_core))
+        return True
+
+    def purge_core(self, solr: SolrClient, nothing_to_report: bool):
+        if not nothing_to_report:
+            solr.delete_doc_by_query(self.solr_core, "*:*")
+            # The Nothing To Report records are deleted too, so a later NTR delta import must reload all of them
+            for record_format in ('DEFAULT', 'NTR'):
+                ImportManifest(self.search_target.search_id, record_format).remove()
+            print("Purging all records")
+        else:
+            solr.delete_doc_by_query(self.solr_core, "format:NTR")
+            solr.commit(self.solr_core, softCommit=True)
+            print("Purging NTR records")
+
+    def index_items(self, solr: SolrClient, solr_items: list):
+        # try to connect to Solr up to 10 times
+        for countdown in reversed(range(10)):
+            try:
+                solr.index(self.solr_core, solr_items)
+                break
+            except ConnectionError as cex:
+                if not countdown:
+                    raise
+                print("Solr error: {0}. Waiting to try again ... {1}".format(cex, countdown))
+                time.sleep((10 - countdown) * 5)
+
+    def serial_import(self, solr: SolrClient, csv_reader: csv.DictReader, transformer: RecordTransformer,
+                      options: dict):
+        """
+        Process the records in the CSV file one at a time
+        """
+        total = 0
+        cycle = 0
+        solr_items = []
+        for csv_record in csv_reader:
+
+            # Clear out the Solr core. on the first line
+            if total == 0:
+                self.purge_core(solr, options['nothing_to_report'])
+            total += 1
+            cycle += 1
+
+            try:
+                solr_record = transformer.transform(csv_record)
+            except UnknownFieldError as x:
+                self.logger.error("CSV files contains unknown field: {0}".format(x))
+                exit(-1)
+            if solr_record is None:
+                continue
+            solr_items.append(solr_record)
+
+            # Write to Solr whenever the cycle threshold is reached
+            if cycle >= self.cycle_on:
+                self.index_items(solr, solr_items)
+                print("{0} rows processed".format(total))
+                cycle = 0
+                solr_items.clear()
+
+        # Write and remaining records to Solr
+        if cycle > 0:
+            self.index_items(solr, solr_items)
+            total += len(solr_items)
+            print("{0} rows processed".format(cycle))
+        return total
+
+    def delta_import(self, solr: SolrClient, csv_reader: csv.DictReader, transformer: RecordTransformer,
+                     manifest: ImportManifest, options: dict):
+        """
+        Compare a hash of each converted record with the manifest of the last delta import, index only the new and
+        changed records, and delete the records whose IDs are no longer in the CSV file.
+        :return: the number of rows read and the new content hashes for the manifest
+        """
+        if not options['nothing_to_report'] and not self.search_target.id_fields:
+            print("Search {0} has no ID fields, so all records will be reloaded".format(options['search']))
+            manifest.remove()
+            return self.serial_import(solr, csv_reader, transformer, options), None
+
+        previous_hashes = manifest.load()
+        if previous_hashes is None:
+            print("No manifest from an earlier delta import was found, so all records will be reloaded")
+        content_hashes = {}
+        total = 0
+        indexed = 0
+        unchanged = 0
+        solr_items = []
+        for csv_record in csv_reader:
+
+            # Without a manifest, clear out the Solr core on the first line like a full import
+            if total == 0 and previous_hashes is None:
+                self.purge_core(solr, options['nothing_to_report'])
+            total += 1
+
+            try:
+                solr_record = transformer.transform(csv_record)
+            except UnknownFieldError as x:
+                self.logger.error("CSV files contains unknown field: {0}".format(x))
+                exit(-1)
+            if solr_record is None:
+                continue
+
+            if 'id' in solr_record:
+                doc_id = str(solr_record['id'])
+                content_hash = record_hash(solr_record)
+                content_hashes[doc_id] = content_hash
+                if previous_hashes is not None and previous_hashes.get(doc_id) == content_hash:
+                    unchanged += 1
+                    continue
+            solr_items.append(solr_record)
+
+            if len(solr_items) >= self.cycle_on:
+                self.index_items(solr, solr_items)
+                indexed += len(solr_items)
+                print("{0} rows processed, {1} records indexed".format(total, indexed))
+                solr_items.clear()
+
+        if solr_items:
+            self.index_items(solr, solr_items)
+            indexed += len(solr_items)
+
+        removed_ids = []
+        if previous_hashes is not None:
+            removed_ids = [doc_id for doc_id in previous_hashes if doc_id not in content_hashes]
+            for i in range(0, len(removed_ids), self.delete_batch_size):
+                solr.delete_doc_by_query(self.solr_core, id_delete_query(removed_ids[i:i + self.delete_batch_size]))
+        print("{0} records indexed, {1} unchanged, {2} deleted".format(indexed, unchanged, len(removed_ids)))
+        return total, content_hashes
+
+    def pipeline_import(self, solr: SolrClient, csv_reader: csv.DictReader, transformer: RecordTransformer,
+                        options: dict):
+        """
+        Convert chunks of CSV rows in a pool of worker processes while several threads send the converted batches to
+        Solr. The rows are batched in the same order and at the same points as the serial import, so the totals and
+        the purge behaviour are the same. Each batch is split between the threads by document ID.
+        """
+        unknown_fields = transformer.unknown_fields()
+        if unknown_fields:
+            self.logger.error("CSV files contains unknown field: {0}".format(unknown_fields[0]))
+            exit(-1)
+
+        index_threads = max(options['index_threads'], 1)
+        workers = options['workers'] or os.cpu_count()
+        # Each indexing thread has its own queue
+        thread_batches = [queue.Queue(maxsize=2) for _ in range(index_threads)]
+        errors = []
+
+        def index_worker(batches: queue.Queue):
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                rows_read, batch_items = batch
+                # After a failure the remaining batches are discarded
+                if errors:
+                    continue
+                try:
+                    self.index_items(solr, batch_items)
+                    if rows_read:
+                        print("{0} rows processed".format(rows_read))
+                except Exception as x:
+                    errors.append(x)
+
+        def put_batch(rows_read: int, batch_items: list):
+            # Split the batch between the threads by ID. The rows with the same ID always go to the same thread, which
+            # indexes its batches in order, so the last row wins as it does in the serial import.
+            parts = [[] for _ in thread_batches]
+            for n, solr_record in enumerate(batch_items):
+                doc_id = solr_record.get('id')
+                parts[(n if doc_id is None else hash(str(doc_id))) % len(parts)].append(solr_record)
+            for batches, part in zip(thread_batches, parts):
+                if part:
+                    batches.put((rows_read, part))
+                    # Only report the progress once per batch
+                    rows_read = 0
+
+        indexers = [threading.Thread(target=index_worker, args=(batches,), name='solr-index-{0}'.format(i),
+                                     daemon=True)
+                    for i, batches in enumerate(thread_batches)]
+        total = 0
+        rows_read = 0
+        cycle = 0
+        solr_items = []
+
+        worker_stats = {}
+        worker_hook_stats = {}
+
+        def collect(result):
+            # Filtered rows count towards the batch size, exactly as they do in the serial import
+            nonlocal rows_read, cycle, solr_items
+            solr_records, worker_pid, worker_stats[worker_pid], worker_hook_stats[worker_pid] = result
+            for solr_record in solr_records:
+                rows_read += 1
+                cycle += 1
+                if solr_record is None:
+                    continue
+                solr_items.append(solr_record)
+                if cycle >= self.cycle_on:
+                    if errors:
+                        raise errors[0]
+                    put_batch(rows_read, solr_items)
+                    cycle = 0
+                    solr_items = []
+
+        pending = deque()
+        chunks = iter(lambda: list(itertools.islice(csv_reader, self.cycle_on)), [])
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(transformer,)) as pool:
+            try:
+                for chunk in chunks:
+                    if total == 0:
+                        # Clear out the Solr core before any of the new records are indexed
+                        self.purge_core(solr, options['nothing_to_report'])
+                        for indexer in indexers:
+                            indexer.start()
+                    total += len(chunk)
+                    pending.append(pool.apply_async(transform_chunk, (chunk,)))
+                    # Limit the number of converted chunks waiting for the indexing threads
+                    if len(pending) >= workers * 2:
+                        collect(pending.popleft().get())
+                while pending:
+                    collect(pending.popleft().get())
+            finally:
+                started = [(indexer, batches) for indexer, batches in zip(indexers, thread_batches)
+                           if indexer.is_alive()]
+                for indexer, batches in started:
+                    batches.put(None)
+                for indexer, batches in started:
+                    indexer.join()
+        if errors:
+            raise errors[0]
+
+        # Write and remaining records to Solr
+        if cycle > 0:
+            self.index_items(solr, solr_items)
+            total += len(solr_items)
+            print("{0} rows processed".format(cycle))
+        return total, merge_cache_stats(worker_stats.values()), merge_hook_stats(worker_hook_stats.values())
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand, CommandError
 from pathlib import Path
 import json
 from search.models import Code, Field, Search
+from search.registry import invalidate_configuration
 import logging
 
 
@@ -29,6 +30,7 @@ class Command(BaseCommand):
                         code.label_en = owner_org_titles[0].strip()
                         code.label_fr = owner_org_titles[1].strip()
                         code.save()
+                invalidate_configuration()
             except Exception as x:
                 self.logger.error(x)
             self.logger.info("Imported file {0}".format(options['org_file']))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from pathlib import Path
 from search.models import Search, Field, Code
+from search.registry import invalidate_configuration
 from yaml import load, FullLoader
 try:
     from yaml import CLoader as Loader
@@ -171,6 +172,8 @@ class Command(BaseCommand):
                     # Always add a format field.
                     self.add_format_field(search)
 
+                invalidate_configuration()
+
             except Exception as x:
                 self.logger.error("Unexpected Error: {0}".format(x))
             self.logger.info("Imported file {0}".format(options['yaml_file']))
@@ -3,6 +3,7 @@ from import_export import resources
 from distutils.dir_util import copy_tree
 from search.admin import SearchResource, FieldResource, CodeResource
 from search.models import Search, Field, Code
+from search.registry import invalidate_configuration
 from django.core.management.base import BaseCommand, CommandError
 import logging
 from os import path, mkdir
@@ -128,6 +129,8 @@ class Command(BaseCommand):
                     if not result.has_errors():
                         logging.info("Imported Code models")
 
+            invalidate_configuration()
+
         # Copy custom snippets. The convention is for templates to be deployed to : BASE_DIr/templates/snippets/<search ID>/
         BASE_DIR = Path(__file__).resolve().parent.parent.parent
         custom_template_dir = path.join(BASE_DIR, 'templates', 'snippets', 'custom', options['search'])
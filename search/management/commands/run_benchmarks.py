@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+from search.benchmarks.suite import compare, load_baseline, run_benchmarks, save_baseline
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmarks',
+                                'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Run the search microbenchmarks and compare the results with a saved baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', type=str, required=False, default='',
+                            help='Only run the benchmarks whose name contains this text')
+        parser.add_argument('--min_time', type=float, required=False, default=0.5,
+                            help='Minimum number of seconds to run each benchmark')
+        parser.add_argument('--baseline', type=str, required=False, default=DEFAULT_BASELINE,
+                            help='JSON file with the baseline results')
+        parser.add_argument('--save_baseline', required=False, action='store_true', default=False,
+                            help='Save the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, required=False, default=0.2,
+                            help='Report a regression when a benchmark is slower than the baseline by more than '
+                                 'this fraction')
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options['baseline'])
+        results = run_benchmarks(options['filter'], options['min_time'])
+        regressions = []
+        self.stdout.write("{0:<28} {1:>14} {2:>12} {3:>10}".format('benchmark', 'ops/sec', 'peak bytes', 'change'))
+        for result in results:
+            change, regressed = compare(result, baseline, options['tolerance'])
+            self.stdout.write("{0:<28} {1:>14,.1f} {2:>12,} {3:>10}{4}".format(
+                result.name, result.ops_per_sec, result.peak_bytes,
+                '' if change is None else '{0:+.1%}'.format(change), '  REGRESSION' if regressed else ''))
+            if regressed:
+                regressions.append(result.name)
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], results)
+            self.stdout.write("Saved the baseline to {0}".format(options['baseline']))
+        elif regressions:
+            raise CommandError("Slower than the baseline: {0}".format(", ".join(regressions)))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from search.benchmarks.highlighting import compare_strategies
+from search.models import Search
+
+
+class Command(BaseCommand):
+    help = 'Compare the Solr query time of the highlighting strategies on the Solr core of a search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', type=str, help='The Search ID', required=True)
+        parser.add_argument('--lang', type=str, required=False, default='en', choices=['en', 'fr'],
+                            help='Language of the search queries')
+        parser.add_argument('--search_text', type=str, required=False, default='',
+                            help='Comma separated list of search texts. Defaults to the load test search words')
+        parser.add_argument('--runs', type=int, required=False, default=5,
+                            help='Number of times each query is sent with each strategy')
+
+    def handle(self, *args, **options):
+        try:
+            search = Search.objects.get(search_id=options['search'])
+        except Search.DoesNotExist:
+            raise CommandError("Search {0} does not exist".format(options['search']))
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1")
+        search_texts = [t.strip() for t in options['search_text'].split(',') if t.strip()]
+
+        results = compare_strategies(search, options['lang'], search_texts, options['runs'])
+        self.stdout.write("{0:<18} {1:>8} {2:>12} {3:>12} {4:>12} {5:>14}".format(
+            'strategy', 'queries', 'QTime p50', 'QTime p95', 'wall p50', 'bytes/query'))
+        for result in results:
+            self.stdout.write("{0:<18} {1:>8} {2:>12.1f} {3:>12.1f} {4:>12.1f} {5:>14,}".format(
+                result.name, result.queries, result.qtime_p50, result.qtime_p95, result.wall_p50,
+                result.response_bytes))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from search.loadtest.harness import run_load_test
+from search.models import Search
+
+
+class Command(BaseCommand):
+    help = 'Load test the search pages of a search against a fake Solr server and report the latency of each route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', type=str, help='The Search ID to load test', required=True)
+        parser.add_argument('--requests', type=int, required=False, default=1000,
+                            help='Total number of requests to send')
+        parser.add_argument('--concurrency', type=int, required=False, default=4,
+                            help='Number of requests in progress at once')
+        parser.add_argument('--latency', type=float, required=False, default=0.02,
+                            help='Seconds the fake Solr server waits before answering each query')
+        parser.add_argument('--jitter', type=float, required=False, default=0.01,
+                            help='Up to this many seconds are added to the latency at random')
+        parser.add_argument('--lang', type=str, required=False, default='en,fr',
+                            help='Comma separated list of the languages of the requests')
+        parser.add_argument('--export_rows', type=int, required=False, default=1000,
+                            help='Number of rows in each export')
+        parser.add_argument('--seed', type=int, required=False, default=0,
+                            help='Seed for the random mix of requests. The same seed sends the same requests')
+
+    def handle(self, *args, **options):
+        if not Search.objects.filter(search_id=options['search']).exists():
+            raise CommandError("Search {0} does not exist".format(options['search']))
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        langs = [lang.strip() for lang in options['lang'].split(',') if lang.strip() in ('en', 'fr')]
+        if not langs:
+            raise CommandError("--lang must include en or fr")
+
+        summaries = run_load_test(options['search'], options['requests'], options['concurrency'],
+                                  latency=options['latency'], jitter=options['jitter'], langs=langs,
+                                  seed=options['seed'], export_rows=options['export_rows'])
+
+        self.stdout.write("{0:<12} {1:>9} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9}".format(
+            'route', 'requests', 'errors', 'req/sec', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for summary in summaries:
+            self.stdout.write("{0:<12} {1:>9} {2:>7} {3:>9.1f} {4:>9.1f} {5:>9.1f} {6:>9.1f}".format(
+                summary.route, summary.requests, summary.errors, summary.throughput, summary.p50, summary.p95,
+                summary.p99))
+        for summary in summaries:
+            if summary.first_error and summary.route != 'all':
+                self.stderr.write("{0}: {1}".format(summary.route, summary.first_error))
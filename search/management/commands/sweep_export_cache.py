@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from search.export_cache import get_export_cache
+import logging
+
+
+class Command(BaseCommand):
+    help = 'Remove expired and least recently used files from the export file cache'
+
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', type=str, required=False, default='',
+                            help='Remove all of the cached export files for this Search ID instead')
+
+    def handle(self, *args, **options):
+        export_cache = get_export_cache()
+        if options['search']:
+            removed = export_cache.invalidate(options['search'])
+            self.stdout.write("Removed {0} cached exports for {1}".format(removed, options['search']))
+        else:
+            removed, freed = export_cache.sweep()
+            self.stdout.write("Removed {0} files, freed {1} bytes".format(removed, freed))
@@ -0,0 +1,68 @@
+"""
+Manifests of the documents loaded into a Solr core, used by the delta mode of import_data_csv.
+
+A manifest records the ID and a hash of the content of every document from the last delta import of a search, with
+a separate manifest for the default and the Nothing To Report records. Comparing the next CSV file against it tells
+the importer which documents are new or changed and which have been removed, so only those are sent to Solr.
+Manifests are gzipped CSV files in the IMPORT_MANIFEST_DIR directory.
+"""
+import csv
+from django.conf import settings
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+
+def record_hash(solr_record: dict):
+    return hashlib.sha1(json.dumps(solr_record, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+
+def id_delete_query(doc_ids):
+    """
+    Create a Solr query that matches all of the given document IDs.
+    """
+    quoted_ids = ['"{0}"'.format(doc_id.replace('\\', '\\\\').replace('"', '\\"')) for doc_id in doc_ids]
+    return "id:({0})".format(" OR ".join(quoted_ids))
+
+
+class ImportManifest:
+
+    def __init__(self, search_id: str, record_format: str):
+        self.search_id = search_id
+        self.record_format = record_format
+
+    @property
+    def path(self):
+        return os.path.join(settings.IMPORT_MANIFEST_DIR,
+                            "{0}_{1}.csv.gz".format(self.search_id, self.record_format))
+
+    def load(self):
+        """
+        :return: a dictionary of document IDs and content hashes, or None if there is no manifest
+        """
+        try:
+            with gzip.open(self.path, 'rt', newline='', encoding='utf8') as manifest_file:
+                return {row[0]: row[1] for row in csv.reader(manifest_file)}
+        except FileNotFoundError:
+            return None
+
+    def save(self, hashes: dict):
+        os.makedirs(settings.IMPORT_MANIFEST_DIR, exist_ok=True)
+        temp_path = "{0}.{1}.tmp".format(self.path, uuid.uuid4().hex)
+        try:
+            with gzip.open(temp_path, 'wt', newline='', encoding='utf8') as manifest_file:
+                manifest_writer = csv.writer(manifest_file)
+                for doc_id, content_hash in hashes.items():
+                    manifest_writer.writerow([doc_id, content_hash])
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,180 @@
+"""
+Precomputed More Like This neighbours.
+
+More Like This is one of the most expensive Solr queries. The build_mlt_neighbours command runs it for every document
+of a search after the data is imported, and saves the IDs of the similar records of each document, in each language,
+in a small SQLite file per search in MLT_STORE_DIR. The similar records page then looks up the IDs in the file and
+fetches those documents from Solr by ID, which takes the same short time for every record. Records that are not in the
+file, for example records added since the file was built, use the live More Like This query. import_data_csv removes
+the file after each load, because the similar records may have changed, and builds it again when MLT_BUILD_ON_IMPORT
+is set.
+
+The file is built under a temporary name and renamed into place, so the web workers never read a partial file, and
+reopen it when it is replaced.
+"""
+from django.conf import settings
+import json
+import os
+import sqlite3
+from search.solr_connections import get_solr_client
+from SolrClient import SolrResponse
+import threading
+import uuid
+
+
+def store_path(search_id: str):
+    return os.path.join(settings.MLT_STORE_DIR, "{0}.sqlite3".format(search_id))
+
+
+def remove_store(search_id: str):
+    """
+    Remove the neighbours file of a search, so that its similar records pages use the live query until it is built
+    again. Workers that have the file open notice that it is gone on their next lookup.
+    """
+    try:
+        os.remove(store_path(search_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def id_query(record_ids):
+    """
+    A query for the documents with the given IDs. Record IDs may contain commas, so the terms parser cannot be used.
+    """
+    return "id:({0})".format(" OR ".join('"{0}"'.format(i.replace('\\', '\\\\').replace('"', '\\"'))
+                                         for i in record_ids))
+
+
+class NeighbourStoreWriter:
+
+    def __init__(self, search_id: str):
+        self.path = store_path(search_id)
+        self.temp_path = "{0}.{1}.tmp".format(self.path, uuid.uuid4().hex)
+        self.connection = None
+
+    def __enter__(self):
+        os.makedirs(settings.MLT_STORE_DIR, exist_ok=True)
+        self.connection = sqlite3.connect(self.temp_path)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE neighbours (lang TEXT, id TEXT, similar TEXT, PRIMARY KEY (lang, id)) "
+                                "WITHOUT ROWID")
+        return self
+
+    def add(self, lang: str, neighbours: dict):
+        """
+        :param neighbours: the list of similar record IDs of each record ID
+        """
+        self.connection.executemany("INSERT OR REPLACE INTO neighbours VALUES (?, ?, ?)",
+                                    ((lang, record_id, json.dumps(similar)) for record_id, similar in neighbours.items()))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.connection.commit()
+            self.connection.close()
+            if exc_type is None:
+                os.replace(self.temp_path, self.path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+
+class NeighbourStore:
+    """
+    Reads the neighbours file of one search. Each thread has its own read-only connection.
+    """
+
+    def __init__(self, search_id: str):
+        self.path = store_path(search_id)
+        self._local = threading.local()
+
+    def _connection(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        version = (os.getpid(), stat.st_ino, stat.st_mtime_ns)
+        if getattr(self._local, 'version', None) != version:
+            if getattr(self._local, 'connection', None) is not None and self._local.version[0] == os.getpid():
+                self._local.connection.close()
+            self._local.connection = sqlite3.connect('file:{0}?mode=ro'.format(self.path), uri=True)
+            self._local.version = version
+        return self._local.connection
+
+    def lookup(self, record_id: str, lang: str):
+        """
+        :return: the IDs of the records similar to a record, or None if the record is not in the store
+        """
+        connection = self._connection()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT similar FROM neighbours WHERE lang = ? AND id = ?",
+                                 (lang, record_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_neighbour_store(search_id: str):
+    store = _stores.get(search_id)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(search_id, NeighbourStore(search_id))
+    return store
+
+
+def neighbour_query(record_id: str, neighbours: list, field_list):
+    """
+    The query for a record and its stored similar records
+    """
+    return {'q': id_query([record_id] + neighbours), 'fl': field_list, 'rows': len(neighbours) + 1}
+
+
+def neighbour_response(record_id: str, neighbours: list, solr_response: SolrResponse):
+    """
+    Arrange the documents of a neighbour_query like the response of the live More Like This query, so that the plugins
+    and the page do not depend on where the similar records come from.
+    :return: a SolrResponse, or None if the record is no longer in Solr
+    """
+    docs = {doc['id']: doc for doc in solr_response.docs}
+    if record_id not in docs:
+        return None
+    similar_docs = [docs[i] for i in neighbours if i in docs and i != record_id]
+    return SolrResponse({
+        'responseHeader': solr_response.header,
+        'response': {'numFound': 1, 'start': 0, 'docs': [docs[record_id]]},
+        'moreLikeThis': {record_id: {'numFound': len(similar_docs), 'start': 0, 'docs': similar_docs}},
+    })
+
+
+# The Solr core and the More Like This parameters of each language, set in each worker process by the pool initializer
+_worker_core = None
+_worker_mlt_params = None
+
+
+def init_worker(core_name: str, lang_mlt_params: dict):
+    global _worker_core, _worker_mlt_params
+    _worker_core = core_name
+    _worker_mlt_params = lang_mlt_params
+
+
+def find_neighbours(record_ids: list):
+    """
+    Run the More Like This query for a batch of records in a worker process. Solr finds the similar records of every
+    document in the results, so each language needs one query per batch.
+    :return: {lang: {record ID: [similar record IDs]}}
+    """
+    solr = get_solr_client()
+    results = {}
+    for lang, params in _worker_mlt_params.items():
+        solr_query = {'q': id_query(record_ids), 'fl': 'id', 'rows': len(record_ids)}
+        solr_query.update(params)
+        solr_response = solr.query(_worker_core, solr_query)
+        similar = solr_response.data.get('moreLikeThis', {})
+        results[lang] = {record_id: [doc['id'] for doc in similar.get(record_id, {}).get('docs', [])]
+                         for record_id in record_ids}
+    return results
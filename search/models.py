@@ -63,6 +63,23 @@ class Search(models.Model):
                                       help_text="Indicate if the this search will be using Solr's 'More Like This' functionality")
     mlt_items = models.IntegerField(blank=True, default=10, verbose_name="No. Items returned for More-Like-This",
                                     help_text="Number of itemsto show on the More-Like-This search results page. Default is 10")
+    HIGHLIGHT_METHODS = [
+        ('unified', 'Unified'),
+        ('original', 'Original'),
+        ('none', 'No highlighting'),
+    ]
+    highlight_method = models.CharField(blank=False, choices=HIGHLIGHT_METHODS, default='unified', max_length=20,
+                                        verbose_name="Highlighter",
+                                        help_text="Solr highlighter for the search terms in the search results. The "
+                                                  "unified highlighter is much quicker than the original one")
+    highlight_snippets = models.IntegerField(blank=False, default=3, validators=[MinValueValidator(1)],
+                                             verbose_name="Highlighted snippets per field")
+    highlight_max_fields = models.IntegerField(blank=False, default=0, validators=[MinValueValidator(0)],
+                                               verbose_name="Maximum highlighted fields",
+                                               help_text="Only highlight the first fields of the search. 0 highlights "
+                                                         "every text and string field")
+    highlight_browse = models.BooleanField(blank=True, default=False, verbose_name="Highlight browse queries",
+                                           help_text="Also ask Solr for highlighting when there are no search terms")
 
     def __str__(self):
         return '%s (%s)' % (self.label_en, self.search_id)
@@ -0,0 +1,63 @@
+"""
+Back navigation between the search, record and similar records pages.
+
+The "Back to search" and "Back to record" buttons need the search results page that the visitor came from. Rather than
+keeping it in the session, which writes a session file for every anonymous visitor and makes the pages uncacheable,
+the record page takes it from the Referer header, and passes it on to the similar records page in a signed URL
+parameter. The signature stops the parameter from being used to send visitors to another site.
+"""
+from django.core import signing
+from django.http import HttpRequest
+from urllib.parse import quote, urlencode, urlsplit
+
+BACK_PARAM = 'back'
+_SALT = 'search.navigation.back'
+
+
+def sign_back_url(url: str):
+    return signing.dumps(url, salt=_SALT, compress=True)
+
+
+def unsign_back_url(token: str):
+    """
+    :return: the URL in a signed token, or an empty string if the token is missing or has been tampered with
+    """
+    if not token:
+        return ''
+    try:
+        return signing.loads(token, salt=_SALT)
+    except signing.BadSignature:
+        return ''
+
+
+def same_site_referer(request: HttpRequest):
+    referer = request.META.get('HTTP_REFERER', '')
+    parts = urlsplit(referer)
+    if parts.scheme in ('http', 'https') and parts.netloc == request.get_host():
+        return referer
+    return ''
+
+
+def search_back_url(request: HttpRequest, search_type: str):
+    """
+    The search results page to go back to from a record: the signed URL in the back parameter, or the referring
+    page if it is a page of the same search.
+    """
+    url = unsign_back_url(request.GET.get(BACK_PARAM, ''))
+    if not url:
+        referer = same_site_referer(request)
+        if urlsplit(referer).path.endswith('/{0}/'.format(search_type)):
+            url = referer
+    return url
+
+
+def back_query(back_url: str):
+    """
+    The query string that passes a back URL on to the next page
+    """
+    return urlencode({BACK_PARAM: sign_back_url(back_url)}) if back_url else ''
+
+
+def record_url(parent_path: str, record_id: str, query=''):
+    url = '{0}record/{1}'.format(parent_path, quote(record_id))
+    return '{0}?{1}'.format(url, query) if query else url
@@ -0,0 +1,66 @@
+"""
+Deep paging of the search results with Solr cursors.
+
+For a page deep in the results, Solr has to collect and sort every document up to the end of that page, so the deep
+pages that crawlers walk through are very slow. A Solr cursor (cursorMark) instead marks where the previous page ended,
+and fetching the page after it costs the same as fetching the first page.
+
+Every search page that has a cursor is fetched with it, and the cursor that Solr returns for the following page is
+kept in the results cache under the query and page number. Page 1 always has a cursor, so visitors and crawlers
+following the next page links get cheap pages all the way down. Beyond SEARCH_CURSOR_PAGING_DEPTH, the pagination only
+links to the neighbouring pages, which are the pages that can have a cursor. A page without a cached cursor, for
+example a bookmarked deep page, still uses start and rows.
+"""
+from django.conf import settings
+from search.result_cache import get_cached, result_cache_key, set_cached
+from SolrClient import SolrResponse
+
+FIRST_CURSOR = '*'
+# Cursors need a sort that is unique for every document
+SORT_TIEBREAK = 'id asc'
+
+
+def cursor_paging_enabled():
+    return settings.SEARCH_CURSOR_PAGING_DEPTH > 0
+
+
+def add_sort_tiebreak(solr_query: dict):
+    """
+    Sort documents that are equal in the requested sort order by ID. Every page uses the same sort, with or without a
+    cursor, so that moving between the two kinds of pages never skips or repeats a document.
+    """
+    sort = solr_query.get('sort', 'score desc')
+    if not any(s.strip().split(' ')[0] == 'id' for s in sort.split(',')):
+        solr_query['sort'] = "{0}, {1}".format(sort, SORT_TIEBREAK)
+
+
+def cursor_key(core_name: str, solr_query: dict, lang: str, page: int):
+    query = {k: v for k, v in solr_query.items() if k not in ('start', 'cursorMark')}
+    query['page'] = page
+    return result_cache_key(core_name, query, lang, prefix='cursor')
+
+
+def get_cursor(core_name: str, solr_query: dict, lang: str, page: int):
+    """
+    :return: the cursor of a page of results, or None if it is not known
+    """
+    if page == 1:
+        return FIRST_CURSOR
+    return get_cached(cursor_key(core_name, solr_query, lang, page))
+
+
+def use_cursor(solr_query: dict, cursor: str):
+    solr_query['cursorMark'] = cursor
+    solr_query['start'] = 0
+
+
+def save_next_cursor(key: str, solr_query: dict, solr_response: SolrResponse):
+    """
+    Keep the cursor of the page that follows a page fetched with a cursor. At the end of the results Solr returns the
+    same cursor again, and there is no next page to keep it for.
+    :param key: the cursor_key of the next page, calculated before the query because SolrClient changes the query
+    """
+    cursor = solr_query.get('cursorMark')
+    next_cursor = solr_response.data.get('nextCursorMark')
+    if cursor and next_cursor and next_cursor != cursor:
+        set_cached(key, next_cursor)
@@ -0,0 +1,189 @@
+"""
+Process-wide registry of the search plugins.
+
+A search can customize its queries and its CSV imports with a plugin module named after the search in the
+search.plugins package, with the same hooks as search/plugins/default.py. The registry imports a plugin once per
+process, the first time its search is used, and resolves its hooks into a PluginHooks dispatch table. Hooks that the
+plugin does not define, or that are unchanged copies of the no-op hooks in default.py, are None in the table, so the
+callers skip them without building the argument list. Every call of the other hooks is counted and timed.
+"""
+import importlib
+import pkgutil
+import search.plugins
+import threading
+from time import perf_counter
+from typing import Callable, NamedTuple, Optional
+
+HOOK_NAMES = (
+    'pre_search_solr_query',
+    'post_search_solr_query',
+    'pre_record_solr_query',
+    'post_record_solr_query',
+    'pre_export_solr_query',
+    'post_export_solr_query',
+    'pre_mlt_solr_query',
+    'post_mlt_solr_query',
+    'filter_csv_record',
+    'load_csv_record',
+)
+
+
+class PluginHooks(NamedTuple):
+    plugin_name: str
+    pre_search_solr_query: Optional[Callable]
+    post_search_solr_query: Optional[Callable]
+    pre_record_solr_query: Optional[Callable]
+    post_record_solr_query: Optional[Callable]
+    pre_export_solr_query: Optional[Callable]
+    post_export_solr_query: Optional[Callable]
+    pre_mlt_solr_query: Optional[Callable]
+    post_mlt_solr_query: Optional[Callable]
+    filter_csv_record: Optional[Callable]
+    load_csv_record: Optional[Callable]
+
+
+NO_HOOKS = PluginHooks('', *([None] * len(HOOK_NAMES)))
+
+# (plugin name, hook name): [calls, seconds]
+_hook_stats = {}
+_stats_lock = threading.Lock()
+
+
+def is_noop_hook(func, default_func):
+    """
+    A hook is a no-op if it is the default hook, or compiles to the same code, like a copy of default.py.
+    """
+    if func is default_func:
+        return True
+    code, default_code = getattr(func, '__code__', None), getattr(default_func, '__code__', None)
+    if code is None or default_code is None:
+        return False
+    return (code.co_code, code.co_consts, code.co_names) == \
+        (default_code.co_code, default_code.co_consts, default_code.co_names)
+
+
+def _timed_hook(plugin_name: str, hook_name: str, func):
+    key = (plugin_name, hook_name)
+    with _stats_lock:
+        stats = _hook_stats.setdefault(key, [0, 0.0])
+
+    def call_hook(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            with _stats_lock:
+                stats[0] += 1
+                stats[1] += elapsed
+
+    return call_hook
+
+
+def create_plugin_hooks(plugin_name: str, plugin, defaults):
+    """
+    Create the dispatch table of a plugin module.
+    :param defaults: the module with the no-op hooks
+    """
+    hooks = []
+    for hook_name in HOOK_NAMES:
+        func = getattr(plugin, hook_name, None)
+        if func is None or is_noop_hook(func, getattr(defaults, hook_name, None)):
+            hooks.append(None)
+        else:
+            hooks.append(_timed_hook(plugin_name, hook_name, func))
+    return PluginHooks(plugin_name, *hooks)
+
+
+class PluginRegistry:
+
+    def __init__(self, package=search.plugins):
+        self.package = package
+        self._plugin_names = None
+        self._hooks = {}
+        self._lock = threading.Lock()
+
+    def plugin_names(self):
+        if self._plugin_names is None:
+            prefix = self.package.__name__ + '.'
+            self._plugin_names = frozenset(name for finder, name, ispkg
+                                           in pkgutil.iter_modules(self.package.__path__, prefix))
+        return self._plugin_names
+
+    def get_hooks(self, search_id: str):
+        hooks = self._hooks.get(search_id)
+        if hooks is None:
+            with self._lock:
+                hooks = self._hooks.get(search_id)
+                if hooks is None:
+                    hooks = self._load(search_id)
+                    self._hooks[search_id] = hooks
+        return hooks
+
+    def _load(self, search_id: str):
+        plugin_name = '{0}.{1}'.format(self.package.__name__, search_id)
+        if search_id == 'default' or plugin_name not in self.plugin_names():
+            return NO_HOOKS
+        defaults = importlib.import_module(self.package.__name__ + '.default')
+        return create_plugin_hooks(plugin_name, importlib.import_module(plugin_name), defaults)
+
+
+plugin_registry = PluginRegistry()
+
+
+def get_plugin_hooks(search_id: str):
+    """
+    The dispatch table of the plugin for a search, or NO_HOOKS if the search has no plugin.
+    """
+    return plugin_registry.get_hooks(search_id)
+
+
+def hook_stats():
+    """
+    :return: a dictionary of the (calls, seconds) of each (plugin, hook) in this process
+    """
+    with _stats_lock:
+        return {key: tuple(stats) for key, stats in _hook_stats.items()}
+
+
+def merge_hook_stats(all_stats):
+    """
+    Add up the hook statistics of several processes.
+    """
+    totals = {}
+    for stats in all_stats:
+        for key, (calls, seconds) in stats.items():
+            total_calls, total_seconds = totals.get(key, (0, 0.0))
+            totals[key] = (total_calls + calls, total_seconds + seconds)
+    return totals
+
+
+def describe_hook_stats(stats: dict):
+    descriptions = []
+    for (plugin_name, hook_name), (calls, seconds) in sorted(stats.items()):
+        if calls:
+            descriptions.append("{0} {1} calls, {2:.3f}s".format(hook_name, calls, seconds))
+    return "Plugin hooks: {0}".format(", ".join(descriptions) if descriptions else "none")
+
+
+def clear_hook_stats():
+    with _stats_lock:
+        for stats in _hook_stats.values():
+            stats[0] = 0
+            stats[1] = 0.0
+
+
+def render_hook_stats(name='ocs_plugin_hook'):
+    """
+    The hook statistics in the Prometheus text format
+    """
+    stats = hook_stats()
+    lines = ['# HELP {0}_calls_total Number of calls of each search plugin hook'.format(name),
+             '# TYPE {0}_calls_total counter'.format(name)]
+    for (plugin_name, hook_name), (calls, seconds) in sorted(stats.items()):
+        lines.append('{0}_calls_total{{plugin="{1}",hook="{2}"}} {3}'.format(name, plugin_name, hook_name, calls))
+    lines.extend(['# HELP {0}_seconds_total Time spent in each search plugin hook'.format(name),
+                  '# TYPE {0}_seconds_total counter'.format(name)])
+    for (plugin_name, hook_name), (calls, seconds) in sorted(stats.items()):
+        lines.append('{0}_seconds_total{{plugin="{1}",hook="{2}"}} {3}'.format(name, plugin_name, hook_name, seconds))
+    return '\n'.join(lines) + '\n'
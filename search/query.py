@@ -4,6 +4,8 @@ from nltk.tokenize.regexp import RegexpTokenizer
 import os
 import re
 from search.models import Search, Field
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, NamedTuple, Tuple
 
 
 def url_part_escape(orig):
@@ -45,22 +47,23 @@ def uuid_pattern(version):
     )
 
 
-def calc_pagination_range(num_found: int, pagesize, current_page, delta=2):
-    # @TODO This is not very efficient - could be refactored
+def calc_pagination_range(num_found: int, pagesize, current_page, delta=2, max_page=0):
+    """
+    The page numbers of the pagination links: the first and last pages and the pages within delta of the current page,
+    with 0 for each gap. A gap of a single page is filled with that page. Only the pages around the current page are
+    looked at, so the time taken does not depend on the number of pages.
+    :param max_page: if set, pages after max_page are only linked from the pages next to them
+    """
     pages = int(ceil(num_found / pagesize))
-    if current_page > pages:
-        current_page = pages
-    elif current_page < 1:
-        current_page = 1
-    left = current_page - delta
-    right = current_page + delta + 1
-    pagination = []
-    spaced_pagination = []
-
-    for p in range(1, pages + 1):
-        if (p == 1) or (p == pages) or (left <= p < right):
-            pagination.append(p)
+    if pages < 1:
+        return []
+    current_page = min(max(current_page, 1), pages)
+    window = range(max(current_page - delta, 1), min(current_page + delta, pages) + 1)
+    pagination = sorted({1, pages}.union(window))
+    if max_page:
+        pagination = [p for p in pagination if p <= max_page or abs(p - current_page) <= 1]
 
+    spaced_pagination = []
     last = None
     for p in pagination:
         if last:
@@ -107,37 +110,132 @@ def get_search_terms(search_text: str):
     return solr_search_terms
 
 
-def get_query_fields(request: HttpRequest, fields: dict):
+def _query_fields(fields: dict, lang: str):
     qf = ['id']
     for f in fields:
-        if fields[f].solr_field_lang in [request.LANGUAGE_CODE, 'bi']:
+        if fields[f].solr_field_lang in [lang, 'bi']:
             qf.append(f)
             if fields[f].solr_extra_fields:
-                if fields[f].solr_field_lang == request.LANGUAGE_CODE:
+                if fields[f].solr_field_lang == lang:
                     qf.extend(fields[f].solr_extra_fields.split(","))
                 else:
                     copy_fields = fields[f].solr_extra_fields.split(",")
                     for copy_field in copy_fields:
-                        if copy_field.endswith("_" + request.LANGUAGE_CODE):
+                        if copy_field.endswith("_" + lang):
                             qf.append(copy_field)
             if fields[f].solr_field_is_coded:
-                code_value_field = "{0}_{1}".format(f, request.LANGUAGE_CODE)
+                code_value_field = "{0}_{1}".format(f, lang)
                 if code_value_field not in qf:
                     qf.append(code_value_field)
     return qf
 
 
-def get_mlt_fields(request: HttpRequest, fields: dict):
+def _mlt_fields(fields: dict, lang: str):
     qf = ['id']
     for f in fields:
-        if fields[f].solr_field_lang in [request.LANGUAGE_CODE, 'bi']:
+        if fields[f].solr_field_lang in [lang, 'bi']:
             if fields[f].solr_field_type in ['search_text_en', 'search_text_en', 'string']:
                 qf.append(f)
     return qf
 
 
+def _export_fields(fields: dict, lang: str):
+    ef = ['id']
+    for f in fields:
+        if fields[f].solr_field_lang in [lang, 'bi']:
+            if fields[f].solr_field_type in ['string', 'pint', 'pfloat', 'pdate']:
+                ef.append(f)
+    return ef
+
+
+def _highlight_fields(fields: dict):
+    hl_fields = []
+    for field in fields:
+        if fields[field].solr_field_type in ["search_text_en", "search_text_fr", "string", 'text_general']:
+            hl_fields.append(field)
+            if fields[field].solr_extra_fields:
+                for extra_field in fields[field].solr_extra_fields.split(","):
+                    if extra_field.endswith("_en") or extra_field.endswith("_fr"):
+                        hl_fields.append(extra_field.strip())
+    return hl_fields
+
+
+def highlight_params(method: str, snippets: int):
+    """
+    The Solr highlighting parameters of a highlighter, apart from the field list. The unified highlighter takes the
+    tags around the highlighted terms from hl.tag.pre and hl.tag.post, the original one from hl.simple.pre and
+    hl.simple.post.
+    """
+    if method == 'none':
+        return {}
+    tag_params = ('hl.simple.pre', 'hl.simple.post') if method == 'original' else ('hl.tag.pre', 'hl.tag.post')
+    return {
+        'hl': 'on',
+        'hl.method': method,
+        tag_params[0]: '<mark>',
+        tag_params[1]: '</mark>',
+        'hl.snippets': snippets,
+        'hl.highlightMultiTerm': True,
+    }
+
+
+def get_highlight_fields(fields: dict):
+    return _highlight_fields(fields)
+
+
+def get_query_fields(request: HttpRequest, fields: dict):
+    return _query_fields(fields, request.LANGUAGE_CODE)
+
+
+def get_mlt_fields(request: HttpRequest, fields: dict):
+    return _mlt_fields(fields, request.LANGUAGE_CODE)
+
+
+class QueryPlan(NamedTuple):
+    """
+    The parts of the Solr queries for one search and language that only depend on the search configuration. Plans
+    are compiled when the configuration is loaded, so a request only has to add its search terms, filters, sort
+    order and page to the query.
+    """
+    query_fields: Tuple[str, ...]
+    field_list: str
+    export_field_list: str
+    highlight_fields: Tuple[str, ...]
+    # Empty if the search is not highlighted
+    highlight_params: Mapping
+    highlight_browse: bool
+    mlt_fields: Tuple[str, ...]
+    # Facet name: (facet.sort, facet.limit)
+    facet_params: Mapping
+    sort_fields: FrozenSet[str]
+    sort_options: Mapping
+    default_sort: str
+
+
+def compile_query_plan(search: Search, fields: dict, facets, lang: str):
+    query_fields = tuple(_query_fields(fields, lang))
+    sort_order = search.results_sort_order_fr if lang == 'fr' else search.results_sort_order_en
+    sort_display = search.results_sort_order_display_fr if lang == 'fr' else search.results_sort_order_display_en
+    sort_options = {v: str(label).strip() for v, label in zip(sort_order.split(','), sort_display.split(','))}
+    hl_fields = _highlight_fields(fields)
+    return QueryPlan(
+        query_fields=query_fields,
+        field_list=",".join(query_fields),
+        export_field_list=",".join(_export_fields(fields, lang)),
+        highlight_fields=tuple(hl_fields[:search.highlight_max_fields] if search.highlight_max_fields else hl_fields),
+        highlight_params=MappingProxyType(highlight_params(search.highlight_method, search.highlight_snippets)),
+        highlight_browse=search.highlight_browse,
+        mlt_fields=tuple(_mlt_fields(fields, lang)),
+        facet_params=MappingProxyType({f: (fields[f].solr_facet_sort, fields[f].solr_facet_limit) for f in facets}),
+        sort_fields=frozenset(sort_order.split(',')),
+        sort_options=MappingProxyType(sort_options),
+        default_sort=sort_order.split(',')[0] if sort_order else 'score desc',
+    )
+
+
 def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes: dict, facets: list, start_row: int,
-                      rows: int, record_id: str, export=False, highlighting=False, default_sort='score desc'):
+                      rows: int, record_id: str, export=False, highlighting=False, default_sort='score desc',
+                      plan: QueryPlan = None):
     """
     Create a complete query to send to the SolrClient query.
     :param request:
@@ -150,9 +248,12 @@ def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes:
     :param record_id:
     :param export: Set to true if constructing the query for a /export Solr handler query
     :param highlighting: set to true if the query should include search term highlighting
+    :param plan: the compiled query plan for the search and language. Compiled on the fly if not provided
     :return:
     """
     using_facets = len(facets) > 0
+    if plan is None:
+        plan = compile_query_plan(search, fields, facets, request.LANGUAGE_CODE)
 
     # Look for known fields in the GET request
     known_fields = {}
@@ -162,10 +263,7 @@ def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes:
         if request_field == 'search_text' and not record_id:
             solr_query['q'] = get_search_terms(request.GET.get('search_text'))
         elif request_field == 'sort' and not record_id:
-            if request.LANGUAGE_CODE == 'fr':
-                solr_query['sort'] = request.GET.get('sort') if request.GET.get('sort') in search.results_sort_order_fr.split(',') else default_sort
-            else:
-                solr_query['sort'] = request.GET.get('sort') if request.GET.get('sort') in search.results_sort_order_en.split(',') else default_sort
+            solr_query['sort'] = request.GET.get('sort') if request.GET.get('sort') in plan.sort_fields else default_sort
         elif request_field in fields:
             known_fields[request_field] = request.GET.get(request_field).split('|')
 
@@ -181,38 +279,19 @@ def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes:
     solr_query['q.op'] = "AND"
 
     # Create a Solr query field list based on the Fields Model. Expand the field list where needed
-    solr_query['qf'] = get_query_fields(request, fields)
+    solr_query['qf'] = list(plan.query_fields)
 
     if export:
-        ef = ['id']
-        for f in fields:
-            if fields[f].solr_field_lang in [request.LANGUAGE_CODE, 'bi']:
-                if fields[f].solr_field_type in ['string', 'pint', 'pfloat', 'pdate']:
-                    ef.append(f)
-        solr_query['fl'] = ",".join(ef)
+        solr_query['fl'] = plan.export_field_list
     else:
-        solr_query['fl'] = ",".join(solr_query['qf'])
+        solr_query['fl'] = plan.field_list
     if not export:
         solr_query['start'] = start_row
         solr_query['rows'] = rows
-    if not export and highlighting:
-        hl_fields = []
-        for field in fields:
-            if fields[field].solr_field_type in ["search_text_en", "search_text_fr", "string", 'text_general']:
-                hl_fields.append(field)
-                if fields[field].solr_extra_fields:
-                    for extra_field in fields[field].solr_extra_fields.split(","):
-                        if extra_field.endswith("_en") or extra_field.endswith("_fr"):
-                            hl_fields.append(extra_field.strip())
-        solr_query.update({
-            'hl': 'on',
-            'hl.method': 'original',
-            'hl.simple.pre': '<mark>',
-            'hl.simple.post': '</mark>',
-            'hl.snippets': 10,
-            'hl.fl': hl_fields,
-            'hl.highlightMultiTerm': True,
-        })
+    # Browse queries without search terms have nothing to highlight
+    if not export and highlighting and plan.highlight_params and (solr_query['q'] != '*' or plan.highlight_browse):
+        solr_query.update(plan.highlight_params)
+        solr_query['hl.fl'] = list(plan.highlight_fields)
 
     # Set a default sort order
     if 'sort' not in solr_query:
@@ -224,8 +303,12 @@ def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes:
         fq = []
         ff = []
         for facet in facets:
-            solr_query['f.{0}.facet.sort'.format(facet)] = fields[facet].solr_facet_sort
-            solr_query['f.{0}.facet.limit'.format(facet)] = fields[facet].solr_facet_limit
+            if facet in plan.facet_params:
+                facet_sort, facet_limit = plan.facet_params[facet]
+            else:
+                facet_sort, facet_limit = fields[facet].solr_facet_sort, fields[facet].solr_facet_limit
+            solr_query['f.{0}.facet.sort'.format(facet)] = facet_sort
+            solr_query['f.{0}.facet.limit'.format(facet)] = facet_limit
             if facet in known_fields:
                 # Use this query syntax when facet search values are specified
                 quoted_terms = ['"{0}"'.format(item) for item in known_fields[facet]]
@@ -242,20 +325,32 @@ def create_solr_query(request: HttpRequest, search: Search, fields: dict, Codes:
     return solr_query
 
 
-def create_solr_mlt_query(request: HttpRequest, search: Search, fields: dict, start_row: int, record_id: str):
-    solr_query = {
-        'q': 'id:"{0}"'.format(record_id),
+def mlt_params(search: Search, plan: QueryPlan):
+    """
+    The More Like This parameters of a search. build_mlt_neighbours uses the same parameters as the live query.
+    """
+    return {
         'mlt': True,
         'mlt.count': search.mlt_items,
         'mlt.boost': True,
-        'start': start_row,
-        'rows': search.mlt_items,
-        'fl':  get_query_fields(request, fields),
-        'mlt.fl': get_mlt_fields(request, fields),
+        'mlt.fl': list(plan.mlt_fields),
         'mlt.mintf': 1,
         'mlt.minwl': 3,
         'mlt.mindf': 2,
         'mlt.maxdfpct': 50,
     }
+
+
+def create_solr_mlt_query(request: HttpRequest, search: Search, fields: dict, start_row: int, record_id: str,
+                          plan: QueryPlan = None):
+    if plan is None:
+        plan = compile_query_plan(search, fields, [], request.LANGUAGE_CODE)
+    solr_query = {
+        'q': 'id:"{0}"'.format(record_id),
+        'start': start_row,
+        'rows': search.mlt_items,
+        'fl': list(plan.query_fields),
+    }
+    solr_query.update(mlt_params(search, plan))
     return solr_query
 
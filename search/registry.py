@@ -0,0 +1,176 @@
+"""
+Process-wide registry of the search configuration stored in the Search, Field and Code models.
+
+The configuration is loaded from the database once per worker process and kept as a read-only snapshot. Any change
+to the models (see search/signals.py) or a run of one of the import commands bumps a shared version stamp, and the
+next request that asks for the configuration reloads it.
+"""
+from search.decorate import DisplayPlan, compile_display_plan
+from search.models import Search, Field, Code
+from search.query import QueryPlan, compile_query_plan
+from search.stamps import VersionStamp
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+
+
+class SearchSnapshot(NamedTuple):
+    search: Search
+    fields: Mapping
+    facets_en: Tuple[str, ...]
+    facets_fr: Tuple[str, ...]
+    display_fields_en: Tuple[str, ...]
+    display_fields_fr: Tuple[str, ...]
+    display_field_names_en: Mapping
+    display_field_names_fr: Mapping
+    query_plan_en: QueryPlan
+    query_plan_fr: QueryPlan
+    display_plan_en: DisplayPlan
+    display_plan_fr: DisplayPlan
+
+    def query_plan(self, lang: str):
+        return self.query_plan_fr if lang == 'fr' else self.query_plan_en
+
+    def display_plan(self, lang: str):
+        return self.display_plan_fr if lang == 'fr' else self.display_plan_en
+
+    def facets(self, lang: str):
+        return self.facets_fr if lang == 'fr' else self.facets_en
+
+    def display_fields(self, lang: str):
+        return self.display_fields_fr if lang == 'fr' else self.display_fields_en
+
+    def display_field_names(self, lang: str):
+        return self.display_field_names_fr if lang == 'fr' else self.display_field_names_en
+
+
+class Configuration(NamedTuple):
+    version: tuple
+    snapshots: Mapping
+    searches: Mapping
+    fields: Mapping
+    facets_en: Mapping
+    facets_fr: Mapping
+    display_fields_en: Mapping
+    display_fields_fr: Mapping
+    display_fields_names_en: Mapping
+    display_fields_names_fr: Mapping
+    codes_en: Mapping
+    codes_fr: Mapping
+    query_plans_en: Mapping
+    query_plans_fr: Mapping
+    display_plans_en: Mapping
+    display_plans_fr: Mapping
+
+    def codes(self, lang: str):
+        return self.codes_fr if lang == 'fr' else self.codes_en
+
+
+_config_stamp = VersionStamp('search_config')
+_config_lock = threading.Lock()
+_configuration = None
+
+
+def _display_field_names(fields: dict, lang: str):
+    display_field_name = {}
+    for f in fields:
+        if fields[f].solr_field_lang in [lang, 'bi']:
+            if lang == 'en' and not f[:2] == 'fr':
+                display_field_name[f] = fields[f].label_en
+            elif lang == 'fr' and not f[:2] == 'en':
+                display_field_name[f] = fields[f].label_fr
+    return MappingProxyType(display_field_name)
+
+
+def _lang_field_ids(fields, lang: str):
+    return tuple(f.field_id for f in fields if f.solr_field_lang in [lang, 'bi'])
+
+
+def _build_snapshot(search: Search, field_list: list, codes_en: dict, codes_fr: dict):
+    sfields = {f.field_id: f for f in field_list}
+    # sorted() is stable, so facets with the same display order keep the database order
+    facet_fields = sorted((f for f in field_list if f.is_search_facet), key=lambda f: f.solr_facet_display_order)
+    display_fields = [f for f in field_list if f.is_default_display]
+    facets_en = _lang_field_ids(facet_fields, 'en')
+    facets_fr = _lang_field_ids(facet_fields, 'fr')
+    display_fields_en = _lang_field_ids(display_fields, 'en')
+    display_fields_fr = _lang_field_ids(display_fields, 'fr')
+    display_field_names_en = _display_field_names(sfields, 'en')
+    display_field_names_fr = _display_field_names(sfields, 'fr')
+    return SearchSnapshot(
+        search=search,
+        fields=MappingProxyType(sfields),
+        facets_en=facets_en,
+        facets_fr=facets_fr,
+        display_fields_en=display_fields_en,
+        display_fields_fr=display_fields_fr,
+        display_field_names_en=display_field_names_en,
+        display_field_names_fr=display_field_names_fr,
+        query_plan_en=compile_query_plan(search, sfields, facets_en, 'en'),
+        query_plan_fr=compile_query_plan(search, sfields, facets_fr, 'fr'),
+        display_plan_en=compile_display_plan(search, sfields, display_fields_en, display_field_names_en, codes_en,
+                                             'en'),
+        display_plan_fr=compile_display_plan(search, sfields, display_fields_fr, display_field_names_fr, codes_fr,
+                                             'fr'),
+    )
+
+
+def _load_configuration(version: tuple):
+    searches = {s.search_id: s for s in Search.objects.all()}
+
+    fields_by_search = {sid: [] for sid in searches}
+    for f in Field.objects.all().order_by('id'):
+        if f.search_id_id in fields_by_search:
+            fields_by_search[f.search_id_id].append(f)
+
+    # Codes are keyed by field ID only, which is how the views and the plugins have always looked them up
+    codes_en = {}
+    codes_fr = {}
+    for field_id, code_id, label_en, label_fr in Code.objects.values_list('field_id__field_id', 'code_id',
+                                                                           'label_en', 'label_fr'):
+        codes_en.setdefault(field_id, {})[code_id] = label_en
+        codes_fr.setdefault(field_id, {})[code_id] = label_fr
+
+    snapshots = {sid: _build_snapshot(searches[sid], fields_by_search[sid], codes_en, codes_fr) for sid in searches}
+    return Configuration(
+        version=version,
+        snapshots=MappingProxyType(snapshots),
+        searches=MappingProxyType(searches),
+        fields=MappingProxyType({sid: s.fields for sid, s in snapshots.items()}),
+        facets_en=MappingProxyType({sid: s.facets_en for sid, s in snapshots.items()}),
+        facets_fr=MappingProxyType({sid: s.facets_fr for sid, s in snapshots.items()}),
+        display_fields_en=MappingProxyType({sid: s.display_fields_en for sid, s in snapshots.items()}),
+        display_fields_fr=MappingProxyType({sid: s.display_fields_fr for sid, s in snapshots.items()}),
+        display_fields_names_en=MappingProxyType({sid: s.display_field_names_en for sid, s in snapshots.items()}),
+        display_fields_names_fr=MappingProxyType({sid: s.display_field_names_fr for sid, s in snapshots.items()}),
+        codes_en=MappingProxyType({f: MappingProxyType(c) for f, c in codes_en.items()}),
+        codes_fr=MappingProxyType({f: MappingProxyType(c) for f, c in codes_fr.items()}),
+        query_plans_en=MappingProxyType({sid: s.query_plan_en for sid, s in snapshots.items()}),
+        query_plans_fr=MappingProxyType({sid: s.query_plan_fr for sid, s in snapshots.items()}),
+        display_plans_en=MappingProxyType({sid: s.display_plan_en for sid, s in snapshots.items()}),
+        display_plans_fr=MappingProxyType({sid: s.display_plan_fr for sid, s in snapshots.items()}),
+    )
+
+
+def get_configuration():
+    """
+    Return the current configuration snapshot, reloading it from the database if the version stamp has changed
+    since it was last loaded.
+    """
+    global _configuration
+    # Read the version before loading so that a change made during the load triggers another reload
+    version = _config_stamp.current()
+    config = _configuration
+    if config is None or config.version != version:
+        with _config_lock:
+            if _configuration is None or _configuration.version != version:
+                _configuration = _load_configuration(version)
+            config = _configuration
+    return config
+
+
+def invalidate_configuration():
+    """
+    Mark the search configuration as changed. Every worker process reloads it on its next request.
+    """
+    _config_stamp.bump()
@@ -0,0 +1,213 @@
+"""
+Cache for Solr search results.
+
+Results are kept in a small in-process LRU cache and, if SEARCH_RESULT_CACHE_ALIAS names one of the Django CACHES,
+in that shared cache as well. Cache keys are made from a canonical form of the final Solr query, the core name and
+the language. Each core has a generation stamp that is part of the key, so bumping the stamp after a data import
+invalidates all of the cached results for that core at once.
+
+The facet counts of a search are also cached on their own, under a key without the page and sort parameters, so
+paging through the results or changing the sort order only asks Solr for the documents.
+"""
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import json
+from search.stamps import VersionStamp
+from search.timing import current_timer
+from SolrClient import SolrClient, SolrResponse
+import threading
+from time import time
+from typing import NamedTuple, Optional
+
+
+class LocalCache:
+    """
+    A thread-safe, size-bounded LRU cache with a time-to-live for each entry.
+    """
+
+    def __init__(self, max_entries: int, timeout: int):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_core_stamps = {}
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def _core_stamp(core_name: str):
+    stamp = _core_stamps.get(core_name)
+    if stamp is None:
+        stamp = _core_stamps.setdefault(core_name, VersionStamp('results_{0}'.format(core_name)))
+    return stamp
+
+
+def _get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LocalCache(settings.SEARCH_RESULT_CACHE_MAX_ENTRIES, settings.SEARCH_RESULT_CACHE_TIMEOUT)
+    return _local_cache
+
+
+def _get_shared_cache():
+    if settings.SEARCH_RESULT_CACHE_ALIAS:
+        return caches[settings.SEARCH_RESULT_CACHE_ALIAS]
+    return None
+
+
+def canonical_query(solr_query: dict):
+    """
+    Return a stable string form of a Solr query. Filter queries are sorted because their order does not affect the
+    results; the order of all other list parameters, like facet fields, is significant.
+    """
+    query = dict(solr_query)
+    if isinstance(query.get('fq'), list):
+        query['fq'] = sorted(query['fq'])
+    return json.dumps(query, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def result_cache_key(core_name: str, solr_query: dict, lang: str, prefix='results'):
+    digest = hashlib.sha1(canonical_query(solr_query).encode('utf8')).hexdigest()
+    generation = "{0}-{1}".format(*_core_stamp(core_name).current())
+    return "ocs:{0}:{1}:{2}:{3}:{4}".format(prefix, core_name, generation, lang, digest)
+
+
+def get_cached(key: str):
+    if not settings.SEARCH_RESULT_CACHE_TIMEOUT:
+        return None
+    local_cache = _get_local_cache()
+    value = local_cache.get(key)
+    if value is None:
+        shared_cache = _get_shared_cache()
+        if shared_cache is not None:
+            value = shared_cache.get(key)
+            if value is not None:
+                local_cache.set(key, value)
+    return value
+
+
+def set_cached(key: str, value):
+    if not settings.SEARCH_RESULT_CACHE_TIMEOUT:
+        return
+    _get_local_cache().set(key, value)
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.set(key, value, settings.SEARCH_RESULT_CACHE_TIMEOUT)
+
+
+def cached_solr_query(solr: SolrClient, core_name: str, solr_query: dict, lang: str, **kwargs):
+    """
+    Run a Solr query, or return the cached results of an identical earlier query. The raw response data is cached
+    rather than the parsed results so that search plugins still receive a complete SolrResponse. It is stored as a
+    JSON string so that plugins or templates that modify the response never change the cached copy.
+    """
+    # The key must be calculated first, because SolrClient adds parameters to the query dictionary
+    key = result_cache_key(core_name, solr_query, lang)
+    cached_data = get_cached(key)
+    if cached_data is not None:
+        return SolrResponse(json.loads(cached_data))
+    solr_response = solr.query(core_name, solr_query, **kwargs)
+    current_timer().add_qtime(solr_response)
+    set_cached(key, json.dumps(solr_response.data))
+    return solr_response
+
+
+async def async_cached_solr_query(solr, core_name: str, solr_query: dict, lang: str):
+    """
+    cached_solr_query for the async views. The in-process cache is read directly; the shared cache client is blocking,
+    so it is only used from a worker thread.
+    :param solr: an AsyncSolrClient
+    """
+    key = result_cache_key(core_name, solr_query, lang)
+    shared = settings.SEARCH_RESULT_CACHE_TIMEOUT and _get_shared_cache() is not None
+    cached_data = _get_local_cache().get(key) if settings.SEARCH_RESULT_CACHE_TIMEOUT else None
+    if cached_data is None and shared:
+        cached_data = await sync_to_async(get_cached, thread_sensitive=False)(key)
+    if cached_data is not None:
+        return SolrResponse(json.loads(cached_data))
+    solr_response = await solr.query(core_name, solr_query)
+    current_timer().add_qtime(solr_response)
+    if shared:
+        await sync_to_async(set_cached, thread_sensitive=False)(key, json.dumps(solr_response.data))
+    else:
+        set_cached(key, json.dumps(solr_response.data))
+    return solr_response
+
+
+# Parameters that choose the page of results, but do not change the facet counts
+_PAGE_PARAMS = frozenset(('start', 'rows', 'sort', 'fl', 'cursorMark'))
+
+
+def facet_cache_key(core_name: str, solr_query: dict, lang: str):
+    query = {k: v for k, v in solr_query.items() if k not in _PAGE_PARAMS and not k.startswith('hl')}
+    return result_cache_key(core_name, query, lang, prefix='facets')
+
+
+class CachedFacets(NamedTuple):
+    key: str
+    # The facet_counts of the response as a JSON string, or None if they are not cached yet
+    facet_counts: Optional[str]
+
+
+def use_cached_facets(core_name: str, solr_query: dict, lang: str):
+    """
+    Look up the facet counts of a faceted search, and turn faceting off in the query if they are cached.
+    :return: the CachedFacets to pass to add_cached_facets with the response, or None if the query has no facets
+    """
+    if not solr_query.get('facet'):
+        return None
+    key = facet_cache_key(core_name, solr_query, lang)
+    facet_counts = get_cached(key)
+    if facet_counts is not None:
+        solr_query['facet'] = False
+    return CachedFacets(key, facet_counts)
+
+
+def add_cached_facets(cached_facets: CachedFacets, solr_response: SolrResponse):
+    """
+    Put the cached facet counts into a response to a query without facets, or cache the facet counts of a response
+    """
+    if cached_facets.facet_counts is not None:
+        solr_response.data['facet_counts'] = json.loads(cached_facets.facet_counts)
+    elif 'facet_counts' in solr_response.data:
+        set_cached(cached_facets.key, json.dumps(solr_response.data['facet_counts']))
+
+
+def invalidate_core_results(core_name: str):
+    """
+    Invalidate all of the cached results for a Solr core, in every worker process.
+    """
+    _core_stamp(core_name).bump()
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from search.models import Search, Field, Code
+from search.registry import invalidate_configuration
+
+
+@receiver(post_save, sender=Search)
+@receiver(post_save, sender=Field)
+@receiver(post_save, sender=Code)
+@receiver(post_delete, sender=Search)
+@receiver(post_delete, sender=Field)
+@receiver(post_delete, sender=Code)
+def search_model_changed(sender, **kwargs):
+    invalidate_configuration()
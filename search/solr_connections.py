@@ -0,0 +1,131 @@
+"""
+Per-process pool of Solr connections.
+
+Views and management commands get their SolrClient from get_solr_client() instead of creating a new one for every
+request. Each Solr server URL gets one client per worker process, and that client uses a pooled, keep-alive HTTP
+session, so TCP and TLS connections to Solr are reused across requests. The session also applies the configured
+timeouts (optionally per core) and a retry policy with exponential backoff.
+"""
+from django.conf import settings
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from SolrClient import SolrClient
+import socket
+import threading
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTP adapter that enables TCP keep-alive on pooled connections, so idle connections to Solr are not silently
+    dropped by firewalls or load balancers between requests.
+    """
+
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+
+class SolrSession(requests.Session):
+    """
+    Requests session that sets a default timeout for every call. SolrClient does not pass a timeout to the
+    session, so without this a hung Solr server would block a worker indefinitely.
+    """
+
+    def __init__(self, server_url: str, timeout, core_timeouts: dict):
+        super().__init__()
+        self.server_path = urlsplit(server_url).path.rstrip('/')
+        self.timeout = timeout
+        self.core_timeouts = core_timeouts
+
+    def get_core_name(self, url: str):
+        path = urlsplit(url).path
+        if path.startswith(self.server_path):
+            path = path[len(self.server_path):]
+        parts = path.strip('/').split('/')
+        return parts[0] if parts else ''
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.core_timeouts.get(self.get_core_name(url), self.timeout)
+        return super().request(method, url, *args, **kwargs)
+
+
+def create_retry_policy():
+    retry_options = {
+        'total': settings.SOLR_RETRIES,
+        'backoff_factor': settings.SOLR_RETRY_BACKOFF,
+        'status_forcelist': (502, 503, 504),
+        'raise_on_status': False,
+    }
+    # Solr queries are sent as POST requests, so POST must be retried as well
+    try:
+        return Retry(allowed_methods=None, **retry_options)
+    except TypeError:
+        # urllib3 versions before 1.26
+        return Retry(method_whitelist=None, **retry_options)
+
+
+def create_session(server_url: str):
+    session = SolrSession(server_url, settings.SOLR_TIMEOUT, settings.SOLR_CORE_TIMEOUTS)
+    adapter = KeepAliveAdapter(keep_alive=settings.SOLR_KEEP_ALIVE,
+                               pool_connections=settings.SOLR_POOL_SIZE,
+                               pool_maxsize=settings.SOLR_POOL_SIZE,
+                               max_retries=create_retry_policy())
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class SolrConnectionManager:
+    """
+    Holds one SolrClient per Solr server URL for the current process. Clients are created on first use, and are
+    discarded if the process forks, because pooled sockets must never be shared between processes.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get_client(self, server_url: str):
+        if self._pid != os.getpid():
+            self.close()
+        client = self._clients.get(server_url)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(server_url)
+                if client is None:
+                    client = SolrClient(server_url)
+                    pooled_session = create_session(server_url)
+                    pooled_session.auth = client.transport.session.auth
+                    client.transport.session = pooled_session
+                    self._clients[server_url] = client
+        return client
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for client in self._clients.values():
+                    client.transport.session.close()
+            self._clients = {}
+            self._pid = os.getpid()
+
+
+connection_manager = SolrConnectionManager()
+
+
+def get_solr_client(server_url=None):
+    """
+    Return the pooled SolrClient for a Solr server. Defaults to the SOLR_SERVER_URL setting.
+    """
+    return connection_manager.get_client(server_url or settings.SOLR_SERVER_URL)
@@ -0,0 +1,36 @@
+from django.conf import settings
+import os
+import uuid
+
+
+class VersionStamp:
+    """
+    A version marker that is shared by every process on the server. Web workers and management commands run in
+    separate processes, so the version is kept in a small file in the SEARCH_VERSION_STAMP_DIR directory. Bumping
+    the stamp atomically replaces the file, which gives it a new inode and modification time. Reading the
+    current version is a single stat() call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def path(self):
+        return os.path.join(settings.SEARCH_VERSION_STAMP_DIR, "{0}.version".format(self.name))
+
+    def current(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return 0, 0
+
+    def bump(self):
+        stamp_dir = settings.SEARCH_VERSION_STAMP_DIR
+        if not os.path.exists(stamp_dir):
+            os.makedirs(stamp_dir, exist_ok=True)
+        token = uuid.uuid4().hex
+        temp_path = "{0}.{1}.tmp".format(self.path, token)
+        with open(temp_path, 'w') as stamp_file:
+            stamp_file.write(token)
+        os.replace(temp_path, self.path)
@@ -3,13 +3,11 @@
 
 from babel.dates import format_date
 from babel.numbers import format_currency, format_decimal, parse_decimal
-import bleach
 from django import template
-from django.conf import settings
 from django.utils.translation import gettext
 from dateutil import parser
 import json
-import markdown2
+from search.fragments import render_fragment, render_markdown
 from search.query import url_part_unescape
 
 
@@ -165,9 +163,12 @@ def normalize_headings(value: str):
 
 @register.filter('markdown_filter')
 def markdown_filter(text):
-    text = markdown2.markdown(text, extras=settings.MARKDOWN_FILTER_EXTRAS)
-    html = bleach.clean(text, tags=settings.MARKDOWN_FILTER_WHITELIST_TAGS)
-    return bleach.linkify(html)
+    return render_markdown(text)
+
+
+@register.simple_tag(name='search_fragment', takes_context=True)
+def search_fragment(context, template_name: str, content=''):
+    return render_fragment(context, template_name, content)
 
 
 @register.filter('url_part_unescape')
@@ -1,5 +1,58 @@
-from django.test import TestCase
-from .query import calc_starting_row
+from asgiref.sync import sync_to_async
+import asyncio
+from contextlib import redirect_stdout
+import csv
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.conf import settings
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import path
+import gzip
+import httpx
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from time import sleep, time
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs
+from .async_solr import AsyncSolrClient, async_connection_manager
+from .async_views import AsyncExportView, AsyncMoreLikeThisView, AsyncRecordView, AsyncSearchView
+from oc_search.middleware import CanadaBilingualMiddleware, ServerTimingMiddleware
+from .benchmarks.suite import run_benchmarks
+from .core_admin import LocalCoreAdmin, create_shadow_core, missing_schema_fields, swap_shadow_core, \
+    unload_old_core, verify_shadow_core
+from .decorate import decorate_docs
+from .export import iter_export_docs, stream_solr_export
+from .export_cache import ExportCache
+from . import export_jobs
+from .export_jobs import JOB_FAILED, JOB_PENDING, JOB_READY, JOB_UNKNOWN, clear_export_job_error, \
+    get_export_job_status, submit_export_job
+from .formatters import cache_stats, clear_caches, localized_currency
+from .fragments import _fragment_cache, clear_fragments, render_markdown
+from .full_export import full_export_path, is_unfiltered, remove_full_exports, write_full_export
+from .loadtest.fake_solr import FakeSolr
+from .loadtest.harness import percentile
+from .manifest import ImportManifest, id_delete_query
+from . import mlt_store
+from .mlt_store import NeighbourStore, NeighbourStoreWriter, neighbour_query, neighbour_response, remove_store
+from .query import calc_pagination_range, calc_starting_row, create_solr_query
+from .models import Search, Field, Code
+from .navigation import back_query, search_back_url
+from .paging import FIRST_CURSOR, add_sort_tiebreak, cursor_key, get_cursor, save_next_cursor, use_cursor
+from .plugin_registry import NO_HOOKS, create_plugin_hooks, hook_stats
+from .registry import get_configuration
+from .result_cache import invalidate_core_results
+from .timing import PhaseHistograms, RequestTimer, current_timer, start_timer, stop_timer, NULL_TIMER
+from .solr_connections import get_solr_client
+from .views import ExportView, MoreLikeThisView, SearchView
+from SolrClient import SolrResponse
+from SolrClient.exceptions import ConnectionError as SolrConnectionError, SolrError
 
 
 class UtilTestCase(TestCase):
@@ -8,3 +61,996 @@ class UtilTestCase(TestCase):
     def test_calc_starting_row(self):
         start_page = calc_starting_row(34, 10)
         self.assertEqual(start_page[0], 330)
+
+    def test_calc_pagination_range(self):
+        self.assertEqual(calc_pagination_range(0, 10, 1, 3), [])
+        self.assertEqual(calc_pagination_range(95, 10, 1, 3), [1, 2, 3, 4, 0, 10])
+        self.assertEqual(calc_pagination_range(1000, 10, 5, 3), [1, 2, 3, 4, 5, 6, 7, 8, 0, 100])
+        self.assertEqual(calc_pagination_range(1000, 10, 50, 3), [1, 0, 47, 48, 49, 50, 51, 52, 53, 0, 100])
+        self.assertEqual(calc_pagination_range(1000, 10, 500, 3), [1, 0, 97, 98, 99, 100])
+        # Deep pages only link to their neighbours
+        self.assertEqual(calc_pagination_range(100000, 10, 49, 3, max_page=50), [1, 0, 46, 47, 48, 49, 50])
+        self.assertEqual(calc_pagination_range(100000, 10, 600, 3, max_page=50), [1, 0, 599, 600, 601])
+
+
+class FormatterTestCase(TestCase):
+
+    def test_localized_currency_is_cached(self):
+        clear_caches()
+        self.assertEqual(localized_currency('1234.5', 'en_CA'), '$1,234.50')
+        self.assertEqual(localized_currency('1234.5', 'en_CA'), '$1,234.50')
+        self.assertTrue(localized_currency('1234.5', 'fr_CA').endswith('$'))
+        self.assertEqual(cache_stats()['currency'], (1, 2))
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks('url_part', min_time=0.001)
+        self.assertEqual([r.name for r in results], ['url_part_escape', 'url_part_unescape'])
+        self.assertTrue(all(r.ops_per_sec > 0 for r in results))
+
+
+class FakeSolrTestCase(TestCase):
+
+    def test_select_response(self):
+        fake_solr = FakeSolr({'core_ati': {'owner_org': ['tbs', 'fin']}}, num_found=25)
+        params = {'q': ['*'], 'start': ['20'], 'rows': ['10'], 'fl': ['id,owner_org'], 'facet': ['true'],
+                  'facet.field': ['{!ex=tag_owner_org}owner_org'], 'hl': ['on'], 'hl.fl': ['owner_org']}
+        data = fake_solr.select_response('core_ati', params)
+        self.assertEqual([d['id'] for d in data['response']['docs']], ['core_ati-{0}'.format(n) for n in range(20, 25)])
+        self.assertEqual(data['response']['docs'][0]['owner_org'], 'tbs')
+        self.assertEqual(data['facet_counts']['facet_fields']['owner_org'], ['tbs', 12, 'fin', 8])
+        self.assertEqual(data['highlighting']['core_ati-21'], {'owner_org': ['<em>fin</em>']})
+
+        data = fake_solr.select_response('core_ati', {'q': ['id:"a,1"'], 'mlt': ['true'], 'mlt.count': ['2']})
+        self.assertEqual(data['response']['numFound'], 1)
+        self.assertEqual(len(data['moreLikeThis']['a,1']['docs']), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+
+
+class TimingTestCase(TestCase):
+
+    def test_phase_histograms(self):
+        self.assertIs(current_timer(), NULL_TIMER)
+        timer = RequestTimer()
+        timer.add('solr', 0.02)
+        timer.add('solr', 0.01)
+        self.assertEqual(timer.header(), 'solr;dur=30.0;desc="Solr round trip"')
+        histograms = PhaseHistograms((0.01, 0.1))
+        histograms.observe('ati', 'SearchForm', timer.durations)
+        metrics = histograms.render()
+        self.assertIn('ocs_request_phase_seconds_bucket{search="ati",route="SearchForm",phase="solr",le="0.01"} 0\n',
+                      metrics)
+        self.assertIn('ocs_request_phase_seconds_bucket{search="ati",route="SearchForm",phase="solr",le="+Inf"} 1\n',
+                      metrics)
+
+    def test_concurrent_requests_have_their_own_timers(self):
+        async def request(seconds):
+            timer = start_timer()
+            await asyncio.sleep(0.01)
+            current_timer().add('solr', seconds)
+            stop_timer()
+            return timer.durations['solr']
+
+        async def requests():
+            return await asyncio.gather(request(1.0), request(2.0))
+
+        self.assertEqual(asyncio.run(requests()), [1.0, 2.0])
+        self.assertIs(current_timer(), NULL_TIMER)
+
+    def test_timer_follows_request_into_threads(self):
+        def parse():
+            current_timer().add('parse', 0.5)
+
+        async def request():
+            timer = start_timer()
+            await sync_to_async(parse)()
+            await sync_to_async(parse, thread_sensitive=False)()
+            stop_timer()
+            return timer.durations['parse']
+
+        self.assertEqual(asyncio.run(request()), 1.0)
+
+    @override_settings(SERVER_TIMING_ENABLED=True, SEARCH_LANG_USE_PATH=True)
+    def test_middleware(self):
+        def view(request):
+            current_timer().add('solr', 0.25)
+            return HttpResponse(request.LANGUAGE_CODE)
+
+        async def async_view(request):
+            return view(request)
+
+        for get_response in (view, async_view):
+            handler = ServerTimingMiddleware(CanadaBilingualMiddleware(get_response))
+            self.assertEqual(asyncio.iscoroutinefunction(handler), get_response is async_view)
+            response = handler(RequestFactory().get('/search/fr/test/'))
+            if asyncio.iscoroutine(response):
+                response = asyncio.run(response)
+            self.assertEqual(response.content, b'fr')
+            self.assertTrue(response['Server-Timing'].startswith('solr;dur=250.0;'))
+        self.assertIs(current_timer(), NULL_TIMER)
+
+
+class PluginRegistryTestCase(TestCase):
+
+    def test_noop_hooks_are_skipped(self):
+        def filter_csv_record(csv_record, search, fields, codes, format):
+            return True, csv_record
+
+        def load_csv_record(csv_record, solr_record, search, fields, codes, format):
+            return solr_record
+
+        def copied_filter_csv_record(record, search, fields, codes, format):
+            return True, record
+
+        def custom_load_csv_record(csv_record, solr_record, search, fields, codes, format):
+            solr_record['custom'] = True
+            return solr_record
+
+        defaults = SimpleNamespace(filter_csv_record=filter_csv_record, load_csv_record=load_csv_record)
+        plugin = SimpleNamespace(filter_csv_record=copied_filter_csv_record, load_csv_record=custom_load_csv_record)
+        hooks = create_plugin_hooks('search.plugins.test', plugin, defaults)
+        self.assertIsNone(hooks.filter_csv_record)
+        self.assertIsNone(hooks.pre_search_solr_query)
+        self.assertEqual(hooks.load_csv_record({}, {}, None, {}, {}, ''), {'custom': True})
+        self.assertEqual(hook_stats()[('search.plugins.test', 'load_csv_record')][0], 1)
+
+
+class RegistryTestCase(TestCase):
+    databases = {'default', 'search'}
+
+    def setUp(self):
+        self.search = Search.objects.create(search_id='test', label_en='Test', label_fr='Essai')
+        Field.objects.create(field_id='title_en', search_id=self.search, label_en='Title', label_fr='Titre',
+                             solr_field_lang='en', is_default_display=True)
+        Field.objects.create(field_id='region', search_id=self.search, label_en='Region', label_fr='Région',
+                             is_search_facet=True, solr_facet_display_order=2, solr_field_is_coded=True)
+        owner = Field.objects.create(field_id='owner_org', search_id=self.search, label_en='Organization',
+                                     label_fr='Organisation', is_search_facet=True, solr_facet_display_order=1,
+                                     solr_field_is_coded=True)
+        Code.objects.create(field_id=owner, code_id='tbs', label_en='Treasury Board', label_fr='Conseil du Trésor')
+
+    def test_configuration_snapshot(self):
+        config = get_configuration()
+        self.assertEqual(config.facets_en['test'], ('owner_org', 'region'))
+        self.assertEqual(config.display_fields_fr['test'], ())
+        self.assertEqual(config.display_fields_names_fr['test'], {'region': 'Région', 'owner_org': 'Organisation'})
+        self.assertEqual(config.codes_fr['owner_org']['tbs'], 'Conseil du Trésor')
+        self.assertIs(config, get_configuration())
+
+    def test_query_plan(self):
+        plan = get_configuration().query_plans_fr['test']
+        self.assertEqual(plan.query_fields, ('id', 'region', 'region_fr', 'owner_org', 'owner_org_fr'))
+        self.assertEqual(plan.default_sort, 'score desc')
+        self.assertEqual(dict(plan.sort_options), {'score desc': 'Pertinence'})
+
+    def test_highlighting(self):
+        config = get_configuration()
+        plan = config.query_plans_en['test']
+
+        def query(query_string):
+            request = RequestFactory().get('/search/en/test/' + query_string)
+            request.LANGUAGE_CODE = 'en'
+            return create_solr_query(request, self.search, config.fields['test'], config.codes_en, [], 0, 10,
+                                     record_id='', highlighting=True, plan=plan)
+
+        # Browse queries are not highlighted
+        self.assertNotIn('hl', query(''))
+        solr_query = query('?search_text=board')
+        self.assertEqual((solr_query['hl.method'], solr_query['hl.snippets'], solr_query['hl.tag.pre']),
+                         ('unified', 3, '<mark>'))
+        self.assertEqual(solr_query['hl.fl'], ['title_en', 'region', 'owner_org'])
+
+    def test_decorate_docs(self):
+        plan = get_configuration().display_plans_en['test']
+        doc = decorate_docs([{'id': 'a/1', 'title_en': 'A <mark>title</mark>', 'owner_org': 'tbs'}], plan,
+                            '/search/en/test/')[0]
+        self.assertEqual(doc['display'].record_url, '/search/en/test/record/a/1')
+        self.assertEqual([(f.label, f.values) for f in doc['display'].search_fields],
+                         [('Title', ('A <mark>title</mark>',))])
+        self.assertEqual(doc['display'].codes, {'owner_org': 'Treasury Board'})
+
+    def test_configuration_reloads_on_change(self):
+        config = get_configuration()
+        self.search.label_en = 'Changed'
+        self.search.save()
+        new_config = get_configuration()
+        self.assertIsNot(config, new_config)
+        self.assertEqual(new_config.searches['test'].label_en, 'Changed')
+
+
+class ExportCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ExportCache(self.temp_dir.name, max_bytes=250, timeout=600)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, search_type, query_hash, atime):
+        path = self.cache.path(search_type, '{0}_en'.format(query_hash * 40))
+        with self.cache.atomic_write(path) as cache_file:
+            cache_file.write('x' * 100)
+        os.utime(path, (atime, os.path.getmtime(path)))
+        return path
+
+    def test_sweep_evicts_least_recently_used(self):
+        oldest = self.write('ati', 'a', 1000)
+        newest = self.write('ati', 'b', 3000)
+        middle = self.write('ati', 'c', 2000)
+        self.assertEqual(self.cache.sweep(), (1, 100))
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_sweep_counts_full_exports(self):
+        full_export = full_export_path(self.cache, 'ati', 'en', {'q': '*'})
+        with open(full_export, 'wb') as export_file:
+            export_file.write(b'x' * 100)
+        os.utime(full_export, (1, 1))
+        older = self.write('ati', 'a', 1000)
+        newer = self.write('ati', 'b', 2000)
+        # The full export is the oldest file, and past the timeout, but it is only counted
+        self.assertEqual(self.cache.sweep(), (1, 100))
+        self.assertTrue(os.path.exists(full_export))
+        self.assertFalse(os.path.exists(older))
+        self.assertTrue(os.path.exists(newer))
+
+    def test_invalidate_search(self):
+        self.write('ati', 'a', 1000)
+        other = self.write('ati_summaries', 'b', 1000)
+        self.assertEqual(self.cache.invalidate('ati'), 1)
+        self.assertEqual(os.listdir(self.temp_dir.name), [os.path.basename(other)])
+
+
+class ExportStreamTestCase(TestCase):
+
+    docs = [{'id': 'a"1', 'title_en': 'Caf\u00e9 \\ "quoted" ]} {"docs": [', 'amount': 12.5},
+            {'id': 'b', 'tags': ['x', 'y,z'], 'title_fr': '\u00e9t\u00e9 \U0001f600'}]
+
+    def body(self, docs, ensure_ascii=True):
+        return json.dumps({'responseHeader': {'status': 0, 'QTime': 1}, 'response': {'numFound': len(docs), 'docs': docs}},
+                          ensure_ascii=ensure_ascii)
+
+    def test_documents_split_across_chunks(self):
+        for ensure_ascii in (True, False):
+            body = self.body(self.docs, ensure_ascii)
+            # Every split point, including inside keys, strings and escape sequences
+            for i in range(len(body) + 1):
+                self.assertEqual(list(iter_export_docs([body[:i], body[i:]])), self.docs)
+            self.assertEqual(list(iter_export_docs(body)), self.docs)
+        self.assertEqual(list(iter_export_docs([self.body([])])), [])
+
+    def test_export_exception(self):
+        body = self.body(self.docs + [{'EXCEPTION': 'java.io.IOException: Broken pipe', 'EOF': True}])
+        docs = iter_export_docs([body[:40], body[40:]])
+        self.assertEqual([next(docs), next(docs)], self.docs)
+        with self.assertRaisesRegex(SolrError, 'Broken pipe'):
+            next(docs)
+
+    def test_truncated_body(self):
+        body = self.body(self.docs)
+        for end in (body.index('"b"'), body.index('y,z'), body.index('[{') + 1):
+            with self.assertRaisesRegex(SolrError, 'ended unexpectedly'):
+                list(iter_export_docs([body[:end]]))
+        # Without the document list, the start of the body is the error message
+        with self.assertRaisesRegex(SolrError, '"numFound": 2, "do$'):
+            list(iter_export_docs([body[:body.index('"docs"') + 3]]))
+        with self.assertRaisesRegex(SolrError, 'ended unexpectedly'):
+            list(iter_export_docs([body[:body.index('"b"')], '']))
+
+    def test_error_response(self):
+        error = json.dumps({'responseHeader': {'status': 400}, 'error': {'msg': 'undefined field year', 'code': 400}})
+        with self.assertRaisesRegex(SolrError, 'undefined field year'):
+            list(iter_export_docs([error[:10], error[10:]]))
+        with self.assertRaisesRegex(SolrError, 'Bad gateway'):
+            list(iter_export_docs(['<html>Bad gateway</html>']))
+
+        response = mock.Mock(status_code=400, text=error)
+        session = mock.Mock(**{'post.return_value': response})
+        with mock.patch('search.export.get_solr_client',
+                        return_value=SimpleNamespace(transport=SimpleNamespace(session=session))):
+            with self.assertRaisesRegex(SolrError, '^400 - .*undefined field year'):
+                stream_solr_export('core_ati', {'q': '*:*', 'fl': 'id', 'sort': 'id asc'})
+            response.close.assert_called_once_with()
+            session.post.side_effect = OSError('Connection refused')
+            with self.assertRaises(SolrConnectionError):
+                stream_solr_export('core_ati', {'q': '*:*', 'fl': 'id', 'sort': 'id asc'})
+
+    def test_stream_from_solr(self):
+        with FakeSolr({}, export_rows=3) as fake_solr, override_settings(SOLR_SERVER_URL=fake_solr.url):
+            docs = list(stream_solr_export('core_ati', {'q': '*:*', 'fl': 'id', 'sort': 'id asc'}))
+        self.assertEqual(docs, [{'id': 'core_ati-{0}'.format(n)} for n in range(3)])
+
+
+class PageTestCase(TestCase):
+    """
+    Requests to the search views with a fake Solr server. The snippet templates are found under search_snippets/, as
+    they are after collectstatic, and the CDTS page fragments, which are installed with the site, are left empty.
+    """
+    databases = {'default', 'search'}
+
+    def setUp(self):
+        self.search = Search.objects.create(search_id='test', label_en='Test', label_fr='Essai',
+                                            solr_core_name='core_test', mlt_enabled=True, mlt_items=3)
+        Field.objects.create(field_id='title_en', search_id=self.search, label_en='Title', label_fr='Titre',
+                             solr_field_lang='en', solr_field_type='string', is_default_display=True)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.symlink(os.path.join(os.path.dirname(__file__), 'templates', 'snippets'),
+                   os.path.join(self.temp_dir.name, 'search_snippets'))
+        os.mkdir(os.path.join(self.temp_dir.name, 'cdts'))
+        for fragment in ('top', 'preFooter', 'footer'):
+            for lang in ('en', 'fr'):
+                open(os.path.join(self.temp_dir.name, 'cdts', '{0}-{1}.html'.format(fragment, lang)), 'w').close()
+        templates = [dict(settings.TEMPLATES[0], DIRS=list(settings.TEMPLATES[0]['DIRS']) + [self.temp_dir.name])]
+        self.fake_solr = FakeSolr({}, export_rows=3).start()
+        self.settings = override_settings(SOLR_SERVER_URL=self.fake_solr.url, TEMPLATES=templates,
+                                          EXPORT_FILE_CACHE_DIR=os.path.join(self.temp_dir.name, 'cache'),
+                                          MLT_STORE_DIR=os.path.join(self.temp_dir.name, 'mlt'))
+        self.settings.enable()
+        # The neighbour stores are kept by search ID, with the path from MLT_STORE_DIR
+        mlt_store._stores.clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.fake_solr.stop()
+        self.temp_dir.cleanup()
+
+    def request(self, path: str, lang='en', **extra):
+        request = RequestFactory().get(path, **extra)
+        request.LANGUAGE_CODE = lang
+        return request
+
+
+class ExportViewTestCase(PageTestCase):
+
+    @override_settings(EXPORT_STREAMING=True, EXPORT_ASYNC=True, EXPORT_FILE_CACHE_URL='')
+    def test_post_export_hook_gets_whole_response(self):
+        exported = []
+
+        def post_export_solr_query(solr_response, solr_query, *args):
+            exported.extend(doc['id'] for doc in solr_response.docs)
+            return solr_query
+
+        hooks = NO_HOOKS._replace(plugin_name='search.plugins.test', post_export_solr_query=post_export_solr_query)
+        request = RequestFactory().get('/search/en/test/export/?search_text=title')
+        request.LANGUAGE_CODE = 'en'
+        with mock.patch('search.views.get_plugin_hooks', return_value=hooks):
+            response = ExportView.as_view()(request, lang='en', search_type='test')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(exported, ['core_test-0', 'core_test-1', 'core_test-2'])
+        rows = b''.join(response.streaming_content).decode('utf8').splitlines()
+        self.assertEqual(rows[1:], ['core_test-{0},title_en {0}'.format(n) for n in range(3)])
+
+    @override_settings(EXPORT_STREAMING=True, EXPORT_ASYNC=False)
+    def test_export_fails_part_way(self):
+        self.fake_solr.export_fail_after = 2
+        response = ExportView.as_view()(self.request('/search/en/test/export/?search_text=title'), lang='en',
+                                        search_type='test')
+        self.assertEqual(response.status_code, 200)
+        # The streamed response is aborted instead of ending like a complete CSV file
+        with self.assertRaises(SolrError):
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        self.assertEqual(os.listdir(settings.EXPORT_FILE_CACHE_DIR), [])
+
+    @override_settings(EXPORT_STREAMING=True, EXPORT_ASYNC=False, EXPORT_FILE_CACHE_URL='https://example.com/cache/')
+    def test_full_export(self):
+        view = ExportView()
+        request = RequestFactory().get('/search/en/test/export/', HTTP_ACCEPT_ENCODING='gzip, br')
+        request.LANGUAGE_CODE = 'en'
+        solr_query, unfiltered = view.export_query(request, 'test', 'en')
+        self.assertTrue(unfiltered)
+        path = full_export_path(view.export_cache, 'test', 'en', solr_query)
+        write_full_export(view.export_cache, path, ['id,title_en\r\n', 'full,A\r\n'])
+
+        response = ExportView.as_view()(request, lang='en', search_type='test')
+        self.assertEqual((response['Content-Type'], response['Content-Encoding']), ('text/csv', 'gzip'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'id,title_en\r\nfull,A\r\n')
+
+        request = RequestFactory().get('/search/en/test/export/')
+        request.LANGUAGE_CODE = 'en'
+        response = ExportView.as_view()(request, lang='en', search_type='test')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'id,title_en\r\nfull,A\r\n')
+
+        # Searches with a post-export hook are exported from Solr
+        hooks = NO_HOOKS._replace(plugin_name='search.plugins.test',
+                                  post_export_solr_query=lambda solr_response, solr_query, *args: solr_query)
+        with mock.patch('search.views.get_plugin_hooks', return_value=hooks):
+            response = ExportView.as_view()(request, lang='en', search_type='test')
+        cached_file = os.path.join(settings.EXPORT_FILE_CACHE_DIR, os.path.basename(response.url))
+        self.assertTrue(response.url.startswith('https://example.com/cache/test_'))
+        with open(cached_file, encoding='utf8') as export_file:
+            self.assertIn('core_test-0', export_file.read())
+
+
+@override_settings(EXPORT_JOB_WORKERS=2, EXPORT_JOB_TIMEOUT=3600)
+class ExportJobTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(EXPORT_FILE_CACHE_DIR=self.temp_dir.name)
+        self.settings.enable()
+        self.path = os.path.join(self.temp_dir.name, 'ati_{0}_en.csv'.format('a' * 40))
+        self.lock_path = self.path + '.lock'
+        self.release = threading.Event()
+        self.exports = []
+
+    def tearDown(self):
+        self.release.set()
+        self.settings.disable()
+        self.temp_dir.cleanup()
+
+    def stream_solr_export(self, core_name, solr_query):
+        self.exports.append(core_name)
+        self.release.wait(5)
+        if 'error' in solr_query:
+            raise SolrError(solr_query['error'])
+        return iter([{'id': 'a'}])
+
+    def submit(self, solr_query=None):
+        return submit_export_job('a' * 40 + '_en', self.path, 'core_ati', solr_query or {}, ['id'])
+
+    def run_job(self, before_finish=None, solr_query=None):
+        with mock.patch('search.export_jobs.stream_solr_export', self.stream_solr_export):
+            self.assertEqual(self.submit(solr_query), JOB_PENDING)
+            job = export_jobs._jobs['a' * 40 + '_en']
+            # The same export is not started twice
+            self.assertEqual(self.submit(solr_query), JOB_PENDING)
+            self.assertEqual(get_export_job_status(self.path), JOB_PENDING)
+            if before_finish:
+                before_finish()
+            self.release.set()
+            job.result(5)
+        self.assertNotIn('a' * 40 + '_en', export_jobs._jobs)
+
+    def test_export_job(self):
+        self.run_job()
+        self.assertEqual(self.exports, ['core_ati'])
+        self.assertEqual(get_export_job_status(self.path), JOB_READY)
+        self.assertFalse(os.path.exists(self.lock_path))
+        with open(self.path, encoding='utf8', newline='') as export_file:
+            self.assertEqual(export_file.read(), '\ufeffid\r\na\r\n')
+
+    def test_failed_export_job(self):
+        self.run_job(solr_query={'error': 'undefined field year'})
+        self.assertEqual(get_export_job_status(self.path), JOB_FAILED)
+        self.assertEqual(clear_export_job_error(self.path), 'undefined field year')
+        self.assertEqual(get_export_job_status(self.path), JOB_UNKNOWN)
+
+    def test_job_running_in_another_process(self):
+        with open(self.lock_path, 'w') as lock_file:
+            lock_file.write('other')
+        with mock.patch('search.export_jobs.stream_solr_export', self.stream_solr_export):
+            self.assertEqual(self.submit(), JOB_PENDING)
+        self.assertEqual(self.exports, [])
+
+        # The lock of a job that died is taken over once it is older than EXPORT_JOB_TIMEOUT
+        os.utime(self.lock_path, (time() - 7200, time() - 7200))
+        self.run_job()
+        self.assertEqual(get_export_job_status(self.path), JOB_READY)
+
+    def test_lock_taken_over_while_running(self):
+        def take_over_lock():
+            os.remove(self.lock_path)
+            with open(self.lock_path, 'w') as lock_file:
+                lock_file.write('other')
+
+        self.run_job(take_over_lock)
+        with open(self.lock_path) as lock_file:
+            self.assertEqual(lock_file.read(), 'other')
+
+        os.remove(self.lock_path)
+        os.remove(self.path)
+        self.release.clear()
+        self.run_job(lambda: os.remove(self.lock_path))
+        self.assertEqual(get_export_job_status(self.path), JOB_READY)
+
+
+class MoreLikeThisTestCase(PageTestCase):
+
+    def test_neighbour_store(self):
+        with NeighbourStoreWriter('test') as writer:
+            writer.add('en', {'a': ['b', 'c'], 'b': []})
+            writer.add('fr', {'a': ['c']})
+        self.assertEqual(os.listdir(settings.MLT_STORE_DIR), ['test.sqlite3'])
+        store = NeighbourStore('test')
+        self.assertEqual((store.lookup('a', 'en'), store.lookup('b', 'en'), store.lookup('a', 'fr')),
+                         (['b', 'c'], [], ['c']))
+        self.assertIsNone(store.lookup('c', 'en'))
+
+        # A new file replaces the old one, and the readers switch to it
+        with NeighbourStoreWriter('test') as writer:
+            writer.add('en', {'a': ['d']})
+        self.assertEqual((store.lookup('a', 'en'), store.lookup('a', 'fr')), (['d'], None))
+
+        # A failed build leaves the old file
+        with self.assertRaises(ValueError):
+            with NeighbourStoreWriter('test') as writer:
+                writer.add('en', {'a': ['e']})
+                raise ValueError('stopped')
+        self.assertEqual(store.lookup('a', 'en'), ['d'])
+        self.assertEqual(os.listdir(settings.MLT_STORE_DIR), ['test.sqlite3'])
+
+        self.assertTrue(remove_store('test'))
+        self.assertIsNone(store.lookup('a', 'en'))
+
+    def test_neighbour_response(self):
+        solr = get_solr_client()
+        live = solr.query('core_test', {'q': 'id:"a"', 'fl': 'id,title_en', 'mlt': True, 'mlt.count': 2})
+        similar_ids = [doc['id'] for doc in live.data['moreLikeThis']['a']['docs']]
+        stored = neighbour_response('a', similar_ids,
+                                    solr.query('core_test', neighbour_query('a', similar_ids, 'id,title_en')))
+        self.assertEqual(stored.docs, live.docs)
+        self.assertEqual(set(stored.data), {'responseHeader', 'response', 'moreLikeThis'})
+        self.assertEqual(set(stored.data['moreLikeThis']), {'a'})
+        self.assertEqual(set(stored.data['moreLikeThis']['a']), set(live.data['moreLikeThis']['a']))
+        self.assertEqual([doc['id'] for doc in stored.data['moreLikeThis']['a']['docs']], similar_ids)
+
+        # The similar records keep their stored order, and records that are no longer in Solr are left out
+        solr_response = SolrResponse({'responseHeader': {'status': 0, 'QTime': 1},
+                                      'response': {'numFound': 3, 'start': 0,
+                                                   'docs': [{'id': 'c'}, {'id': 'a'}, {'id': 'b'}]}})
+        stored = neighbour_response('a', ['c', 'deleted', 'b'], solr_response)
+        self.assertEqual(stored.docs, [{'id': 'a'}])
+        self.assertEqual(stored.data['moreLikeThis']['a'], {'numFound': 2, 'start': 0,
+                                                             'docs': [{'id': 'c'}, {'id': 'b'}]})
+        self.assertIsNone(neighbour_response('deleted', ['a'], solr_response))
+
+    def test_similar_records_page(self):
+        with NeighbourStoreWriter('test') as writer:
+            writer.add('en', {'a': ['b/1', 'c']})
+        queries = []
+        select_response = self.fake_solr.select_response
+
+        def spy(core_name, params):
+            queries.append(params)
+            return select_response(core_name, params)
+
+        self.fake_solr.select_response = spy
+        # The fake Solr titles are numbered with the CRC of the record ID, or the position of a live similar record
+        stored_titles = ['title_en {0}'.format(zlib.crc32(record_id.encode('utf8'))) for record_id in ('b/1', 'c')]
+        for record_id, titles in (('a', stored_titles), ('x', ['title_en 0', 'title_en 1', 'title_en 2'])):
+            response = MoreLikeThisView.as_view()(self.request('/search/en/test/similar/' + record_id),
+                                                  lang='en', search_type='test', record_id=record_id)
+            self.assertEqual(response.status_code, 200)
+            content = response.content.decode('utf8')
+            self.assertIn('title_en {0}'.format(zlib.crc32(record_id.encode('utf8'))), content)
+            positions = [content.find('>{0}<'.format(title)) for title in titles]
+            self.assertNotIn(-1, positions)
+            self.assertEqual(positions, sorted(positions))
+        # Only the record that is not in the store uses the live More Like This query
+        self.assertEqual([q.get('mlt') for q in queries], [None, ['true']])
+
+
+@override_settings(SEARCH_CURSOR_PAGING_DEPTH=50, SEARCH_RESULT_CACHE_TIMEOUT=300)
+class CursorPagingTestCase(PageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        invalidate_core_results('core_test')
+
+    @staticmethod
+    def cursor_response(next_cursor: str):
+        return SolrResponse({'responseHeader': {'status': 0, 'QTime': 1}, 'response': {'numFound': 25, 'docs': []},
+                             'nextCursorMark': next_cursor})
+
+    def test_sort_tiebreak(self):
+        solr_query = {'sort': 'title_en asc'}
+        add_sort_tiebreak(solr_query)
+        add_sort_tiebreak(solr_query)
+        self.assertEqual(solr_query['sort'], 'title_en asc, id asc')
+        solr_query = {}
+        add_sort_tiebreak(solr_query)
+        self.assertEqual(solr_query['sort'], 'score desc, id asc')
+        for sort in ('id desc', 'title_en asc,id asc'):
+            solr_query = {'sort': sort}
+            add_sort_tiebreak(solr_query)
+            self.assertEqual(solr_query['sort'], sort)
+
+    def test_cursor_key(self):
+        solr_query = {'q': 'water', 'sort': 'score desc, id asc', 'rows': 10}
+        key = cursor_key('core_test', solr_query, 'en', 3)
+        self.assertEqual(cursor_key('core_test', dict(solr_query, start=20, cursorMark='cursor-20'), 'en', 3), key)
+        self.assertNotEqual(cursor_key('core_test', solr_query, 'en', 4), key)
+        self.assertNotEqual(cursor_key('core_test', solr_query, 'fr', 3), key)
+        self.assertNotEqual(cursor_key('core_test', dict(solr_query, q='air'), 'en', 3), key)
+
+    def test_saved_cursor(self):
+        solr_query = {'q': '*', 'sort': 'score desc, id asc', 'rows': 10}
+        self.assertEqual(get_cursor('core_test', solr_query, 'en', 1), FIRST_CURSOR)
+        self.assertIsNone(get_cursor('core_test', solr_query, 'en', 2))
+
+        use_cursor(solr_query, FIRST_CURSOR)
+        save_next_cursor(cursor_key('core_test', solr_query, 'en', 2), solr_query,
+                         self.cursor_response('cursor-10'))
+        self.assertEqual(get_cursor('core_test', solr_query, 'en', 2), 'cursor-10')
+
+        # At the end of the results Solr returns the same cursor, which is not kept for a page that does not exist
+        use_cursor(solr_query, 'cursor-20')
+        save_next_cursor(cursor_key('core_test', solr_query, 'en', 4), solr_query,
+                         self.cursor_response('cursor-20'))
+        self.assertIsNone(get_cursor('core_test', solr_query, 'en', 4))
+
+        invalidate_core_results('core_test')
+        self.assertIsNone(get_cursor('core_test', solr_query, 'en', 2))
+
+    def test_search_pages(self):
+        self.fake_solr.num_found = 45
+        queries = []
+        select_response = self.fake_solr.select_response
+
+        def spy(core_name, params):
+            queries.append(params)
+            return select_response(core_name, params)
+
+        self.fake_solr.select_response = spy
+
+        def search_page(page: int):
+            del queries[:]
+            path = '/search/en/test/'
+            response = SearchView.as_view()(self.request(path, data={'page': page}, PATH_INFO=path),
+                                            lang='en', search_type='test')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(queries), 1)
+            self.assertEqual(queries[0]['sort'][0].count('id asc'), 1)
+            return queries[0], response.content.decode('utf8')
+
+        def titles(first: int):
+            return ['>title_en {0}<'.format(n) for n in range(first, first + 10)]
+
+        # Page 1 starts a cursor, and each following page uses the cursor saved by the page before it
+        for page in (1, 2, 3):
+            query, content = search_page(page)
+            self.assertEqual(query['cursorMark'], [FIRST_CURSOR if page == 1 else 'cursor-{0}'.format((page - 1) * 10)])
+            self.assertEqual(query['start'], ['0'])
+            for title in titles((page - 1) * 10):
+                self.assertIn(title, content)
+
+        # A page without a saved cursor, like a bookmarked page, falls back to start and rows
+        query, content = search_page(5)
+        self.assertNotIn('cursorMark', query)
+        self.assertEqual(query['start'], ['40'])
+        for title in titles(40)[:5]:
+            self.assertIn(title, content)
+        self.assertNotIn('>title_en 39<', content)
+
+        # The cursor of page 4 was saved when page 3 was fetched
+        query, content = search_page(4)
+        self.assertEqual(query['cursorMark'], ['cursor-30'])
+        for title in titles(30):
+            self.assertIn(title, content)
+
+
+@override_settings(SOLR_RETRIES=2, SOLR_RETRY_BACKOFF=0)
+class AsyncSolrClientTestCase(TestCase):
+
+    def query(self, responses: list):
+        """
+        Send a query to a mock Solr server that gives each of the responses in turn
+        :param responses: httpx.Response objects, or the exceptions to raise
+        :return: the SolrResponse, and the requests that were sent
+        """
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            response = responses[len(requests) - 1]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        async def send():
+            solr = AsyncSolrClient('http://solr.test:8983/solr/')
+            solr.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                return await solr.query('core_test', {'q': 'water', 'fq': ['a:1', 'b:2'], 'rows': 10})
+            finally:
+                await solr.aclose()
+
+        return asyncio.run(send()), requests
+
+    def test_query(self):
+        data = {'responseHeader': {'status': 0, 'QTime': 1}, 'response': {'numFound': 1, 'start': 0,
+                                                                          'docs': [{'id': 'a'}]}}
+        solr_response, requests = self.query([httpx.Response(200, json=data)])
+        self.assertEqual(solr_response.docs, [{'id': 'a'}])
+        self.assertEqual(len(requests), 1)
+        self.assertEqual((requests[0].method, str(requests[0].url)),
+                         ('POST', 'http://solr.test:8983/solr/core_test/select'))
+        self.assertEqual(parse_qs(requests[0].content.decode('utf8')), {'q': ['water'], 'fq': ['a:1', 'b:2'],
+                                                                        'rows': ['10'], 'wt': ['json']})
+
+    def test_retries(self):
+        data = {'responseHeader': {'status': 0, 'QTime': 1}, 'response': {'numFound': 0, 'start': 0, 'docs': []}}
+        solr_response, requests = self.query([httpx.Response(503), httpx.ConnectError('refused'),
+                                              httpx.Response(200, json=data)])
+        self.assertEqual((solr_response.num_found, len(requests)), (0, 3))
+
+        # After SOLR_RETRIES retries, the last failure is reported
+        with self.assertRaises(SolrError) as error:
+            self.query([httpx.Response(502)] * 2 + [httpx.Response(503, text='Unavailable')])
+        self.assertIn('503', error.exception.args[0])
+        with self.assertRaises(SolrConnectionError) as error:
+            self.query([httpx.Response(503), httpx.Response(503), httpx.ReadTimeout('slow')])
+        self.assertEqual(error.exception.args[0], 'TIMEOUT')
+        with self.assertRaises(SolrConnectionError) as error:
+            self.query([httpx.ConnectError('refused')] * 3)
+        self.assertEqual(error.exception.args[0], 'N/A')
+
+    def test_errors(self):
+        # Errors that retrying will not fix are reported at once
+        for response, error_class in ((httpx.Response(404), SolrConnectionError),
+                                      (httpx.Response(401), SolrConnectionError),
+                                      (httpx.Response(400, json={'error': {'msg': 'undefined field'}}), SolrError),
+                                      (httpx.Response(200, json={'error': {'msg': 'undefined field'}}), SolrError),
+                                      (httpx.Response(200, json={'errors': [{'errorMessages': ['bad']}]}), SolrError)):
+            with self.assertRaises(error_class):
+                self.query([response, response, response])
+
+
+urlpatterns = [
+    path('search/<str:lang>/<str:search_type>/', AsyncSearchView.as_view()),
+    path('search/<str:lang>/<str:search_type>/record/<str:record_id>', AsyncRecordView.as_view()),
+    path('search/<str:lang>/<str:search_type>/export/', AsyncExportView.as_view()),
+    path('search/<str:lang>/<str:search_type>/similar/<str:record_id>', AsyncMoreLikeThisView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, SEARCH_RESULT_CACHE_TIMEOUT=0)
+class AsyncViewTestCase(PageTestCase):
+    """
+    Requests through the ASGI handler to the async views, which query the fake Solr server with AsyncSolrClient
+    """
+
+    async def get(self, path: str):
+        try:
+            response = await self.async_client.get(path)
+        finally:
+            await async_connection_manager.close()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    async def test_search(self):
+        content = (await self.get('/search/en/test/?page=2')).content.decode('utf8')
+        for n in range(10, 20):
+            self.assertIn('>title_en {0}<'.format(n), content)
+
+    async def test_record(self):
+        content = (await self.get('/search/en/test/record/a')).content.decode('utf8')
+        self.assertIn('title_en {0}'.format(zlib.crc32(b'a')), content)
+        self.assertIn('href="/search/en/test/similar/a"', content)
+
+    async def test_more_like_this(self):
+        content = (await self.get('/search/en/test/similar/a')).content.decode('utf8')
+        self.assertIn('>title_en {0}<'.format(zlib.crc32(b'a')), content)
+        for n in range(3):
+            self.assertIn('>title_en {0}<'.format(n), content)
+
+    @override_settings(EXPORT_STREAMING=True, EXPORT_ASYNC=False)
+    async def test_export(self):
+        response = await self.get('/search/en/test/export/?search_text=title')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = b''.join(response.streaming_content).decode('utf8').splitlines()
+        self.assertEqual(rows[1:], ['core_test-{0},title_en {0}'.format(n) for n in range(3)])
+
+
+class FullExportTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ExportCache(self.temp_dir.name, max_bytes=250, timeout=600)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_full_export_replaces_older_builds(self):
+        query = {'q': '*', 'fq': [], 'fl': 'id,title_en', 'sort': 'id asc'}
+        self.assertTrue(is_unfiltered(query))
+        self.assertFalse(is_unfiltered(dict(query, fq=['{!tag=tag_year}year:("2020")'])))
+        old_path = full_export_path(self.cache, 'ati', 'en', dict(query, fl='id'))
+        path = full_export_path(self.cache, 'ati', 'en', query)
+        self.assertNotEqual(old_path, path)
+        write_full_export(self.cache, old_path, ['id\r\n'])
+        write_full_export(self.cache, path, ['id,title_en\r\n', '1,A\r\n'])
+        self.assertEqual(remove_full_exports(self.cache, 'ati', 'en', keep=path), 1)
+        with gzip.open(path, 'rt', encoding='utf8', newline='') as export_file:
+            self.assertEqual(export_file.read(), 'id,title_en\r\n1,A\r\n')
+        # The sweep leaves full exports alone
+        self.assertEqual(self.cache.sweep(), (0, 0))
+        self.assertEqual(os.listdir(self.temp_dir.name), [os.path.basename(path)])
+
+
+@override_settings(SOLR_SHADOW_CORE_SUFFIX='_shadow')
+class CoreAdminTestCase(TestCase):
+
+    def load_shadow_core(self, admin, count):
+        shadow = create_shadow_core(admin, 'core_ati', '_default')
+        admin.schemas[shadow] = {'id', 'title_en'}
+        self.assertEqual(missing_schema_fields(admin, shadow, ['id', 'title_en', 'year']), ['year'])
+        admin.cores[shadow] = count
+        return shadow
+
+    def test_repeated_swaps(self):
+        admin = LocalCoreAdmin({'core_ati': 100})
+        for count in (100, 95):
+            shadow = self.load_shadow_core(admin, count)
+            new_dir = admin.instance_dir(shadow)
+            self.assertEqual(verify_shadow_core(admin, 'core_ati', shadow, 0.1), (admin.cores['core_ati'], count, ''))
+            swap_shadow_core(admin, 'core_ati', shadow)
+            self.assertEqual(admin.cores, {'core_ati': count})
+            self.assertEqual(admin.instance_dir('core_ati'), new_dir)
+
+        # The shrink guard refuses a core with too few documents, and the next import removes it
+        shadow = self.load_shadow_core(admin, 50)
+        live_count, shadow_count, error = verify_shadow_core(admin, 'core_ati', shadow, 0.1)
+        self.assertEqual((live_count, shadow_count), (95, 50))
+        self.assertIn('47% fewer', error)
+        self.load_shadow_core(admin, 0)
+        self.assertEqual(verify_shadow_core(admin, 'core_ati', shadow, 0.1)[2], 'The new core core_ati_shadow is empty')
+        self.assertEqual(sorted(admin.cores), ['core_ati', 'core_ati_shadow'])
+
+    def test_live_core_in_shadow_instance_dir(self):
+        # Left by a swap when every shadow core was created in the same instance directory
+        admin = LocalCoreAdmin({'core_ati': 100, 'core_ati_shadow': 100})
+        admin.instance_dirs = {'core_ati': 'core_ati_shadow', 'core_ati_shadow': 'core_ati_shadow'}
+        self.assertFalse(unload_old_core(admin, 'core_ati', 'core_ati_shadow'))
+        shadow = self.load_shadow_core(admin, 100)
+        self.assertNotEqual(admin.instance_dir(shadow), admin.instance_dir('core_ati'))
+        swap_shadow_core(admin, 'core_ati', shadow)
+        self.assertEqual(admin.instance_dir(shadow), '')
+
+
+class ImportManifestTestCase(TestCase):
+
+    def test_manifest_round_trip(self):
+        with tempfile.TemporaryDirectory() as manifest_dir, override_settings(IMPORT_MANIFEST_DIR=manifest_dir):
+            manifest = ImportManifest('ati', 'DEFAULT')
+            self.assertIsNone(manifest.load())
+            manifest.save({'a,1': 'abc', 'b "2"': 'def'})
+            self.assertEqual(manifest.load(), {'a,1': 'abc', 'b "2"': 'def'})
+        self.assertEqual(id_delete_query(['a,1', 'b "2"']), 'id:("a,1" OR "b \\"2\\"")')
+
+
+class StubSolrIndex:
+    """
+    Keeps the documents indexed by import_data_csv, and handles the delete queries that it sends
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    def index(self, core_name: str, docs: list):
+        self.docs.update((doc['id'], doc) for doc in docs)
+
+    def delete_doc_by_query(self, core_name: str, query: str):
+        if query == '*:*':
+            self.docs.clear()
+        elif query == 'format:NTR':
+            self.docs = {doc_id: doc for doc_id, doc in self.docs.items() if doc['format'] != 'NTR'}
+        else:
+            for doc_id in re.findall(r'"((?:[^"\\]|\\.)*)"', query):
+                self.docs.pop(doc_id.replace('\\"', '"').replace('\\\\', '\\'), None)
+
+    def commit(self, core_name: str, **kwargs):
+        pass
+
+
+@override_settings(EXPORT_FULL_ON_IMPORT=False, MLT_BUILD_ON_IMPORT=False)
+class ImportTestCase(TestCase):
+    databases = {'default', 'search'}
+
+    def setUp(self):
+        search = Search.objects.create(search_id='ntr_test', label_en='Test', label_fr='Essai',
+                                       solr_core_name='core_ntr', id_fields='ref_number')
+        for field_id, alt_format in (('owner_org', 'ALL'), ('year', 'ALL'), ('quarter', 'NTR'),
+                                     ('ref_number', ''), ('title_en', '')):
+            Field.objects.create(field_id=field_id, search_id=search, label_en=field_id, label_fr=field_id,
+                                 solr_field_type='string', alt_format=alt_format)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(IMPORT_MANIFEST_DIR=os.path.join(self.temp_dir.name, 'manifests'),
+                                          EXPORT_FILE_CACHE_DIR=os.path.join(self.temp_dir.name, 'cache'),
+                                          MLT_STORE_DIR=os.path.join(self.temp_dir.name, 'mlt'))
+        self.settings.enable()
+        self.solr = StubSolrIndex()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.temp_dir.cleanup()
+
+    def import_csv(self, rows: list, *args):
+        csv_path = os.path.join(self.temp_dir.name, 'import.csv')
+        with open(csv_path, 'w', encoding='utf8', newline='') as csv_file:
+            csv_writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+            csv_writer.writeheader()
+            csv_writer.writerows(rows)
+        with mock.patch('search.management.commands.import_data_csv.get_solr_client', return_value=self.solr), \
+                mock.patch('search.management.commands.import_data_csv.Command.csv_fields', {}), \
+                redirect_stdout(io.StringIO()):
+            call_command('import_data_csv', '--search', 'ntr_test', '--csv', csv_path, *args)
+
+    def test_full_import_then_ntr_delta(self):
+        ntr_rows = [{'owner_org': org, 'year': '2020', 'quarter': 'Q1'} for org in ('tbs-sct', 'fin')]
+        default_rows = [{'owner_org': 'tbs-sct', 'year': '2020', 'ref_number': 'R1', 'title_en': 'Travel'}]
+        ntr_ids = {'tbs-sct-2020-Q1', 'fin-2020-Q1'}
+
+        self.import_csv(ntr_rows, '--delta', '--nothing_to_report')
+        self.assertEqual(set(self.solr.docs), ntr_ids)
+        self.import_csv(ntr_rows, '--delta', '--nothing_to_report')
+        self.assertEqual(set(self.solr.docs), ntr_ids)
+
+        # A full import purges the whole core, the Nothing To Report records too
+        self.import_csv(default_rows)
+        self.assertEqual(set(self.solr.docs), {'R1'})
+        self.assertIsNone(ImportManifest('ntr_test', 'NTR').load())
+
+        # So the next NTR delta import reloads them instead of skipping them as unchanged
+        self.import_csv(ntr_rows, '--delta', '--nothing_to_report')
+        self.assertEqual(set(self.solr.docs), ntr_ids | {'R1'})
+
+    def test_pipeline_keeps_last_duplicate(self):
+        def index(core_name, docs):
+            # The batch with the first copy of R1 is slow, so a batch queued after it could be indexed first
+            if any(doc['title_en'] == 'first' for doc in docs):
+                sleep(0.2)
+            StubSolrIndex.index(self.solr, core_name, docs)
+
+        self.solr.index = index
+        rows = [{'owner_org': 'tbs-sct', 'year': '2020', 'ref_number': ref_number, 'title_en': title}
+                for ref_number, title in (('R1', 'first'), ('R2', ''), ('R3', ''), ('R4', ''), ('R1', 'last'),
+                                          ('R5', ''))]
+        with mock.patch('search.management.commands.import_data_csv.Command.cycle_on', 2):
+            self.import_csv(rows, '--pipeline', '--workers', '2', '--index_threads', '3')
+        self.assertEqual(set(self.solr.docs), {'R1', 'R2', 'R3', 'R4', 'R5'})
+        self.assertEqual(self.solr.docs['R1']['title_en'], 'last')
+
+        with self.assertRaises(SystemExit):
+            self.import_csv(rows, '--pipeline', '--delta')
+
+    def test_swap_refused_for_ntr_search(self):
+        self.solr.index('core_ntr', [{'id': 'R1', 'format': 'DEFAULT'}, {'id': 'fin-2020-Q1', 'format': 'NTR'}])
+        with mock.patch('search.management.commands.import_data_csv.HttpCoreAdmin') as core_admin:
+            with self.assertRaises(SystemExit):
+                self.import_csv([{'owner_org': 'fin', 'year': '2020', 'ref_number': 'R2', 'title_en': 'Travel'}],
+                                '--swap')
+        core_admin.assert_not_called()
+        self.assertEqual(set(self.solr.docs), {'R1', 'fin-2020-Q1'})
+
+
+class NavigationTestCase(TestCase):
+
+    def test_back_url(self):
+        factory = RequestFactory()
+        search_url = 'http://testserver/search/en/ati/?search_text=travel'
+        request = factory.get('/search/en/ati/record/1', HTTP_REFERER=search_url)
+        self.assertEqual(search_back_url(request, 'ati'), search_url)
+        request = factory.get('/search/en/ati/record/1', HTTP_REFERER='http://example.com/search/en/ati/')
+        self.assertEqual(search_back_url(request, 'ati'), '')
+
+        # The similar records page passes the URL on in a signed parameter that cannot be changed
+        query = back_query(search_url)
+        self.assertEqual(search_back_url(factory.get('/search/en/ati/record/1?' + query), 'ati'), search_url)
+        self.assertEqual(search_back_url(factory.get('/search/en/ati/record/1?' + query[:-2]), 'ati'), '')
+
+
+class FragmentTestCase(TestCase):
+    databases = {'default', 'search'}
+
+    def test_fragments_are_rendered_once_per_configuration(self):
+        search = Search.objects.create(search_id='test', label_en='Test', label_fr='Essai')
+        template = engines['django'].from_string(
+            "{% load search_extras %}{% search_fragment 'snippets/default_about_message.html' about_msg %}")
+        clear_fragments()
+        self.assertIn('<strong>one</strong>', template.render({'search_type': 'test', 'about_msg': '**one**'}))
+        self.assertIn('<strong>two</strong>', template.render({'search_type': 'test', 'about_msg': '**two**'}))
+        template.render({'search_type': 'test', 'about_msg': '**one**'})
+        self.assertEqual(render_markdown.cache_info().misses, 2)
+
+        # Saving the search empties the cache
+        search.save()
+        template.render({'search_type': 'test', 'about_msg': '**one**'})
+        self.assertEqual(len(_fragment_cache()), 1)
@@ -0,0 +1,180 @@
+"""
+Per-request timing of the phases of a search request.
+
+When SERVER_TIMING_ENABLED is set, ServerTimingMiddleware starts a RequestTimer for each request. The views time
+their phases with current_timer().phase(name): loading the configuration, building the Solr query, the plugin hooks,
+the Solr round trip, parsing the results and rendering the template. Solr's own QTime is recorded next to the wall
+clock time of the round trip, so the network and JSON overhead is the difference between them. The timings are sent
+to the browser in a Server-Timing header and added to histograms per search and route, which MetricsView publishes in
+the Prometheus text format.
+
+When timing is disabled, current_timer() returns a timer that does nothing, so the instrumentation in the views costs
+one function call per phase.
+"""
+from asgiref.local import Local
+from collections import OrderedDict
+from django.conf import settings
+import threading
+from time import perf_counter
+
+PHASE_DESCRIPTIONS = {
+    'config': 'Configuration',
+    'query': 'Query build',
+    'plugin': 'Plugin hooks',
+    'solr': 'Solr round trip',
+    'solr_qtime': 'Solr QTime',
+    'parse': 'Response parsing',
+    'render': 'Template render',
+    'export': 'Export file',
+    'total': 'Total',
+}
+
+
+class _Phase:
+
+    def __init__(self, timer, name: str):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timer.add(self.name, perf_counter() - self.start)
+
+
+class RequestTimer:
+    """
+    Total seconds spent in each phase of one request. A phase that runs more than once, like the plugin hooks,
+    accumulates its time.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.durations = OrderedDict()
+
+    def phase(self, name: str):
+        return _Phase(self, name)
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def add_qtime(self, solr_response):
+        self.add('solr_qtime', solr_response.query_time / 1000)
+
+    def finish(self):
+        self.durations['total'] = perf_counter() - self.start
+
+    def header(self):
+        return ', '.join('{0};dur={1:.1f};desc="{2}"'.format(name, seconds * 1000, PHASE_DESCRIPTIONS.get(name, name))
+                         for name, seconds in self.durations.items())
+
+
+class _NullPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class _NullTimer:
+
+    _phase = _NullPhase()
+
+    def phase(self, name: str):
+        return self._phase
+
+    def add(self, name: str, seconds: float):
+        pass
+
+    def add_qtime(self, solr_response):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+# asgiref's Local rather than a thread local, so that each request handled by an ASGI event loop has its own timer,
+# and the timer follows the request into the worker threads of sync_to_async. Unlike contextvars, it also works on
+# Python 3.6.
+_local = Local()
+
+
+def start_timer():
+    timer = RequestTimer()
+    _local.timer = timer
+    return timer
+
+
+def stop_timer():
+    _local.timer = NULL_TIMER
+
+
+def current_timer():
+    """
+    The timer of the request being handled, or a timer that does nothing.
+    """
+    return getattr(_local, 'timer', NULL_TIMER)
+
+
+class PhaseHistograms:
+    """
+    Cumulative histograms of the phase timings, labelled by search, route and phase. Each worker process has its own
+    histograms.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        # (search, route, phase): [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, search_type: str, route: str, durations: dict):
+        with self._lock:
+            for phase, seconds in durations.items():
+                key = (search_type, route, phase)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        series[i] += 1
+                series[-2] += seconds
+                series[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self, name='ocs_request_phase_seconds'):
+        lines = ['# HELP {0} Time spent in each phase of a search request'.format(name),
+                 '# TYPE {0} histogram'.format(name)]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for (search_type, route, phase), values in series:
+            labels = 'search="{0}",route="{1}",phase="{2}"'.format(_escape(search_type), _escape(route), _escape(phase))
+            for bound, count in zip(self.buckets, values):
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, count))
+            lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, labels, values[-1]))
+            lines.append('{0}_sum{{{1}}} {2}'.format(name, labels, values[-2]))
+            lines.append('{0}_count{{{1}}} {2}'.format(name, labels, values[-1]))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(label_value: str):
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_histograms = None
+_histograms_lock = threading.Lock()
+
+
+def get_histograms():
+    global _histograms
+    if _histograms is None:
+        with _histograms_lock:
+            if _histograms is None:
+                _histograms = PhaseHistograms(settings.SERVER_TIMING_BUCKETS)
+    return _histograms
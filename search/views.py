@@ -1,27 +1,30 @@
 import csv
 from django.conf import settings
-from django.http import HttpRequest, HttpResponseRedirect, FileResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, FileResponse, JsonResponse, \
+    StreamingHttpResponse, Http404
 from django.views.generic import View
 from django.shortcuts import render, redirect
+from django.utils.cache import patch_vary_headers
 from .forms import FieldForm
 import hashlib
-import importlib
 import os
-import pkgutil
+import re
+from .export import stream_export_csv, stream_solr_export
+from .export_cache import get_export_cache
+from .export_jobs import submit_export_job, get_export_job_status, clear_export_job_error, JOB_FAILED, JOB_READY
+from .full_export import accepts_gzip, full_export_path, is_unfiltered, iter_full_export
+from .decorate import decorate_docs
 from .query import calc_pagination_range, calc_starting_row, create_solr_query, create_solr_mlt_query
-from search.models import Search, Field, Code
-import search.plugins
-from SolrClient import SolrClient, SolrResponse
+from search.mlt_store import get_neighbour_store, neighbour_query, neighbour_response
+from search.navigation import BACK_PARAM, back_query, record_url, search_back_url, unsign_back_url
+from search.paging import add_sort_tiebreak, cursor_key, cursor_paging_enabled, get_cursor, save_next_cursor, use_cursor
+from search.plugin_registry import get_plugin_hooks, render_hook_stats
+from search.registry import get_configuration
+from search.result_cache import add_cached_facets, cached_solr_query, use_cached_facets
+from search.solr_connections import get_solr_client
+from search.timing import current_timer, get_histograms
+from SolrClient import SolrResponse
 from SolrClient.exceptions import ConnectionError, SolrError
-from time import time
-
-
-def iter_namespace(ns_pkg):
-    # Specifying the second argument (prefix) to iter_modules makes the
-    # returned name an absolute name instead of a relative one. This allows
-    # import_module to work without having to do additional modification to
-    # the name.
-    return pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + ".")
 
 
 def get_error_context(search_type: str, lang: str, error_msg=""):
@@ -78,79 +81,26 @@ class SearchView(View):
     display_fields_names_en = {}
     display_fields_names_fr = {}
 
-    discovered_plugins = {}
-
     def __init__(self):
         super().__init__()
 
-        # Original function copied from https://packaging.python.org/guides/creating-and-discovering-plugins/
-        self.discovered_plugins = {
-            name: importlib.import_module(name)
-            for finder, name, ispkg
-            in iter_namespace(search.plugins)
-        }
-
-        # Load Search and Field configuration
-        search_queryset = Search.objects.all()
-        for s in search_queryset:
-            self.searches[s.search_id] = s
-        for sid in self.searches.keys():
-            sfields = {}
-            facet_list_en = []
-            facet_list_fr = []
-            display_list_en = []
-            display_list_fr = []
-            field_queryset = Field.objects.filter(search_id_id=sid)
-            for f in field_queryset:
-                sfields[f.field_id] = f
-            field_queryset = Field.objects.filter(search_id_id=sid).filter(is_search_facet=True).order_by('solr_facet_display_order')
-            for f in field_queryset:
-                if f.solr_field_lang == 'en':
-                    facet_list_en.append(f.field_id)
-                elif f.solr_field_lang == 'fr':
-                    facet_list_fr.append(f.field_id)
-                elif f.solr_field_lang == 'bi':
-                    facet_list_en.append(f.field_id)
-                    facet_list_fr.append(f.field_id)
-            field_queryset = Field.objects.filter(search_id_id=sid).filter(is_default_display=True)
-            for f in field_queryset:
-                if f.is_default_display and f.solr_field_lang == 'en':
-                    display_list_en.append(f.field_id)
-                elif f.is_default_display and f.solr_field_lang == 'fr':
-                    display_list_fr.append(f.field_id)
-                elif f.is_default_display and f.solr_field_lang == 'bi':
-                    display_list_en.append(f.field_id)
-                    display_list_fr.append(f.field_id)
-
-            self.fields[sid] = sfields
-            self.facets_en[sid] = facet_list_en
-            self.facets_fr[sid] = facet_list_fr
-            self.display_fields_en[sid] = display_list_en
-            self.display_fields_fr[sid] = display_list_fr
-            self.display_fields_names_en[sid] = self.get_default_display_fields('en', sid)
-            self.display_fields_names_fr[sid] = self.get_default_display_fields('fr', sid)
-
-        # Load Code configuration
-        codes_queryset = Code.objects.all()
-        for code in codes_queryset:
-            if code.field_id.field_id in self.codes_en:
-                self.codes_en[code.field_id.field_id][code.code_id] = code.label_en
-                self.codes_fr[code.field_id.field_id][code.code_id] = code.label_fr
-            else:
-                self.codes_en[code.field_id.field_id] = {code.code_id: code.label_en}
-                self.codes_fr[code.field_id.field_id] = {code.code_id: code.label_fr}
-
-    def get_default_display_fields(self, lang: str, search_type: str):
-        display_field_name = {}
-        for f in self.fields[search_type]:
-            if self.fields[search_type][f].solr_field_lang in [lang, 'bi']:
-                if lang == 'en' and not f[:2] == 'fr':
-                    display_field_name[f] = self.fields[search_type][f].label_en
-                    continue
-                elif lang == 'fr' and not f[:2] == 'en':
-                    display_field_name[f] = self.fields[search_type][f].label_fr
-                    continue
-        return display_field_name
+        with current_timer().phase('config'):
+            # Use the process-wide search configuration instead of reloading it from the database on every request
+            config = get_configuration()
+        self.searches = config.searches
+        self.fields = config.fields
+        self.facets_en = config.facets_en
+        self.facets_fr = config.facets_fr
+        self.codes_en = config.codes_en
+        self.codes_fr = config.codes_fr
+        self.display_fields_en = config.display_fields_en
+        self.display_fields_fr = config.display_fields_fr
+        self.display_fields_names_en = config.display_fields_names_en
+        self.display_fields_names_fr = config.display_fields_names_fr
+        self.query_plans_en = config.query_plans_en
+        self.query_plans_fr = config.query_plans_fr
+        self.display_plans_en = config.display_plans_en
+        self.display_plans_fr = config.display_plans_fr
 
     def default_context(self, request: HttpRequest, search_type: str, lang: str):
         context = {
@@ -192,55 +142,67 @@ class SearchView(View):
 
     def get(self, request: HttpRequest, lang='en', search_type=''):
         lang = request.LANGUAGE_CODE
-        request.session['prev_search'] = request.build_absolute_uri()
         if search_type in self.searches:
-            context = self.default_context(request, search_type, lang)
-            context["search_item_snippet"] = self.searches[search_type].search_item_snippet
-            context["download_ds_url"] = self.searches[search_type].dataset_download_url_fr if lang == 'fr' else self.searches[search_type].dataset_download_url_en
-            context["download_ds_text"] = self.searches[search_type].dataset_download_text_fr if lang == 'fr' else self.searches[search_type].dataset_download_text_en
-            context["search_text"] = request.GET.get("search_text", "")
-            context["id_fields"] = self.searches[search_type].id_fields.split(',') if self.searches[
-                search_type].id_fields else []
-            context["export_path"] = "{0}export?{1}".format(request.META["PATH_INFO"], request.META["QUERY_STRING"])
-            context['about_msg'] = self.searches[search_type].about_message_fr if lang == 'fr' else self.searches[search_type].about_message_en
-
-            solr = SolrClient(settings.SOLR_SERVER_URL)
+            context, solr_query = self.prepare_search(request, search_type, lang)
 
-            core_name = self.searches[search_type].solr_core_name
+            # Query Solr
 
-            # Get the search result boundaries
-            start_row, page = calc_starting_row(request.GET.get('page', 1),
-                                                rows_per_page=self.searches[search_type].results_page_size)
+            try:
+                with current_timer().phase('solr'):
+                    solr_response = cached_solr_query(get_solr_client(), self.searches[search_type].solr_core_name,
+                                                      solr_query, lang, highlight=True)
+                return self.search_response(request, search_type, lang, context, solr_query, solr_response)
+            except (ConnectionError, SolrError) as ce:
+                return render(request, 'error.html', get_error_context(search_type, lang, ce.args[0]))
 
-            # Compose the Solr query
-            facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
-            reversed_facets = []
-            for facet in facets:
-                if self.fields[search_type][facet].solr_facet_display_reversed:
-                    reversed_facets.append(facet)
-            context['reversed_facets'] = reversed_facets
-
-            # Determine a default sort  - only used by the query if a valid sort order is not specified. Use the
-            # first soft specified in the search model, or use score if nothing is specified
-
-            default_sort_order = 'score desc'
-            if request.LANGUAGE_CODE == 'fr':
-                if self.searches[search_type].results_sort_order_fr:
-                    default_sort_order = self.searches[search_type].results_sort_order_fr.split(',')[0]
-            else:
-                if self.searches[search_type].results_sort_order_en:
-                    default_sort_order = self.searches[search_type].results_sort_order_en.split(',')[0]
+        else:
+            return render(request, '404.html', get_error_context(search_type, lang))
 
+    def prepare_search(self, request: HttpRequest, search_type: str, lang: str):
+        """
+        Build the context and the Solr query of a search page, up to the pre-search plugin hook.
+        :return: the context and the Solr query
+        """
+        timer = current_timer()
+        context = self.default_context(request, search_type, lang)
+        context["search_item_snippet"] = self.searches[search_type].search_item_snippet
+        context["download_ds_url"] = self.searches[search_type].dataset_download_url_fr if lang == 'fr' else self.searches[search_type].dataset_download_url_en
+        context["download_ds_text"] = self.searches[search_type].dataset_download_text_fr if lang == 'fr' else self.searches[search_type].dataset_download_text_en
+        context["search_text"] = request.GET.get("search_text", "")
+        context["id_fields"] = self.searches[search_type].id_fields.split(',') if self.searches[
+            search_type].id_fields else []
+        context["export_path"] = "{0}export?{1}".format(request.META["PATH_INFO"], request.META["QUERY_STRING"])
+        context['about_msg'] = self.searches[search_type].about_message_fr if lang == 'fr' else self.searches[search_type].about_message_en
+
+        # Get the search result boundaries
+        start_row, page = calc_starting_row(request.GET.get('page', 1),
+                                            rows_per_page=self.searches[search_type].results_page_size)
+
+        # Compose the Solr query
+        facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
+        reversed_facets = []
+        for facet in facets:
+            if self.fields[search_type][facet].solr_facet_display_reversed:
+                reversed_facets.append(facet)
+        context['reversed_facets'] = reversed_facets
+        context['currentpage'] = page
+
+        # The default sort is only used by the query if a valid sort order is not specified. It is the
+        # first sort specified in the search model, or score if nothing is specified
+        query_plan = self.query_plans_fr[search_type] if lang == 'fr' else self.query_plans_en[search_type]
+
+        with timer.phase('query'):
             solr_query = create_solr_query(request, self.searches[search_type], self.fields[search_type],
                                            self.codes_fr if lang == 'fr' else self.codes_en,
                                            facets, start_row, self.searches[search_type].results_page_size,
                                            record_id='', export=False, highlighting=True,
-                                           default_sort=default_sort_order)
+                                           default_sort=query_plan.default_sort, plan=query_plan)
 
-            # Call  plugin pre-solr-query if defined
-            search_type_plugin = 'search.plugins.{0}'.format(search_type)
-            if search_type_plugin in self.discovered_plugins:
-                context, solr_query = self.discovered_plugins[search_type_plugin].pre_search_solr_query(
+        # Call  plugin pre-solr-query if defined
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.pre_search_solr_query:
+            with timer.phase('plugin'):
+                context, solr_query = plugin_hooks.pre_search_solr_query(
                     context,
                     solr_query,
                     request,
@@ -249,82 +211,101 @@ class SearchView(View):
                     facets,
                     '')
 
-            # Query Solr
+        # Use a Solr cursor for the page if one is known, so that deep pages are as quick as the first ones
+        context['sort'] = solr_query['sort']
+        if cursor_paging_enabled():
+            add_sort_tiebreak(solr_query)
+            core_name = self.searches[search_type].solr_core_name
+            cursor = get_cursor(core_name, solr_query, lang, page)
+            if cursor:
+                context['next_cursor_key'] = cursor_key(core_name, solr_query, lang, page + 1)
+                use_cursor(solr_query, cursor)
+
+        # The facet counts do not change between the pages and sort orders of a search, so only ask Solr for them once
+        context['cached_facets'] = use_cached_facets(self.searches[search_type].solr_core_name, solr_query, lang)
+
+        return context, solr_query
+
+    def search_response(self, request: HttpRequest, search_type: str, lang: str, context: dict, solr_query: dict,
+                        solr_response: SolrResponse):
+        """
+        Render a search page from the Solr results, starting with the post-search plugin hook.
+        """
+        timer = current_timer()
+        facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
+        query_plan = self.query_plans_fr[search_type] if lang == 'fr' else self.query_plans_en[search_type]
+        page = context['currentpage']
+
+        if context['cached_facets']:
+            add_cached_facets(context['cached_facets'], solr_response)
+
+        # Call  plugin post-solr-query if it exists
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.post_search_solr_query:
+            with timer.phase('plugin'):
+                context, solr_response = plugin_hooks.post_search_solr_query(
+                    context,
+                    solr_response,
+                    solr_query,
+                    request,
+                    self.searches[search_type], self.fields[search_type],
+                    self.codes_fr if lang == 'fr' else self.codes_en,
+                    facets,
+                    '')
 
-            try:
-                solr_response = solr.query(core_name, solr_query, highlight=True)
+        if 'next_cursor_key' in context:
+            save_next_cursor(context['next_cursor_key'], solr_query, solr_response)
+
+        with timer.phase('parse'):
+            if len(facets) > 0:
+                # Facet search results
+                context['facets'] = solr_response.get_facets()
+                # Get the selected facets from the search URL
+                selected_facets = {}
+
+                for request_field in request.GET.keys():
+                    if request_field in self.fields[search_type] and request_field in context['facets']:
+                        selected_facets[request_field] = request.GET.get(request_field, "").split('|')
+                context['selected_facets'] = selected_facets
+                # Provide human friendly facet labels to the web page and any custom snippets
+                facets_custom_snippets = {}
+                for f in context['facets']:
+                    context['facets'][f]['__label__'] = self.fields[search_type][f].label_fr if lang == 'fr' else self.fields[search_type][f].label_en
+                    if self.fields[search_type][f].solr_facet_snippet:
+                        facets_custom_snippets[f] = self.fields[search_type][f].solr_facet_snippet
+                context['facet_snippets'] = facets_custom_snippets
+            else:
+                context['facets'] = []
+                context['selected_facets'] = []
+            context['total_hits'] = solr_response.num_found
+            context['docs'] = decorate_docs(solr_response.get_highlighting(),
+                                            self.display_plans_fr[search_type] if lang == 'fr' else self.display_plans_en[search_type],
+                                            context['parent_path'])
 
-                # Call  plugin post-solr-query if it exists
-                if search_type_plugin in self.discovered_plugins:
-                    context, solr_response = self.discovered_plugins[search_type_plugin].post_search_solr_query(
-                        context,
-                        solr_response,
-                        solr_query,
-                        request,
-                        self.searches[search_type], self.fields[search_type],
-                        self.codes_fr if lang == 'fr' else self.codes_en,
-                        facets,
-                        '')
-
-                if len(facets) > 0:
-                    # Facet search results
-                    context['facets'] = solr_response.get_facets()
-                    # Get the selected facets from the search URL
-                    selected_facets = {}
-
-                    for request_field in request.GET.keys():
-                        if request_field in self.fields[search_type] and request_field in context['facets']:
-                            selected_facets[request_field] = request.GET.get(request_field, "").split('|')
-                    context['selected_facets'] = selected_facets
-                    # Provide human friendly facet labels to the web page and any custom snippets
-                    facets_custom_snippets = {}
-                    for f in context['facets']:
-                        context['facets'][f]['__label__'] = self.fields[search_type][f].label_fr if lang == 'fr' else self.fields[search_type][f].label_en
-                        if self.fields[search_type][f].solr_facet_snippet:
-                            facets_custom_snippets[f] = self.fields[search_type][f].solr_facet_snippet
-                    context['facet_snippets'] = facets_custom_snippets
-                else:
-                    context['facets'] = []
-                    context['selected_facets'] = []
-                context['total_hits'] = solr_response.num_found
-                context['docs'] = solr_response.get_highlighting()
-
-                # Prepare a dictionary of language appropriate sort options
-                sort_options = {}
-                sort_labels = self.searches[search_type].results_sort_order_display_fr.split(',') if lang == 'fr' else self.searches[search_type].results_sort_order_display_en.split(',')
-                if lang == 'fr':
-                    for i, v in enumerate(self.searches[search_type].results_sort_order_fr.split(',')):
-                        sort_options[v] = str(sort_labels[i]).strip()
-                else:
-                    for i, v in enumerate(self.searches[search_type].results_sort_order_en.split(',')):
-                        sort_options[v] = str(sort_labels[i]).strip()
-                context['sort_options'] = sort_options
-                context['sort'] = solr_query['sort']
-
-                # Add code information
-                context['codes'] = self.codes_fr if lang == 'fr' else self.codes_en
-
-                # Save display fields
-                context['default_display_fields'] = self.display_fields_fr[search_type] if lang == 'fr' else self.display_fields_en[search_type]
-                context['display_field_name'] = self.display_fields_names_fr[search_type] if lang == 'fr' else self.display_fields_names_en[search_type]
-
-                # Calculate pagination for the search page
-                context['pagination'] = calc_pagination_range(solr_response.num_found, self.searches[search_type].results_page_size, page, 3)
-                context['previous_page'] = (1 if page == 1 else page - 1)
-                last_page = (context['pagination'][len(context['pagination']) - 1] if len(context['pagination']) > 0 else 1)
-                last_page = (1 if last_page < 1 else last_page)
-                context['last_page'] = last_page
-                next_page = page + 1
-                next_page = (last_page if next_page > last_page else next_page)
-                context['next_page'] = next_page
-                context['currentpage'] = page
-
-                return render(request, self.searches[search_type].page_template, context)
-            except (ConnectionError, SolrError) as ce:
-                return render(request, 'error.html', get_error_context(search_type, lang, ce.args[0]))
+            # The language appropriate sort options
+            context['sort_options'] = dict(query_plan.sort_options)
 
-        else:
-            return render(request, '404.html', get_error_context(search_type, lang))
+            # Add code information
+            context['codes'] = self.codes_fr if lang == 'fr' else self.codes_en
+
+            # Save display fields
+            context['default_display_fields'] = self.display_fields_fr[search_type] if lang == 'fr' else self.display_fields_en[search_type]
+            context['display_field_name'] = self.display_fields_names_fr[search_type] if lang == 'fr' else self.display_fields_names_en[search_type]
+
+            # Calculate pagination for the search page
+            context['pagination'] = calc_pagination_range(solr_response.num_found, self.searches[search_type].results_page_size, page, 3,
+                                                          max_page=settings.SEARCH_CURSOR_PAGING_DEPTH)
+            context['previous_page'] = (1 if page == 1 else page - 1)
+            last_page = (context['pagination'][len(context['pagination']) - 1] if len(context['pagination']) > 0 else 1)
+            last_page = (1 if last_page < 1 else last_page)
+            context['last_page'] = last_page
+            next_page = page + 1
+            next_page = (last_page if next_page > last_page else next_page)
+            context['next_page'] = next_page
+            context['currentpage'] = page
+
+        with timer.phase('render'):
+            return render(request, self.searches[search_type].page_template, context)
 
 
 class RecordView(SearchView):
@@ -332,31 +313,52 @@ class RecordView(SearchView):
     def get(self, request: HttpRequest, lang='en', search_type='', record_id=''):
         lang = request.LANGUAGE_CODE
         if search_type in self.searches:
-            context = self.default_context(request, search_type, lang)
-            context['record_detail_snippet'] = self.searches[search_type].record_detail_snippet
-            context["download_ds_url_en"] = self.searches[search_type].dataset_download_url_fr if lang == 'fr' else self.searches[search_type].dataset_download_url_en
-            context["search_text"] = request.GET.get("search_text", "")
-            if 'prev_search' in request.session:
-                context['back_to_url'] =  request.session['prev_search']
-            request.session['prev_record'] = request.build_absolute_uri()
-            solr = SolrClient(settings.SOLR_SERVER_URL)
+            context, solr_query = self.prepare_record(request, search_type, lang, record_id)
 
-            core_name = self.searches[search_type].solr_core_name
+            # Query Solr
+            timer = current_timer()
+            with timer.phase('solr'):
+                solr_response = get_solr_client().query(self.searches[search_type].solr_core_name, solr_query)
+            timer.add_qtime(solr_response)
+
+            return self.record_response(request, search_type, lang, record_id, context, solr_query, solr_response)
 
-            # Get the search result boundaries
-            start_row, page = calc_starting_row(request.GET.get('page', 1), rows_per_page=5)
+        else:
 
-            # Compose the Solr query
-            facets = {}
+            return render(request, '404.html', get_error_context(search_type, lang))
 
+    def prepare_record(self, request: HttpRequest, search_type: str, lang: str, record_id: str):
+        """
+        Build the context and the Solr query of a record page, up to the pre-record plugin hook.
+        :return: the context and the Solr query
+        """
+        timer = current_timer()
+        context = self.default_context(request, search_type, lang)
+        context['record_detail_snippet'] = self.searches[search_type].record_detail_snippet
+        context["download_ds_url_en"] = self.searches[search_type].dataset_download_url_fr if lang == 'fr' else self.searches[search_type].dataset_download_url_en
+        context["search_text"] = request.GET.get("search_text", "")
+        back_url = search_back_url(request, search_type)
+        context['back_to_url'] = back_url
+        context['back_query'] = back_query(back_url)
+
+        # Get the search result boundaries
+        start_row, page = calc_starting_row(request.GET.get('page', 1), rows_per_page=5)
+
+        # Compose the Solr query
+        facets = {}
+        context['currentpage'] = page
+
+        with timer.phase('query'):
             solr_query = create_solr_query(request, self.searches[search_type], self.fields[search_type],
                                            self.codes_fr if lang == 'fr' else self.codes_en,
-                                           facets, start_row, 5, record_id)
-
-            # Call  plugin pre-solr-query if defined
-            search_type_plugin = 'search.plugins.{0}'.format(search_type)
-            if search_type_plugin in self.discovered_plugins:
-                context, solr_query = self.discovered_plugins[search_type_plugin].pre_record_solr_query(
+                                           facets, start_row, 5, record_id,
+                                           plan=self.query_plans_fr[search_type] if lang == 'fr' else self.query_plans_en[search_type])
+
+        # Call  plugin pre-solr-query if defined
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.pre_record_solr_query:
+            with timer.phase('plugin'):
+                context, solr_query = plugin_hooks.pre_record_solr_query(
                     context,
                     solr_query,
                     request,
@@ -365,12 +367,22 @@ class RecordView(SearchView):
                     facets,
                     record_id)
 
-            # Query Solr
-            solr_response = solr.query(core_name, solr_query)
-
-            # Call  plugin post-solr-query if it exists
-            if search_type_plugin in self.discovered_plugins:
-                context, solr_response = self.discovered_plugins[search_type_plugin].post_record_solr_query(
+        return context, solr_query
+
+    def record_response(self, request: HttpRequest, search_type: str, lang: str, record_id: str, context: dict,
+                        solr_query: dict, solr_response: SolrResponse):
+        """
+        Render a record page from the Solr results, starting with the post-record plugin hook.
+        """
+        timer = current_timer()
+        facets = {}
+        page = context['currentpage']
+
+        # Call  plugin post-solr-query if it exists
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.post_record_solr_query:
+            with timer.phase('plugin'):
+                context, solr_response = plugin_hooks.post_record_solr_query(
                     context,
                     solr_response,
                     solr_query,
@@ -380,30 +392,20 @@ class RecordView(SearchView):
                     facets,
                     record_id)
 
+        with timer.phase('parse'):
             context['facets'] = []
             context['selected_facets'] = []
             context['total_hits'] = solr_response.num_found
-            context['docs'] = solr_response.get_highlighting()
+            display_plan = self.display_plans_fr[search_type] if lang == 'fr' else self.display_plans_en[search_type]
+            context['docs'] = decorate_docs(solr_response.get_highlighting(), display_plan, context['parent_path'],
+                                            record=True)
 
             # Add code information
             context['codes'] = self.codes_fr if lang == 'fr' else self.codes_en
 
-            display_fields = []
-            display_field_name = {}
-            for f in self.fields[search_type]:
-                if self.fields[search_type][f].solr_field_lang in [request.LANGUAGE_CODE, 'bi']:
-                    if request.LANGUAGE_CODE == 'en' and not f[:2] == 'fr':
-                        display_fields.append(f)
-                        display_field_name[f] = self.fields[search_type][f].label_en
-                        continue
-                    elif request.LANGUAGE_CODE == 'fr' and not f[:2] == 'en':
-                        display_fields.append(f)
-                        display_field_name[f] = self.fields[search_type][f].label_fr
-                        continue
-                    if self.fields[search_type][f].solr_extra_fields:
-                        display_fields.extend(self.fields[search_type][f].solr_extra_fields.split(","))
-            context['display_fields'] = display_fields
-            context['display_field_name'] = display_field_name
+            context['display_fields'] = list(display_plan.record_fields)
+            context['display_field_name'] = {f: field.label for f, field in display_plan.record_fields.items()
+                                              if field.label != f}
 
             # Calculate pagination for the search page
             context['pagination'] = calc_pagination_range(solr_response.num_found, 10, page)
@@ -416,27 +418,22 @@ class RecordView(SearchView):
             context['next_page'] = next_page
             context['currentpage'] = page
 
+        with timer.phase('render'):
             return render(request, self.searches[search_type].record_template, context)
 
-        else:
-
-            return render(request, '404.html', get_error_context(search_type, lang))
-
 
 class ExportView(SearchView):
 
     def __init__(self):
         super().__init__()
-        self.cache_dir = settings.EXPORT_FILE_CACHE_DIR
-        if not os.path.exists(self.cache_dir):
-            os.mkdir(self.cache_dir)
+        self.export_cache = get_export_cache()
 
     def cache_search_results_file(self, cached_filename: str, sr: SolrResponse, rows=100000):
 
         if len(sr.docs) == 0:
             return False
         if not os.path.exists(cached_filename):
-            with open(cached_filename, 'w', newline='', encoding='utf8') as csv_file:
+            with self.export_cache.atomic_write(cached_filename) as csv_file:
                 cache_writer = csv.writer(csv_file, dialect='excel')
                 headers = list(sr.docs[0])
                 headers[0] = u'\N{BOM}' + headers[0]
@@ -452,60 +449,156 @@ class ExportView(SearchView):
                         pass
         return True
 
-    def get(self, request: HttpRequest, lang='en', search_type=''):
-        lang = request.LANGUAGE_CODE
-        if search_type in self.searches:
-            # Check to see if a recent cached results exists and return that instead if it exists
-            hashed_query = hashlib.sha1(request.GET.urlencode().encode('utf8')).hexdigest()
-            cached_filename = os.path.join(self.cache_dir, "{0}_{1}.csv".format(hashed_query, lang))
-            if os.path.exists(cached_filename):
-                # If the cached file is over 5 minutes old, just delete and continue. In future, will want this to be a asynchronous opertaion
-                if time() - os.path.getmtime(cached_filename) > 600:
-                    os.remove(cached_filename)
-                else:
-                    if settings.EXPORT_FILE_CACHE_URL == "":
-                        return FileResponse(open(cached_filename, 'rb'), as_attachment=True)
-                    else:
-                        return HttpResponseRedirect(settings.EXPORT_FILE_CACHE_URL + "{0}_{1}.csv".format(hashed_query, lang))
-
-            solr = SolrClient(settings.SOLR_SERVER_URL)
-            core_name = self.searches[search_type].solr_core_name
-            facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
+    def serve_cached_file(self, cached_filename: str):
+        if settings.EXPORT_FILE_CACHE_URL == "":
+            return FileResponse(open(cached_filename, 'rb'), as_attachment=True)
+        else:
+            return HttpResponseRedirect(settings.EXPORT_FILE_CACHE_URL + os.path.basename(cached_filename))
+
+    def serve_full_export(self, request: HttpRequest, full_export: str):
+        """
+        Full exports are always served here, rather than from EXPORT_FILE_CACHE_URL, so that clients get a CSV file
+        whether or not they accept gzip.
+        :return: a response with the pre-built full export, or None if there is no full export for the query
+        """
+        try:
+            export_file = open(full_export, 'rb')
+        except FileNotFoundError:
+            return None
+        # The file is named like the other exports, without the .gz
+        filename = os.path.basename(full_export)[:-3]
+        if accepts_gzip(request):
+            response = FileResponse(export_file, as_attachment=True, filename=filename, content_type='text/csv')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(iter_full_export(export_file), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def export_query(self, request: HttpRequest, search_type: str, lang: str):
+        """
+        :return: the Solr /export query of the request, after the pre_export_solr_query plugin hook, and whether the
+        request asks for every record
+        """
+        facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
+        with current_timer().phase('query'):
             solr_query = create_solr_query(request, self.searches[search_type], self.fields[search_type],
                                            self.codes_fr if lang == 'fr' else self.codes_en,
-                                           facets, 1, 0, record_id='', export=True)
-
-            # Call  plugin pre-solr-query if defined
-            search_type_plugin = 'search.plugins.{0}'.format(search_type)
-            if search_type_plugin in self.discovered_plugins:
-                solr_query = self.discovered_plugins[search_type_plugin].pre_export_solr_query(
+                                           facets, 1, 0, record_id='', export=True,
+                                           plan=self.query_plans_fr[search_type] if lang == 'fr' else self.query_plans_en[search_type])
+        unfiltered = is_unfiltered(solr_query)
+
+        # Call  plugin pre-solr-query if defined
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.pre_export_solr_query:
+            with current_timer().phase('plugin'):
+                solr_query = plugin_hooks.pre_export_solr_query(
                     solr_query,
                     request,
                     self.searches[search_type], self.fields[search_type],
                     self.codes_fr if lang == 'fr' else self.codes_en,
                     facets)
+        return solr_query, unfiltered
 
-            solr_response = solr.query(core_name, solr_query, request_handler='export')
+    def get(self, request: HttpRequest, lang='en', search_type=''):
+        lang = request.LANGUAGE_CODE
+        timer = current_timer()
+        if search_type in self.searches:
+            # Check to see if a recent cached results exists and return that instead if it exists
+            hashed_query = hashlib.sha1(request.GET.urlencode().encode('utf8')).hexdigest()
+            job_id = "{0}_{1}".format(hashed_query, lang)
+            cached_filename = self.export_cache.path(search_type, job_id)
+            self.export_cache.maybe_sweep(settings.EXPORT_FILE_CACHE_SWEEP_INTERVAL)
+            if self.export_cache.get(cached_filename):
+                return self.serve_cached_file(cached_filename)
+
+            if settings.EXPORT_ASYNC and get_export_job_status(cached_filename) == JOB_FAILED:
+                # Report the failure once. Requesting the export again starts a new job.
+                return render(request, 'error.html', get_error_context(search_type, lang,
+                                                                       clear_export_job_error(cached_filename)))
+
+            solr = get_solr_client()
+            core_name = self.searches[search_type].solr_core_name
+            facets = self.facets_fr[search_type] if lang == 'fr' else self.facets_en[search_type]
+            plugin_hooks = get_plugin_hooks(search_type)
+            solr_query, unfiltered = self.export_query(request, search_type, lang)
+
+            # The post-export plugin hook needs the whole Solr response, so the full, background and streamed
+            # exports, which never hold all of the documents in memory, are not used for searches that have one
+            buffered = bool(plugin_hooks.post_export_solr_query)
+
+            # Every record is exported after each load by the build_full_exports command
+            if unfiltered and not buffered:
+                response = self.serve_full_export(request, full_export_path(self.export_cache, search_type, lang,
+                                                                            solr_query))
+                if response is not None:
+                    return response
+
+            if settings.EXPORT_ASYNC and not buffered:
+                # Run the export in the background. The pending page reloads this URL until the file is ready.
+                field_names = solr_query['fl'].split(',') if isinstance(solr_query['fl'], str) else list(solr_query['fl'])
+                submit_export_job(job_id, cached_filename, core_name, solr_query, field_names)
+                context = self.default_context(request, search_type, lang)
+                context['status_url'] = "{0}status/{1}".format(request.META["PATH_INFO"], job_id)
+                context['export_path'] = request.get_full_path()
+                context['refresh_interval'] = settings.EXPORT_JOB_POLL_INTERVAL
+                return render(request, 'export_pending.html', context, status=202)
+
+            if settings.EXPORT_STREAMING and not buffered:
+                # Stream the rows to the client and the cache file as they arrive from Solr
+                field_names = solr_query['fl'].split(',') if isinstance(solr_query['fl'], str) else list(solr_query['fl'])
+                try:
+                    docs = stream_solr_export(core_name, solr_query)
+                except (ConnectionError, SolrError) as ce:
+                    return render(request, 'error.html', get_error_context(search_type, lang, ce.args[0]))
+                response = StreamingHttpResponse(stream_export_csv(docs, field_names, cached_filename),
+                                                 content_type='text/csv')
+                response['Content-Disposition'] = 'attachment; filename="{0}"'.format(os.path.basename(cached_filename))
+                return response
+
+            with timer.phase('solr'):
+                solr_response = solr.query(core_name, solr_query, request_handler='export')
 
             # Call  plugin pre-solr-query if defined
-            if search_type_plugin in self.discovered_plugins:
-                solr_query = self.discovered_plugins[search_type_plugin].post_export_solr_query(
-                    solr_response,
-                    solr_query,
-                    request,
-                    self.searches[search_type], self.fields[search_type],
-                    self.codes_fr if lang == 'fr' else self.codes_en,
-                    facets)
+            if plugin_hooks.post_export_solr_query:
+                with timer.phase('plugin'):
+                    solr_query = plugin_hooks.post_export_solr_query(
+                        solr_response,
+                        solr_query,
+                        request,
+                        self.searches[search_type], self.fields[search_type],
+                        self.codes_fr if lang == 'fr' else self.codes_en,
+                        facets)
 
-            if self.cache_search_results_file(cached_filename=cached_filename, sr=solr_response):
-                if settings.EXPORT_FILE_CACHE_URL == "":
-                    return FileResponse(open(cached_filename, 'rb'), as_attachment=True)
-                else:
-                    return HttpResponseRedirect(settings.EXPORT_FILE_CACHE_URL + "{0}_{1}.csv".format(hashed_query, lang))
+            with timer.phase('export'):
+                cached = self.cache_search_results_file(cached_filename=cached_filename, sr=solr_response)
+            if cached:
+                return self.serve_cached_file(cached_filename)
         else:
             return render(request, '404.html', get_error_context(search_type, lang))
 
 
+class ExportStatusView(ExportView):
+
+    job_id_pattern = re.compile('^[0-9a-f]{40}_(en|fr)$')
+
+    def get(self, request: HttpRequest, lang='en', search_type='', job_id=''):
+        if search_type not in self.searches or not self.job_id_pattern.match(job_id):
+            return JsonResponse({'job_id': job_id, 'status': 'unknown'}, status=404)
+        cached_filename = self.export_cache.path(search_type, job_id)
+        status = get_export_job_status(cached_filename)
+        if status == JOB_READY and 'download' in request.GET:
+            return self.serve_cached_file(cached_filename)
+        result = {'job_id': job_id, 'status': status}
+        if status == JOB_READY:
+            if settings.EXPORT_FILE_CACHE_URL == "":
+                result['download_url'] = request.path + '?download'
+            else:
+                result['download_url'] = settings.EXPORT_FILE_CACHE_URL + os.path.basename(cached_filename)
+        return JsonResponse(result)
+
+
 class MoreLikeThisView(SearchView):
 
     def __init__(self):
@@ -519,23 +612,52 @@ class MoreLikeThisView(SearchView):
     def get(self, request: HttpRequest, lang='en', search_type='', record_id=''):
         lang = request.LANGUAGE_CODE
         if search_type in self.searches:
-            context = self.default_context(request, search_type, lang)
-            context["search_item_snippet"] = self.searches[search_type].search_item_snippet
-            context["referer"] = request.META["HTTP_REFERER"] if "HTTP_REFERER" in request.META and (request.META["HTTP_REFERER"].startswith("http://" + request.META["HTTP_HOST"]) or request.META[
-                    "HTTP_REFERER"].startswith("https://" + request.META["HTTP_HOST"])) else ""
-            solr = SolrClient(settings.SOLR_SERVER_URL)
-
+            context, solr_query = self.prepare_mlt(request, search_type, lang, record_id)
             core_name = self.searches[search_type].solr_core_name
+            solr = get_solr_client()
+
+            # Query Solr, for the precomputed similar records if there are any
+            neighbours = self.stored_neighbours(search_type, lang, record_id)
+            solr_response = None
+            timer = current_timer()
+            with timer.phase('solr'):
+                if neighbours is not None:
+                    solr_response = neighbour_response(record_id, neighbours, solr.query(
+                        core_name, neighbour_query(record_id, neighbours, solr_query['fl'])))
+                if solr_response is None:
+                    solr_response = solr.query(core_name, solr_query)
+            timer.add_qtime(solr_response)
+
+            return self.mlt_response(request, search_type, lang, record_id, context, solr_query, solr_response)
 
-            # Get the search result boundaries
-            start_row, page = calc_starting_row(request.GET.get('page', 1), rows_per_page=self.searches[search_type].mlt_items)
-            # Compose the Solr query
-            solr_query = create_solr_mlt_query(request, self.searches[search_type], self.fields[search_type], start_row, record_id)
+        else:
+            return render(request, '404.html', get_error_context(search_type, lang))
 
-            # Call  plugin pre-solr-query if defined
-            search_type_plugin = 'search.plugins.{0}'.format(search_type)
-            if search_type_plugin in self.discovered_plugins:
-                context, solr_query = self.discovered_plugins[search_type_plugin].pre_mlt_solr_query(
+    def prepare_mlt(self, request: HttpRequest, search_type: str, lang: str, record_id: str):
+        """
+        Build the context and the Solr query of a similar records page, up to the pre-MLT plugin hook.
+        :return: the context and the Solr query
+        """
+        timer = current_timer()
+        context = self.default_context(request, search_type, lang)
+        context["search_item_snippet"] = self.searches[search_type].search_item_snippet
+        context["referer"] = request.META["HTTP_REFERER"] if "HTTP_REFERER" in request.META and (request.META["HTTP_REFERER"].startswith("http://" + request.META["HTTP_HOST"]) or request.META[
+                "HTTP_REFERER"].startswith("https://" + request.META["HTTP_HOST"])) else ""
+        back_url = unsign_back_url(request.GET.get(BACK_PARAM, ''))
+        context['back_to_url'] = record_url(context['parent_path'], record_id, back_query(back_url))
+
+        # Get the search result boundaries
+        start_row, page = calc_starting_row(request.GET.get('page', 1), rows_per_page=self.searches[search_type].mlt_items)
+        # Compose the Solr query
+        with timer.phase('query'):
+            solr_query = create_solr_mlt_query(request, self.searches[search_type], self.fields[search_type], start_row, record_id,
+                                               plan=self.query_plans_fr[search_type] if lang == 'fr' else self.query_plans_en[search_type])
+
+        # Call  plugin pre-solr-query if defined
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.pre_mlt_solr_query:
+            with timer.phase('plugin'):
+                context, solr_query = plugin_hooks.pre_mlt_solr_query(
                     context,
                     solr_query,
                     request,
@@ -543,11 +665,27 @@ class MoreLikeThisView(SearchView):
                     self.codes_fr if lang == 'fr' else self.codes_en,
                     record_id)
 
-            # Query Solr
-            solr_response = solr.query(core_name, solr_query)
-
-            if search_type_plugin in self.discovered_plugins:
-                context, solr_query = self.discovered_plugins[search_type_plugin].post_mlt_solr_query(
+        return context, solr_query
+
+    def stored_neighbours(self, search_type: str, lang: str, record_id: str):
+        """
+        The IDs of the precomputed similar records of a record, or None to use the live More Like This query. Searches
+        with a plugin that changes the More Like This query always use the live query.
+        """
+        if get_plugin_hooks(search_type).pre_mlt_solr_query:
+            return None
+        return get_neighbour_store(search_type).lookup(record_id, lang)
+
+    def mlt_response(self, request: HttpRequest, search_type: str, lang: str, record_id: str, context: dict,
+                     solr_query: dict, solr_response: SolrResponse):
+        """
+        Render a similar records page from the Solr results, starting with the post-MLT plugin hook.
+        """
+        timer = current_timer()
+        plugin_hooks = get_plugin_hooks(search_type)
+        if plugin_hooks.post_mlt_solr_query:
+            with timer.phase('plugin'):
+                context, solr_query = plugin_hooks.post_mlt_solr_query(
                     context,
                     solr_response,
                     solr_query,
@@ -556,16 +694,15 @@ class MoreLikeThisView(SearchView):
                     self.codes_fr if lang == 'fr' else self.codes_en,
                     record_id)
 
-            context['docs'] = solr_response.data['moreLikeThis'][record_id]['docs']
-            context['original_doc'] = solr_response.docs[0]
-            if 'prev_record' in request.session:
-                context['back_to_url'] =  request.session['prev_record']
+        with timer.phase('parse'):
+            display_plan = self.display_plans_fr[search_type] if lang == 'fr' else self.display_plans_en[search_type]
+            context['docs'] = decorate_docs(solr_response.data['moreLikeThis'][record_id]['docs'], display_plan,
+                                            context['parent_path'])
+            context['original_doc'] = decorate_docs(solr_response.docs[:1], display_plan, context['parent_path'])[0]
 
+        with timer.phase('render'):
             return render(request, "more_like_this.html", context)
 
-        else:
-            return render(request, '404.html', get_error_context(search_type, lang))
-
 
 class HomeView(SearchView):
 
@@ -602,3 +739,15 @@ class DefaultView(View):
             return redirect('/search/{0}/'.format(request.LANGUAGE_CODE) )
         else:
             return redirect('/search/')
+
+
+class MetricsView(View):
+    """
+    The request timing histograms of this worker process in the Prometheus text format
+    """
+
+    def get(self, request: HttpRequest):
+        if not settings.SERVER_TIMING_ENABLED or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+            raise Http404()
+        return HttpResponse(get_histograms().render() + render_hook_stats(),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')